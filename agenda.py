@@ -0,0 +1,98 @@
+import heapq
+from collections import deque
+
+
+class Agenda(object):
+    """Work queue of Facts and Rules waiting to be added to a KnowledgeBase.
+        kb_assert pushes onto the agenda and the KB drains it in a loop, so
+        forward chaining no longer recurses through kb_assert and assert depth
+        is not bounded by Python's recursion limit.
+
+    Attributes:
+        order (str): 'fifo' (breadth first), 'lifo' (depth first) or 'priority'
+            (lowest priority(item) first, FIFO among equal priorities)
+        priority (function): maps a Fact or Rule to a sortable priority, only
+            used when order is 'priority'
+        batch_size (int|None): None processes one item at a time. Otherwise the
+            agenda runs in bounded-memory mode: items are handed out in batches
+            of up to batch_size, and a derived item equal to one already pending
+            is folded into it (its supported_by pairs are merged) instead of
+            being queued again, so pending memory is bounded by the number of
+            distinct pending conclusions rather than by the number of derivations
+    """
+    def __init__(self, order="fifo", priority=None, batch_size=None):
+        """Constructor for Agenda
+
+        Args:
+            order (str): 'fifo', 'lifo' or 'priority'
+            priority (function): priority function, required for 'priority'
+            batch_size (int|None): batch size for bounded-memory mode
+        """
+        super(Agenda, self).__init__()
+        if order not in ("fifo", "lifo", "priority"):
+            raise ValueError("Unknown agenda order: {!r}".format(order))
+        if order == "priority" and priority is None:
+            raise ValueError("A priority agenda needs a priority function")
+        if batch_size is not None and batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        self.order = order
+        self.priority = priority
+        self.batch_size = batch_size
+        self.queue = [] if order == "priority" else deque()
+        self.pending = {}
+        self.pushed = 0
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Agenda({!r}, {} pending)'.format(self.order, len(self.queue))
+
+    def __len__(self):
+        """Number of queued items
+        """
+        return len(self.queue)
+
+    def push(self, fact_rule):
+        """Queue a fact or rule to be added to the KB
+
+        Args:
+            fact_rule (Fact|Rule): fact or rule to queue
+        """
+        if self.batch_size is not None and fact_rule.supported_by:
+            queued = self.pending.get(fact_rule)
+            if queued is not None:
+                for pair in fact_rule.supported_by:
+                    queued.supported_by.append(pair)
+                return
+            self.pending[fact_rule] = fact_rule
+        self.pushed += 1
+        if self.order == "priority":
+            heapq.heappush(self.queue, (self.priority(fact_rule), self.pushed, fact_rule))
+        else:
+            self.queue.append(fact_rule)
+
+    def pop(self):
+        """Remove and return the next fact or rule to add to the KB
+        """
+        if self.order == "priority":
+            fact_rule = heapq.heappop(self.queue)[2]
+        elif self.order == "lifo":
+            fact_rule = self.queue.pop()
+        else:
+            fact_rule = self.queue.popleft()
+        if self.pending and self.pending.get(fact_rule) is fact_rule:
+            del self.pending[fact_rule]
+        return fact_rule
+
+    def pop_batch(self):
+        """Remove and return the next batch of facts and rules to add: a single
+            item, or up to batch_size items in bounded-memory mode
+        """
+        count = min(self.batch_size or 1, len(self.queue))
+        return [self.pop() for _ in range(count)]
+
+    def clear(self):
+        """Drop every queued item
+        """
+        self.queue.clear()
+        self.pending.clear()
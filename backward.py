@@ -0,0 +1,171 @@
+from util import *
+from logical_classes import *
+
+
+class Table(object):
+    """Memo table of one goal: every answer found so far for the goal and for
+        any goal that is a variant of it (equal up to variable renaming)
+
+    Attributes:
+        goal (Statement): the goal, usually with variables
+        answers (dictof Fact): maps answer statements to a Fact for them,
+            either the KB fact itself or a Fact (not stored in the KB) whose
+            supported_by holds the rule applications that prove it
+        dependents (dictof None): tables whose rules use this goal, which need
+            evaluating again when it gets new answers
+    """
+    def __init__(self, goal):
+        """Constructor for Table
+
+        Args:
+            goal (Statement): goal the table memoizes
+        """
+        super(Table, self).__init__()
+        self.goal = goal
+        self.answers = {}
+        self.dependents = {}
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Table({!r}, {} answers)'.format(self.goal, len(self.answers))
+
+
+class BackwardChainer(object):
+    """Goal-directed prover behind kb_ask(fact, mode="backward"). A goal is
+        proved from the KB facts matching it and from the rules concluding it,
+        whose LHS statements become subgoals. Every goal gets a Table
+        (tabling), so a subgoal that is a variant of one already being proved
+        reuses its answers instead of recursing, which makes recursive rules
+        such as (isa ?x ?y) (isa ?y ?z) -> (isa ?x ?z) terminate. Tables are
+        evaluated again whenever a table they use gets new answers, until
+        nothing changes.
+
+        Rules are applied by currying, as in InferenceEngine.fc_infer, so a
+        proved answer is justified like a forward-chained fact: its
+        supported_by holds [fact, rule] pairs where rule is the (curried) rule
+        the fact completes.
+
+        Goals whose predicate is eager (see KnowledgeBase.set_evaluation) are
+        already materialized by forward chaining, so for those only the rules
+        with a lazy predicate in their LHS are used.
+
+    Attributes:
+        kb (KnowledgeBase): the KB to prove goals from
+        tables (dictof Table): maps variant keys (see util.variant_key) to tables
+        dirty (dictof None): tables waiting to be evaluated (again), in order
+        rules_by_head (dictof list): maps (predicate, arity) to the rules with
+            that RHS to use for goals of that signature
+    """
+    def __init__(self, kb):
+        """Constructor for BackwardChainer
+
+        Args:
+            kb (KnowledgeBase): the KB to prove goals from
+        """
+        super(BackwardChainer, self).__init__()
+        self.kb = kb
+        self.tables = {}
+        self.dirty = {}
+        self.rules_by_head = {}
+        for rule in kb.rules:
+            if (rule.rhs.predicate in kb.lazy or
+                    any(s.predicate in kb.lazy for s in rule.lhs)):
+                signature = (rule.rhs.predicate, len(rule.rhs.terms))
+                self.rules_by_head.setdefault(signature, []).append(rule)
+
+    def solve(self, goal):
+        """Prove a goal
+
+        Args:
+            goal (Statement): the goal, usually with variables
+
+        Returns:
+            listof Fact: a Fact for every provable instance of the goal
+        """
+        table = self._table(goal)
+        while self.dirty:
+            dirty = list(self.dirty)
+            self.dirty.clear()
+            for pending in dirty:
+                self._evaluate(pending)
+        return list(table.answers.values())
+
+    def _table(self, goal):
+        """Get the table of a goal, creating it (with the matching KB facts as
+            its first answers) and scheduling it for evaluation if it is new
+        """
+        key = variant_key(goal)
+        table = self.tables.get(key)
+        if table is None:
+            table = self.tables[key] = Table(goal)
+            matcher = compile_pattern(goal)
+            slots = [None] * len(matcher.names)
+            for fact in self.kb.facts.candidates(goal):
+                if matcher.match(fact.statement, slots):
+                    table.answers[fact.statement] = fact
+            self.dirty[table] = None
+        return table
+
+    def _evaluate(self, table):
+        """Apply every rule concluding the table's goal against the current
+            answers of its subgoals, adding the new answers to the table
+        """
+        goal = table.goal
+        matcher = compile_pattern(goal)
+        slots = [None] * len(matcher.names)
+        new = False
+        for rule in self.rules_by_head.get((goal.predicate, len(goal.terms)), ()):
+            head = self._head_bindings(rule.rhs, goal)
+            if head is None:
+                continue
+            stack = [rule]
+            while stack:
+                curried = stack.pop()
+                subgoal = self._table(substitute(curried.lhs[0], head))
+                subgoal.dependents[table] = None
+                premise = compile_pattern(curried.lhs[0])
+                premise_slots = [None] * len(premise.names)
+                for fact in list(subgoal.answers.values()):
+                    if not premise.match(fact.statement, premise_slots):
+                        continue
+                    support = [[fact, curried]]
+                    if len(curried.lhs) > 1:
+                        rest = [premise.substitute(s, premise_slots) for s in curried.lhs[1:]]
+                        stack.append(Rule([rest, premise.substitute(curried.rhs, premise_slots)],
+                                          support))
+                        continue
+                    answer = premise.substitute(curried.rhs, premise_slots)
+                    if not matcher.match(answer, slots):
+                        continue
+                    known = table.answers.get(answer)
+                    if known is None:
+                        table.answers[answer] = Fact(answer, support)
+                        new = True
+                    elif known.supported_by and known not in self.kb.facts:
+                        known.supported_by.append(support[0])
+        if new:
+            self.dirty.update(table.dependents)
+
+    def _head_bindings(self, rhs, goal):
+        """Bind the variables of a rule's RHS to the constants of a goal
+
+        Args:
+            rhs (Statement): RHS of a rule with the goal's predicate and arity
+            goal (Statement): the goal
+
+        Returns:
+            dictof str|None: maps RHS variable names to goal constants, None if
+                the RHS cannot conclude the goal
+        """
+        bindings = {}
+        for r, g in zip(rhs.terms, goal.terms):
+            if is_var(g):
+                continue
+            if is_var(r):
+                bound = bindings.setdefault(r.term.element, g)
+                if bound != g:
+                    return None
+            elif r != g:
+                return None
+        return bindings
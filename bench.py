@@ -0,0 +1,562 @@
+"""Benchmarks for the knowledge base. Run e.g. `python bench.py retract`, or
+`python bench.py suite --json before.json` on one commit and
+`python bench.py suite --compare before.json` on another."""
+import argparse
+import asyncio
+import os
+import copy
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from logical_classes import Fact, Statement
+from student_code import KnowledgeBase
+from cache import AskCache
+from parallel import ParallelEngine
+from columnar import ColumnarEngine
+from mvcc import SharedKB
+from server import KBServer
+from loadgen import run_load
+from workloads import WORKLOADS, genealogy_items, taxonomy, write_burst
+from util import match, compile_pattern
+import read
+
+
+def chain_kb(chains, length):
+    """Build a KB of independent reachability chains: chain c has a
+        (start cN_0) fact and (edge cN_i cN_i+1) facts, and the rules derive
+        (reach ?x) along every chain.
+
+    Args:
+        chains (int): number of chains
+        length (int): number of edges per chain
+
+    Returns:
+        KnowledgeBase
+    """
+    kb = KnowledgeBase([], [])
+    items = [read.parse_input("rule: ((start ?x)) -> (reach ?x)"),
+             read.parse_input("rule: ((reach ?x) (edge ?x ?y)) -> (reach ?y)")]
+    for c in range(chains):
+        items.append(Fact(['start', 'c%d_0' % c]))
+        for i in range(length):
+            items.append(Fact(['edge', 'c%d_%d' % (c, i), 'c%d_%d' % (c, i + 1)]))
+    kb.kb_assert_many(items)
+    return kb
+
+
+def bench_retract(sizes=((10, 50), (100, 50), (1000, 50), (100, 10), (100, 100), (100, 400))):
+    """Time retracting the start fact of one chain, which removes that chain's
+        reach facts and curried rules. The time should follow the chain length
+        (the affected subgraph) and not the number of chains (the KB size).
+
+    Args:
+        sizes (listof tuple): (chains, length) KB shapes to measure
+
+    Returns:
+        listof dict: one result per shape
+    """
+    results = []
+    for chains, length in sizes:
+        kb = chain_kb(chains, length)
+        before = len(kb.facts) + len(kb.rules)
+        start = time.perf_counter()
+        kb.kb_retract(Fact(['start', 'c0_0']))
+        elapsed = time.perf_counter() - start
+        removed = before - len(kb.facts) - len(kb.rules)
+        results.append({'chains': chains, 'length': length, 'kb_size': before,
+                        'removed': removed, 'seconds': elapsed,
+                        'us_per_removed': 1e6 * elapsed / max(removed, 1)})
+    return results
+
+
+def bench_match(count=100000, arity=3):
+    """Matches per second of util.match against the compiled matcher
+        (util.compile_pattern) for one pattern and a list of ground statements,
+        half of which match.
+
+    Args:
+        count (int): number of statements to match against
+        arity (int): number of terms per statement
+
+    Returns:
+        listof dict: one result per matcher
+    """
+    pattern = Statement(['rel', 'c0'] + ['?v%d' % i for i in range(1, arity)])
+    statements = [Statement(['rel', 'c%d' % (i % 2)] + ['x%d' % (i + j) for j in range(1, arity)])
+                  for i in range(count)]
+    results = []
+
+    start = time.perf_counter()
+    hits = sum(1 for statement in statements if match(pattern, statement))
+    elapsed = time.perf_counter() - start
+    results.append({'matcher': 'util.match', 'matches': hits, 'matches_per_second': count / elapsed})
+
+    matcher = compile_pattern(pattern)
+    slots = [None] * len(matcher.names)
+    start = time.perf_counter()
+    hits = sum(1 for statement in statements if matcher.match(statement, slots))
+    elapsed = time.perf_counter() - start
+    results.append({'matcher': 'compiled', 'matches': hits, 'matches_per_second': count / elapsed})
+    return results
+
+
+def bench_snapshot(sizes=((100, 50), (200, 100))):
+    """Time bringing up a saturated chain KB by loading a snapshot, against
+        asserting and saturating it from scratch
+
+    Args:
+        sizes (listof tuple): (chains, length) KB shapes to measure
+
+    Returns:
+        listof dict: one result per shape
+    """
+    results = []
+    for chains, length in sizes:
+        start = time.perf_counter()
+        kb = chain_kb(chains, length)
+        saturate = time.perf_counter() - start
+        fd, path = tempfile.mkstemp(suffix='.kbs')
+        os.close(fd)
+        try:
+            kb.save_snapshot(path)
+            start = time.perf_counter()
+            KnowledgeBase.load_snapshot(path)
+            load = time.perf_counter() - start
+            size = os.path.getsize(path)
+        finally:
+            os.remove(path)
+        results.append({'chains': chains, 'length': length,
+                        'kb_size': len(kb.facts) + len(kb.rules), 'bytes': size,
+                        'saturate_seconds': saturate, 'load_seconds': load})
+    return results
+
+
+def bench_parallel(people=20000, workers=(1, 2, 4, 8)):
+    """Time saturating a genealogy KB (see genealogy_items) with
+        ParallelEngine for several worker counts, checking that every run
+        builds the same facts as the sequential one
+
+    Args:
+        people (int): size of the family tree
+        workers (tupleof int): worker counts to measure, 1 is sequential
+
+    Returns:
+        listof dict: one result per worker count
+    """
+    results = []
+    expected = None
+    for count in workers:
+        engine = ParallelEngine(workers=count, min_pairs=0)
+        kb = KnowledgeBase([], [], engine=engine)
+        items = genealogy_items(people)
+        start = time.perf_counter()
+        kb.kb_assert_many(items)
+        elapsed = time.perf_counter() - start
+        engine.close()
+        facts = [str(fact.statement) for fact in kb.facts]
+        if expected is None:
+            expected = facts
+        results.append({'workers': count, 'kb_size': len(kb.facts) + len(kb.rules),
+                        'identical': facts == expected, 'seconds': elapsed,
+                        'speedup': results[0]['seconds'] / elapsed if results else 1.0})
+    return results
+
+
+def bench_columnar(people=20000, depth=7):
+    """Time saturating a genealogy KB (see genealogy_items) and a taxonomy
+        (see workloads.taxonomy) with InferenceEngine and ColumnarEngine,
+        checking that both build the same facts
+
+    Args:
+        people (int): size of the family tree
+        depth (int): depth of the taxonomy
+
+    Returns:
+        listof dict: one result per KB and engine
+    """
+    results = []
+    for name, items in (('genealogy', genealogy_items(people)), ('taxonomy', taxonomy(depth).items)):
+        expected = None
+        for engine in (None, ColumnarEngine(min_facts=0)):
+            kb = KnowledgeBase([], [], engine=engine)
+            copies = copy.deepcopy(items)
+            start = time.perf_counter()
+            kb.kb_assert_many(copies)
+            elapsed = time.perf_counter() - start
+            facts = sorted(str(fact.statement) for fact in kb.facts)
+            if expected is None:
+                expected, sequential = facts, elapsed
+            results.append({'kb': name, 'engine': type(kb.ie).__name__,
+                            'kb_size': len(kb.facts) + len(kb.rules), 'identical': facts == expected,
+                            'seconds': elapsed, 'speedup': sequential / elapsed})
+    return results
+
+
+def bench_magic(people=20000, asks=20, seed=1):
+    """Point queries on a genealogy KB (see genealogy_items) whose
+        grandparentof and ggp facts are lazy, answered in magic and backward
+        mode, against saturating the KB eagerly
+
+    Args:
+        people (int): size of the family tree
+        asks (int): number of asks, half with the first argument bound and
+            half with the second
+        seed (int): random seed
+
+    Returns:
+        listof dict: one result per mode
+    """
+    rng = random.Random(seed)
+    patterns = [Fact(['ggp', 'p%d' % rng.randrange(people), '?y']) if i % 2 else
+                Fact(['ggp', '?x', 'p%d' % rng.randrange(people)]) for i in range(asks)]
+    kb = KnowledgeBase([], [])
+    start = time.perf_counter()
+    kb.kb_assert_many(genealogy_items(people))
+    results = [{'mode': 'eager', 'kb_size': len(kb.facts) + len(kb.rules),
+                'seconds': time.perf_counter() - start}]
+    expected = [sorted(str(b) for b, _ in kb.kb_iter_ask(pattern)) for pattern in patterns]
+    kb = KnowledgeBase([], [])
+    kb.set_evaluation('grandparentof', 'lazy')
+    kb.set_evaluation('ggp', 'lazy')
+    start = time.perf_counter()
+    kb.kb_assert_many(genealogy_items(people))
+    results.append({'mode': 'lazy', 'kb_size': len(kb.facts) + len(kb.rules),
+                    'seconds': time.perf_counter() - start})
+    for mode in ('magic', 'backward'):
+        start = time.perf_counter()
+        answers = [kb.kb_ask(pattern, mode) for pattern in patterns]
+        elapsed = time.perf_counter() - start
+        found = [sorted(str(answer[i]) for i in range(len(answer))) if answer else [] for answer in answers]
+        results.append({'mode': mode, 'asks': asks, 'identical': found == expected,
+                        'seconds': elapsed, 'ask_ms': 1000 * elapsed / asks})
+    return results
+
+
+class LockedKB(object):
+    """Baseline for bench_concurrency: a KnowledgeBase behind one global lock"""
+
+    def __init__(self, kb):
+        self.kb = kb
+        self.lock = threading.Lock()
+
+    def kb_ask(self, fact):
+        with self.lock:
+            return self.kb.kb_ask(fact)
+
+    def kb_assert(self, fact):
+        with self.lock:
+            self.kb.kb_assert(fact)
+
+    def kb_retract(self, fact):
+        with self.lock:
+            self.kb.kb_retract(fact)
+
+
+def bench_concurrency(people=2000, readers=(1, 2, 4), seconds=1.0):
+    """Mixed read/write throughput: reader threads ask for the grandchildren
+        of random people while one writer thread keeps retracting and
+        re-asserting random motherof facts of a genealogy KB (see
+        genealogy_items), for a SharedKB and for a KB behind one global lock.
+        The ask cache is off in both, since SharedKB readers do not use it.
+
+    Args:
+        people (int): size of the family tree
+        readers (tupleof int): reader thread counts to measure
+        seconds (float): how long each run lasts
+
+    Returns:
+        listof dict: one result per KB kind and reader count
+    """
+    results = []
+    for kind in ('locked', 'mvcc'):
+        for count in readers:
+            kb = KnowledgeBase([], [])
+            kb.kb_assert_many(genealogy_items(people))
+            kb.cache = AskCache(0)
+            base = [fact for fact in kb.facts if fact.asserted]
+            shared = SharedKB(kb) if kind == 'mvcc' else LockedKB(kb)
+            stop = threading.Event()
+            reads = [0] * count
+            writes = [0]
+
+            def read_loop(i):
+                rng = random.Random(i)
+                while not stop.is_set():
+                    shared.kb_ask(Fact(['grandparentof', 'p%d' % rng.randrange(people), '?y']))
+                    reads[i] += 1
+
+            def write_loop():
+                rng = random.Random(-1)
+                while not stop.is_set():
+                    fact = rng.choice(base)
+                    shared.kb_retract(fact)
+                    shared.kb_assert(Fact(fact.statement))
+                    writes[0] += 2
+
+            threads = [threading.Thread(target=read_loop, args=(i,)) for i in range(count)]
+            threads.append(threading.Thread(target=write_loop))
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            results.append({'kb': kind, 'readers': count,
+                            'reads_per_second': sum(reads) / seconds,
+                            'writes_per_second': writes[0] / seconds})
+    return results
+
+
+def bench_server(clients=(1, 16, 64), requests=200, writes=0.2):
+    """Request rate and latency percentiles of server.KBServer under the
+        loadgen.py workload, with the server and the clients in this process
+
+    Args:
+        clients (tupleof int): numbers of concurrent clients to measure
+        requests (int): requests per client
+        writes (float): fraction of requests that are asserts
+
+    Returns:
+        listof dict: one result per client count, see loadgen.run_load
+    """
+    async def run(count):
+        server = KBServer()
+        await server.start()
+        try:
+            host, port = server.address()
+            result = await run_load(host, port, clients=count, requests=requests, writes=writes)
+        finally:
+            await server.close()
+        result['batches'] = server.batches
+        return result
+    return [asyncio.run(run(count)) for count in clients]
+
+
+def bench_server_writes(people=20000, writes=5000, connections=200,
+                        settings=((None, False), (0.0005, True))):
+    """Latency of asks to an in-process server.KBServer while a burst of
+        writes (see workloads.write_burst), sent over many connections so
+        that they are applied in large batches, saturates on the writer
+        thread; the asks share the GIL with that thread
+
+    Args:
+        people (int): size of the family tree
+        writes (int): facts asserted during the burst
+        connections (int): writer connections
+        settings (tupleof tuple): (switch_interval, freeze_gc) KBServer
+            settings to compare; (None, False) leaves the interpreter alone,
+            (0.0005, True) is what serve() uses
+
+    Returns:
+        listof dict: per setting, ask latency percentiles in ms while idle
+            and during the burst, and how long the burst took
+    """
+    async def asker(host, port, patterns, done, latencies):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            i = 0
+            while not done.is_set():
+                line = 'ask fact: {}\n'.format(patterns[i % len(patterns)].statement)
+                start = time.perf_counter()
+                writer.write(line.encode('utf-8'))
+                await writer.drain()
+                await reader.readline()
+                latencies.append(time.perf_counter() - start)
+                i += 1
+        finally:
+            writer.close()
+
+    async def burst(host, port, facts):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for fact in facts:
+                writer.write('assert fact: {}\n'.format(fact.statement).encode('utf-8'))
+                await writer.drain()
+                await reader.readline()
+        finally:
+            writer.close()
+
+    async def run(workload, switch_interval, freeze_gc):
+        shared = SharedKB()
+        shared.kb_assert_many(copy.deepcopy(workload.items))
+        server = KBServer(shared, switch_interval=switch_interval, freeze_gc=freeze_gc)
+        await server.start()
+        try:
+            host, port = server.address()
+            idle, busy = [], []
+            done = asyncio.Event()
+            asyncio.get_running_loop().call_later(0.5, done.set)
+            await asker(host, port, workload.asks, done, idle)
+            done.clear()
+            start = time.perf_counter()
+            writers = asyncio.gather(*[burst(host, port, workload.writes[i::connections])
+                                       for i in range(connections)])
+            writers.add_done_callback(lambda _: done.set())
+            await asyncio.gather(asker(host, port, workload.asks, done, busy), writers)
+            elapsed = time.perf_counter() - start
+        finally:
+            await server.close()
+        result = {'switch_interval_ms': 1000 * switch_interval if switch_interval else 5.0,
+                  'freeze_gc': freeze_gc, 'burst_seconds': elapsed, 'batches': server.batches, 'asks_during_burst': len(busy)}
+        result.update(percentiles(idle, 'idle_ask_ms', 1e3))
+        result.update(percentiles(busy, 'busy_ask_ms', 1e3))
+        result['busy_ask_ms_max'] = 1e3 * max(busy) if busy else 0.0
+        return result
+
+    workload = write_burst(people, writes)
+    return [asyncio.run(run(workload, interval, freeze)) for interval, freeze in settings]
+
+
+def percentiles(values, prefix, scale=1e6):
+    """p50, p95 and p99 of a list of timings, as {prefix_p50: ...} scaled
+        (by default from seconds to microseconds)
+    """
+    values = sorted(values)
+    result = {}
+    for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        value = values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+        result['{}_{}'.format(prefix, name)] = scale * value
+    return result
+
+
+def bench_suite(names=('dragons', 'genealogy', 'taxonomy')):
+    """The regression suite: for each synthetic workload (see workloads.py)
+        measure assert throughput (one kb_assert per item), bulk saturation
+        time (kb_assert_many), peak memory while saturating (tracemalloc),
+        ask latency percentiles with the ask cache off, and the cost of
+        retracting some asserted facts
+
+    Args:
+        names (tupleof str): workloads to run
+
+    Returns:
+        listof dict: one result per workload
+    """
+    results = []
+    for name in names:
+        workload = WORKLOADS[name]()
+        result = {'workload': name, 'items': len(workload.items)}
+
+        kb = KnowledgeBase([], [])
+        items = copy.deepcopy(workload.items)
+        start = time.perf_counter()
+        for item in items:
+            kb.kb_assert(item)
+        elapsed = time.perf_counter() - start
+        result['assert_items_per_second'] = len(items) / elapsed
+
+        tracemalloc.start()
+        try:
+            kb = KnowledgeBase([], [])
+            kb.kb_assert_many(copy.deepcopy(workload.items))
+            result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2.0 ** 20
+        finally:
+            tracemalloc.stop()
+
+        kb = KnowledgeBase([], [], cache=AskCache(0))
+        items = copy.deepcopy(workload.items)
+        start = time.perf_counter()
+        kb.kb_assert_many(items)
+        result['saturate_seconds'] = time.perf_counter() - start
+        result['facts'] = len(kb.facts)
+        result['rules'] = len(kb.rules)
+
+        timings = []
+        for ask in workload.asks:
+            start = time.perf_counter()
+            kb.kb_ask(ask)
+            timings.append(time.perf_counter() - start)
+        result.update(percentiles(timings, 'ask_us'))
+
+        before = len(kb.facts) + len(kb.rules)
+        timings = []
+        for fact in workload.retracts:
+            start = time.perf_counter()
+            kb.kb_retract(fact)
+            timings.append(time.perf_counter() - start)
+        result['retracts'] = len(timings)
+        result['retract_removed'] = before - len(kb.facts) - len(kb.rules)
+        result['retract_ms_mean'] = 1000 * sum(timings) / max(len(timings), 1)
+        result.update(percentiles(timings, 'retract_ms', 1000))
+        results.append(result)
+    return results
+
+
+def metadata():
+    """Where the results come from: commit, python and machine
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)),
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(),
+            'machine': platform.platform(), 'cpus': os.cpu_count(), 'time': time.time()}
+
+
+def compare(old, new):
+    """Print the numbers of two runs side by side with their ratio. Results
+        are paired by benchmark and position.
+
+    Args:
+        old (dict): results loaded from an earlier --json file
+        new (dict): results of this run, in the same format
+    """
+    print('comparing with {}'.format(old['meta'].get('commit')))
+    for name, results in new['results'].items():
+        for before, after in zip(old['results'].get(name, ()), results):
+            labels = ['{}={}'.format(k, v) for k, v in after.items() if not isinstance(v, float)]
+            print('{} {}'.format(name, ' '.join(labels)))
+            for key, value in after.items():
+                if isinstance(value, float) and isinstance(before.get(key), (int, float)):
+                    ratio = value / before[key] if before[key] else float('nan')
+                    print('  {:<26} {:>12.6g} -> {:<12.6g} x{:.3f}'.format(key, before[key], value, ratio))
+
+
+BENCHMARKS = {
+    'columnar': bench_columnar,
+    'concurrency': bench_concurrency,
+    'magic': bench_magic,
+    'match': bench_match,
+    'parallel': bench_parallel,
+    'retract': bench_retract,
+    'server': bench_server,
+    'server_writes': bench_server_writes,
+    'snapshot': bench_snapshot,
+    'suite': bench_suite,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('benchmarks', nargs='*', default=sorted(BENCHMARKS),
+                        choices=sorted(BENCHMARKS))
+    parser.add_argument('--json', metavar='FILE', help='also write the results to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results with an earlier --json FILE')
+    args = parser.parse_args()
+    run = {'meta': metadata(), 'results': {}}
+    for name in args.benchmarks:
+        print(name)
+        run['results'][name] = BENCHMARKS[name]()
+        for result in run['results'][name]:
+            print('  ' + '  '.join('{}={:.6g}'.format(k, v) if isinstance(v, float)
+                                   else '{}={}'.format(k, v)
+                                   for k, v in result.items()))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(run, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+
+
+class AskCache(object):
+    """LRU cache of kb_ask answers. Entries are keyed by the asked pattern up
+        to the names of its variables (see util.variant_key), so (isa ?x ?y)
+        and (isa ?a ?b) share an entry; answers are kept as the matched fact
+        and the slot values of its match, and turned into Bindings with the
+        asker's variable names on the way out. The KnowledgeBase drops every
+        entry of a predicate when a fact with that predicate is added or
+        removed.
+
+    Attributes:
+        maxsize (int): maximum number of cached patterns, 0 disables caching
+        entries (OrderedDict): maps variant keys to lists of (slots, fact)
+            answers, least recently used first
+        by_predicate (dictof dict): maps predicates to the keys of their entries
+        hits (int): asks answered from the cache
+        misses (int): asks that had to match facts
+    """
+    def __init__(self, maxsize=256):
+        """Constructor for AskCache
+
+        Args:
+            maxsize (int): maximum number of cached patterns
+        """
+        super(AskCache, self).__init__()
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.by_predicate = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'AskCache({} entries, {} hits, {} misses)'.format(
+            len(self.entries), self.hits, self.misses)
+
+    def __len__(self):
+        """Number of cached patterns
+        """
+        return len(self.entries)
+
+    def get(self, key):
+        """Get the cached answers of a pattern, counting a hit or a miss
+
+        Args:
+            key (tupleof int): variant key of the pattern
+
+        Returns:
+            listof tuple|None: (slots, fact) answers, None if not cached
+        """
+        answers = self.entries.get(key)
+        if answers is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return answers
+
+    def put(self, key, answers):
+        """Cache the answers of a pattern, evicting the least recently used
+            pattern if the cache is full
+
+        Args:
+            key (tupleof int): variant key of the pattern
+            answers (listof tuple): (slots, fact) answers
+        """
+        if not self.maxsize:
+            return
+        self.entries[key] = answers
+        self.entries.move_to_end(key)
+        self.by_predicate.setdefault(key[0], {})[key] = None
+        while len(self.entries) > self.maxsize:
+            self._forget(next(iter(self.entries)))
+
+    def invalidate(self, predicate):
+        """Drop the cached answers of every pattern with a predicate
+
+        Args:
+            predicate (int): interned id of the predicate (Statement.key[0])
+        """
+        keys = self.by_predicate.pop(predicate, None)
+        if keys:
+            for key in keys:
+                del self.entries[key]
+
+    def clear(self):
+        """Drop every cached answer (the counters are kept)
+        """
+        self.entries.clear()
+        self.by_predicate.clear()
+
+    def _forget(self, key):
+        """Drop one entry
+        """
+        del self.entries[key]
+        keys = self.by_predicate[key[0]]
+        del keys[key]
+        if not keys:
+            del self.by_predicate[key[0]]
@@ -0,0 +1,441 @@
+"""Columnar saturation with NumPy, see ColumnarEngine. NumPy is optional:
+the rest of the package does not need it, and ColumnarEngine raises
+ImportError when it is constructed without it.
+"""
+import gc
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from logical_classes import Fact, Rule, Statement, Term, symbol_names
+from student_code import InferenceEngine
+
+
+def shape(statements):
+    """Split statements into a template and the constants filling it: each
+        constant becomes a slot, numbered in order of appearance, while
+        variables stay as they are
+
+    Args:
+        statements (listof Statement): e.g. a rule's LHS followed by its RHS
+
+    Returns:
+        (tuple, listof int): the template, a tuple of (predicate id, terms)
+            where a term is a slot number (>= 0) or a variable id (< 0), and
+            the interned id of the constant in each slot
+    """
+    template, row = [], []
+    for statement in statements:
+        terms = []
+        for term in statement.key[1:]:
+            if term < 0:
+                terms.append(term)
+            else:
+                terms.append(len(row))
+                row.append(term)
+        template.append((statement.key[0], tuple(terms)))
+    return tuple(template), row
+
+
+def encode(rows, base):
+    """One key per row of an integer array, equal keys for equal rows: the
+        row as a number in the given base when that fits in 63 bits, its
+        bytes otherwise
+
+    Args:
+        rows (ndarray): n x width array of ids below base
+        base (int): number of interned symbols
+
+    Returns:
+        ndarray: n keys
+    """
+    width = rows.shape[1]
+    if width == 0:
+        return np.zeros(len(rows), dtype=np.int64)
+    if base ** width < 2 ** 63:
+        keys = rows[:, 0].copy()
+        for column in range(1, width):
+            keys *= base
+            keys += rows[:, column]
+        return keys
+    rows = np.ascontiguousarray(rows)
+    return rows.view(np.dtype((np.void, rows.dtype.itemsize * width))).ravel()
+
+
+def join(left, right):
+    """Sort-merge equijoin of two key arrays
+
+    Args:
+        left (ndarray): keys of the left rows
+        right (ndarray): keys of the right rows
+
+    Returns:
+        (ndarray, ndarray): positions in left and right of every pair of
+            rows with equal keys, grouped by left row
+    """
+    order = np.argsort(right, kind='stable')
+    right = right[order]
+    low = np.searchsorted(right, left, 'left')
+    counts = np.searchsorted(right, left, 'right') - low
+    total = int(counts.sum())
+    lefts = np.repeat(np.arange(len(left)), counts)
+    starts = np.repeat(low - (np.cumsum(counts) - counts), counts)
+    return lefts, order[np.arange(total) + starts]
+
+
+class Relation(object):
+    """Rows of interned ids, either the facts of one predicate and arity or
+        the rules (asserted or curried) of one template, see shape. Rows are
+        only ever appended, and looked up through sorted runs of their keys.
+
+        Semi-naive bookkeeping: rows before `old` have been joined with
+        everything, rows from `old` to `end` are the current round's delta,
+        and rows after `end` were added during the round.
+
+    Attributes:
+        width (int): number of columns
+        count (int): number of rows
+        items (listof Fact|Rule|None): the KB's Fact or Rule of each row,
+            None for rows derived by the current saturation
+        known (int): rows that were in the KB before the saturation
+        old (int): end of the rows already joined with everything
+        end (int): end of the current round's delta
+        runs (listof tuple): (sorted keys, row positions) runs of the index
+    """
+    def __init__(self, width):
+        """Constructor for Relation
+        """
+        super(Relation, self).__init__()
+        self.width = width
+        self.count = 0
+        self.items = []
+        self.known = 0
+        self.old = 0
+        self.end = 0
+        self.runs = []
+        self._rows = np.zeros((16, width), dtype=np.int64)
+
+    def rows(self, start=0, stop=None):
+        """Rows from start to stop (default: all), as a view
+        """
+        return self._rows[start:self.count if stop is None else stop]
+
+    def lookup(self, keys):
+        """Row positions of keys, -1 for keys with no row
+        """
+        found = np.full(len(keys), -1, dtype=np.int64)
+        for run, positions in self.runs:
+            at = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+            hit = (run[at] == keys) & (found < 0)
+            found[hit] = positions[at[hit]]
+        return found
+
+    def append(self, rows, items, base):
+        """Append rows (which must be new and distinct) and index them
+
+        Returns:
+            ndarray: positions of the appended rows
+        """
+        needed = self.count + len(rows)
+        if needed > len(self._rows):
+            grown = np.zeros((max(needed, 2 * len(self._rows)), self.width), dtype=np.int64)
+            grown[:self.count] = self._rows[:self.count]
+            self._rows = grown
+        positions = np.arange(self.count, needed)
+        self._rows[self.count:needed] = rows
+        self.count = needed
+        self.items.extend(items)
+        keys = encode(rows, base)
+        order = np.argsort(keys, kind='stable')
+        self.runs.append((keys[order], positions[order]))
+        appended = positions
+        # merge runs of similar sizes, so there are O(log n) runs to search
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= 2 * len(self.runs[-1][0]):
+            (a, pa), (b, pb) = self.runs.pop(), self.runs.pop()
+            keys, positions = np.concatenate((b, a)), np.concatenate((pb, pa))
+            order = np.argsort(keys, kind='stable')
+            self.runs.append((keys[order], positions[order]))
+        return appended
+
+
+class Step(object):
+    """How the rules of one template fire: their first LHS statement is
+        joined with the facts of its predicate and arity, and each pair gives
+        a row of the output, a curried rule (a row of the next template) or,
+        for the last LHS statement, a fact
+
+    Attributes:
+        template (tuple): the rules' template, LHS statements then RHS
+        premise (tuple): (predicate id, arity) of the first LHS statement
+        rule_keys (listof int): slots of the rules joined on...
+        fact_keys (listof int): ...the fact columns at the same positions
+        equal (listof tuple): (column, column) pairs of the facts that must
+            be equal, for variables repeated in the first LHS statement
+        output (tuple): ('fact', (predicate id, arity)) or ('rule', template)
+        columns (listof tuple): where each output column comes from, ('rule',
+            slot) or ('fact', column)
+    """
+    def __init__(self, template):
+        """Constructor for Step, working out the join and output of a template
+        """
+        super(Step, self).__init__()
+        self.template = template
+        first, rest, rhs = template[0], template[1:-1], template[-1]
+        self.premise = (first[0], len(first[1]))
+        self.rule_keys, self.fact_keys, self.equal = [], [], []
+        bound = {}
+        for column, term in enumerate(first[1]):
+            if term >= 0:
+                self.rule_keys.append(term)
+                self.fact_keys.append(column)
+            elif term in bound:
+                self.equal.append((bound[term], column))
+            else:
+                bound[term] = column
+        # the rest of the template with the variables the join binds turned
+        # into slots, one per occurrence and numbered in order like shape does
+        statements, self.columns = [], []
+        for predicate, terms in rest + (rhs,):
+            shaped = []
+            for term in terms:
+                if term < 0 and term not in bound:
+                    shaped.append(term)
+                    continue
+                shaped.append(len(self.columns))
+                self.columns.append(('rule', term) if term >= 0 else ('fact', bound[term]))
+            statements.append((predicate, tuple(shaped)))
+        if rest:
+            self.output = ('rule', tuple(statements))
+        else:
+            self.output = ('fact', (rhs[0], len(rhs[1])))
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Step({!r} -> {!r})'.format(self.premise, self.output)
+
+
+class ColumnarEngine(InferenceEngine):
+    """InferenceEngine that saturates bulk loads (kb_assert_many) on columnar
+        NumPy tables instead of one (fact, rule) pair at a time. Facts of
+        each predicate and arity are a table of interned ids; rules are
+        grouped by template (their statements with the constants taken out,
+        see shape), so a template's table holds the constants of every rule,
+        asserted or curried, of that form. Each semi-naive round joins the new
+        rows of every rule table with its facts table, and the facts with the
+        new rules, with vectorized sort-merge joins; a pair yields a curried
+        rule (a row of the next template's table) or a fact, exactly as
+        fc_infer would.
+
+        Only when the fixpoint is reached are the new rows turned into Facts
+        and Rules and stored with their supported_by pairs, so the KB ends
+        up with the same facts, rules and justifications as with
+        InferenceEngine. A Stats attached to the KB (see instrument.Stats)
+        is then told about each pair that derived something. Single kb_assert calls, small KBs, KBs with lazy
+        predicates (see KnowledgeBase.set_evaluation) or with facts containing
+        variables, and rules concluding variables their LHS does not bind go
+        through InferenceEngine.
+
+    Attributes:
+        min_facts (int): KBs with fewer facts saturate with InferenceEngine
+    """
+    def __init__(self, min_facts=1000):
+        """Constructor for ColumnarEngine
+
+        Args:
+            min_facts (int): smallest KB to saturate on columnar tables
+        """
+        if np is None:
+            raise ImportError("ColumnarEngine needs numpy")
+        super(ColumnarEngine, self).__init__()
+        self.min_facts = min_facts
+
+    def saturate(self, kb, facts, rules):
+        """Forward chain from facts and rules stored in the KB without
+            inference, on columnar tables, see InferenceEngine.saturate
+        """
+        if not self._columnar(kb, rules):
+            return super(ColumnarEngine, self).saturate(kb, facts, rules)
+        base = len(symbol_names)
+        new = set(facts)
+        new.update(rules)
+        relations, steps = {}, {}
+
+        def relation(key, width):
+            found = relations.get(key)
+            if found is None:
+                found = relations[key] = Relation(width)
+                if key[0] == 'rule':
+                    steps[key] = Step(key[1])
+            return found
+
+        # the KB as it was before the new items, then the new items
+        loaded = {}
+        for rank in (0, 1):
+            for item in kb.facts:
+                if (item in new) == rank:
+                    key = ('fact', (item.statement.key[0], len(item.statement.key) - 1))
+                    loaded.setdefault(key, []).append((item.statement.key[1:], item))
+            for item in kb.rules:
+                if (item in new) == rank:
+                    template, row = shape(item.lhs + [item.rhs])
+                    loaded.setdefault(('rule', template), []).append((row, item))
+            for key, entries in loaded.items():
+                target = relation(key, len(entries[0][0]))
+                rows = np.array([row for row, _ in entries], dtype=np.int64).reshape(len(entries), target.width)
+                target.append(rows, [item for _, item in entries], base)
+                if not rank:
+                    target.old = target.end = target.count
+            loaded.clear()
+        for target in relations.values():
+            target.known = target.count
+
+        # semi-naive rounds: each rule row meets each fact row once
+        supports = []
+        while any(r.count > r.old for r in relations.values()):
+            for target in relations.values():
+                target.end = target.count
+            outputs = {}
+            for key, step in list(steps.items()):
+                rules_table = relations[key]
+                facts_table = relations.get(('fact', step.premise))
+                if facts_table is None:
+                    continue
+                for rule_range, fact_range in (((rules_table.old, rules_table.end), (0, facts_table.end)),
+                                               ((0, rules_table.old), (facts_table.old, facts_table.end))):
+                    if rule_range[0] == rule_range[1] or fact_range[0] == fact_range[1]:
+                        continue
+                    self._fire(step, key, rules_table, rule_range, facts_table, fact_range,
+                               base, outputs)
+            for target in relations.values():
+                target.old = target.end
+            for key, (rows, provenance) in outputs.items():
+                target = relation(key, rows[0].shape[1])
+                rows = np.concatenate(rows)
+                keys = encode(rows, base)
+                found = target.lookup(keys)
+                missing = np.flatnonzero(found < 0)
+                if len(missing):
+                    _, first, inverse = np.unique(keys[missing], return_index=True, return_inverse=True)
+                    order = np.argsort(first, kind='stable')
+                    positions = target.append(rows[missing[first[order]]], [None] * len(first), base)
+                    rank = np.empty(len(order), dtype=np.int64)
+                    rank[order] = np.arange(len(order))
+                    found[missing] = positions[rank[inverse.ravel()]]
+                supports.append((key, found, provenance))
+
+        # nothing built here becomes garbage, so collections triggered by
+        # the burst of new objects would only cost time
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self._materialize(kb, relations, supports)
+        finally:
+            if collecting:
+                gc.enable()
+
+    def _columnar(self, kb, rules):
+        """Whether the KB can be saturated on columnar tables
+        """
+        if len(kb.facts) < self.min_facts or kb.lazy:
+            return False
+        if any(table[2] for table in kb.facts.tables.values()):
+            return False
+        for rule in kb.rules:
+            bound = set(term for statement in rule.lhs for term in statement.key[1:] if term < 0)
+            if any(term < 0 and term not in bound for term in rule.rhs.key[1:]):
+                return False
+        return True
+
+    def _fire(self, step, key, rules_table, rule_range, facts_table, fact_range, base, outputs):
+        """Join a range of a template's rules with a range of their facts,
+            adding the output rows and their (rule row, fact row) provenance,
+            with each pair's share of the time the join took, to outputs
+        """
+        start = time.perf_counter()
+        rule_rows = rules_table.rows(*rule_range)
+        fact_rows = facts_table.rows(*fact_range)
+        fact_positions = np.arange(*fact_range)
+        if step.equal:
+            keep = np.ones(len(fact_rows), dtype=bool)
+            for a, b in step.equal:
+                keep &= fact_rows[:, a] == fact_rows[:, b]
+            fact_rows, fact_positions = fact_rows[keep], fact_positions[keep]
+            if not len(fact_rows):
+                return
+        if step.rule_keys:
+            lefts, rights = join(encode(rule_rows[:, step.rule_keys], base),
+                                 encode(fact_rows[:, step.fact_keys], base))
+        else:
+            lefts = np.repeat(np.arange(len(rule_rows)), len(fact_rows))
+            rights = np.tile(np.arange(len(fact_rows)), len(rule_rows))
+        if not len(lefts):
+            return
+        columns = [rule_rows[lefts, index] if side == 'rule' else fact_rows[rights, index]
+                   for side, index in step.columns]
+        rows, provenance = outputs.setdefault(step.output, ([], []))
+        rows.append(np.column_stack(columns) if columns else np.zeros((len(lefts), 0), dtype=np.int64))
+        provenance.append((key, lefts + rule_range[0], ('fact', step.premise), fact_positions[rights],
+                           (time.perf_counter() - start) / len(lefts)))
+
+    def _materialize(self, kb, relations, supports):
+        """Turn the rows derived by the saturation into Facts and Rules,
+            link their supported_by pairs and store them in the KB
+        """
+        terms = Term.by_id
+        for key, target in relations.items():
+            for position, row in enumerate(target.rows(target.known).tolist(), target.known):
+                if key[0] == 'fact':
+                    item = Fact(Statement([symbol_names[key[1][0]]] + [terms[i]() for i in row]))
+                else:
+                    statements = [Statement([symbol_names[predicate]] +
+                                            [terms[t]() if t < 0 else terms[row[t]]() for t in slots])
+                                  for predicate, slots in key[1]]
+                    item = Rule([statements[:-1], statements[-1]])
+                item.asserted = False
+                target.items[position] = item
+
+        stats = kb.stats
+        pending, fired = {}, []
+        for key, found, provenance in supports:
+            offset = 0
+            found = found.tolist()
+            for rule_key, rule_positions, fact_key, fact_positions, share in provenance:
+                rule_items, fact_items = relations[rule_key].items, relations[fact_key].items
+                for position, rule, fact in zip(found[offset:], rule_positions.tolist(),
+                                                fact_positions.tolist()):
+                    pending.setdefault((key, position), []).append([fact_items[fact], rule_items[rule]])
+                    if stats is not None:
+                        fired.append((rule_items[rule], share))
+                offset += len(rule_positions)
+
+        # Store the new items before linking any support, since a support
+        # may use a new item stored after the one it supports
+        for (key, position) in pending:
+            if position >= relations[key].known:
+                kb._insert(relations[key].items[position])
+                if stats is not None:
+                    stats.stored(relations[key].items[position], True)
+        for (key, position), pairs in pending.items():
+            target = relations[key]
+            item = target.items[position]
+            if position < target.known:
+                # KB items get their new supports merged in by _insert
+                kb._insert(Fact(item.statement, pairs) if isinstance(item, Fact)
+                           else Rule([item.lhs, item.rhs], pairs))
+            else:
+                for pair in pairs:
+                    item.supported_by.append(pair)
+        if stats is not None:
+            # the KB was given each derived fact and rule once: count their
+            # other derivations as the duplicates they are
+            for (key, position), pairs in pending.items():
+                for _ in pairs[1:]:
+                    stats.stored(relations[key].items[position], False)
+            # after linking, so that Stats can follow curried rules to their origin
+            for rule, seconds in fired:
+                stats.tested(True)
+                stats.fired(rule, True, seconds)
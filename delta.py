@@ -0,0 +1,44 @@
+class Delta(object):
+    """Net change to the facts of a KnowledgeBase over one batch (a kb_assert,
+        kb_assert_many, kb_retract or kb_ingest call), derived facts included.
+        A fact that is removed and added back within the batch (or the other
+        way round) does not show up.
+
+    Attributes:
+        added (dictof None): facts added, in order
+        removed (dictof None): facts removed, in order
+    """
+    __slots__ = ('added', 'removed')
+
+    def __init__(self):
+        """Constructor for Delta
+        """
+        super(Delta, self).__init__()
+        self.added = {}
+        self.removed = {}
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Delta(+{}, -{})'.format(len(self.added), len(self.removed))
+
+    def __len__(self):
+        """Number of facts added or removed
+        """
+        return len(self.added) + len(self.removed)
+
+    def fact_added(self, fact):
+        """Record that a fact was stored
+        """
+        if fact in self.removed:
+            del self.removed[fact]
+        else:
+            self.added[fact] = None
+
+    def fact_removed(self, fact):
+        """Record that a fact was removed
+        """
+        if fact in self.added:
+            del self.added[fact]
+        else:
+            self.removed[fact] = None
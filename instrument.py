@@ -0,0 +1,211 @@
+"""Counters and per-rule timings of forward chaining. Nothing is counted
+unless a Stats is attached to the KB (kb.stats), e.g. for the duration of a
+profiling block:
+
+    with profiling(kb) as stats:
+        kb.kb_assert_many(items)
+    print(stats.counters())
+
+With no Stats attached, the only cost is a `kb.stats is not None` test per
+match attempt and per stored item.
+"""
+import contextlib
+import sys
+
+from logical_classes import Fact
+
+
+class RuleProfile(object):
+    """Firing counts and timings of one rule, curried versions included
+
+    Attributes:
+        rule (Rule): the rule
+        attempts (int): facts matched against the rule or its curried versions
+        firings (int): attempts that matched and derived a fact or rule
+        seconds (float): time spent in the attempts
+        histogram (listof int): histogram[i] counts the attempts that took
+            less than 2**i microseconds (and at least 2**(i-1))
+    """
+    def __init__(self, rule):
+        """Constructor for RuleProfile
+        """
+        super(RuleProfile, self).__init__()
+        self.rule = rule
+        self.attempts = 0
+        self.firings = 0
+        self.seconds = 0.0
+        self.histogram = []
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'RuleProfile({} -> {}, {} attempts, {} firings, {:.3f}ms)'.format(
+            self.rule.lhs, self.rule.rhs, self.attempts, self.firings, 1000 * self.seconds)
+
+    def add(self, matched, seconds):
+        """Record one attempt
+        """
+        self.attempts += 1
+        self.firings += matched
+        self.seconds += seconds
+        bucket = int(seconds * 1e6).bit_length()
+        if bucket >= len(self.histogram):
+            self.histogram.extend([0] * (bucket + 1 - len(self.histogram)))
+        self.histogram[bucket] += 1
+
+    def percentile(self, fraction):
+        """Upper bound, in microseconds, of the time taken by the given
+            fraction of the attempts, read off the histogram
+        """
+        wanted = fraction * self.attempts
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= wanted:
+                return 2 ** bucket
+        return 0
+
+
+class Stats(object):
+    """Counters of forward chaining, see the module docstring. Curried rules
+        are profiled under the rule they were curried from.
+
+        Duplicates are derivations of a fact or rule the KB already had; the
+        ones an Agenda in batch mode folds together before they reach the KB
+        are not seen.
+
+        Every engine fills the counters in. ParallelEngine times each pair in
+        its workers. ColumnarEngine reports after the fixpoint, once its rows
+        are Facts and Rules. Its joins only produce the pairs that match, so
+        it records no failed attempts, and it times whole joins: each pair
+        gets an equal share of the time of the join that produced it.
+
+    Attributes:
+        match_attempts (int): facts matched against a rule's first LHS
+            statement (ReteEngine: against an alpha memory's pattern)
+        match_successes (int): matches that succeeded
+        instantiations (int): derived facts and curried rules built from a match
+        facts_derived (int): derived facts that were new to the KB
+        rules_created (int): curried rules that were new to the KB
+        duplicates (int): derived facts and rules the KB already had
+        absorbed (int): duplicates whose justification the KB already had too,
+            which therefore changed nothing
+        rules (dictof RuleProfile): maps rules to their profiles
+        origins (dictof Rule): maps curried rules to the rule they come from
+    """
+    def __init__(self):
+        """Constructor for Stats
+        """
+        super(Stats, self).__init__()
+        self.match_attempts = 0
+        self.match_successes = 0
+        self.instantiations = 0
+        self.facts_derived = 0
+        self.rules_created = 0
+        self.duplicates = 0
+        self.absorbed = 0
+        self.rules = {}
+        self.origins = {}
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Stats({})'.format(', '.join('{}={}'.format(k, v) for k, v in self.counters().items()))
+
+    def counters(self):
+        """The counters, as a dict
+        """
+        return {'match_attempts': self.match_attempts, 'match_successes': self.match_successes,
+                'instantiations': self.instantiations, 'facts_derived': self.facts_derived,
+                'rules_created': self.rules_created, 'duplicates': self.duplicates,
+                'absorbed': self.absorbed}
+
+    def tested(self, matched):
+        """Count one match attempt
+        """
+        self.match_attempts += 1
+        self.match_successes += matched
+
+    def fired(self, rule, matched, seconds):
+        """Record one attempt to fire a rule (or curried rule)
+
+        Args:
+            rule (Rule): the rule
+            matched (bool): whether it derived something
+            seconds (float): time the attempt took
+        """
+        self.instantiations += matched
+        origin = self.origins.get(rule)
+        if origin is None:
+            origin = rule
+            while origin.supported_by and not origin.asserted:
+                origin = next(iter(origin.supported_by))[1]
+            self.origins[rule] = origin
+        profile = self.rules.get(origin)
+        if profile is None:
+            profile = self.rules[origin] = RuleProfile(origin)
+        profile.add(matched, seconds)
+
+    def stored(self, fact_rule, new, absorbed=0):
+        """Count a derived fact or rule reaching the KB
+
+        Args:
+            fact_rule (Fact|Rule): the derived fact or rule
+            new (bool): False if the KB already had it
+            absorbed (int): how many of its justifications the KB already had
+        """
+        if not new:
+            self.duplicates += 1
+            self.absorbed += absorbed > 0
+        elif isinstance(fact_rule, Fact):
+            self.facts_derived += 1
+        else:
+            self.rules_created += 1
+
+    def top(self, count=10):
+        """The most expensive rules
+
+        Args:
+            count (int): how many
+
+        Returns:
+            listof RuleProfile: by decreasing total time
+        """
+        return sorted(self.rules.values(), key=lambda profile: -profile.seconds)[:count]
+
+    def report(self, count=10):
+        """The counters and the most expensive rules, as text
+        """
+        lines = ['  '.join('{}={}'.format(k, v) for k, v in self.counters().items())]
+        lines.append('{:>10} {:>10} {:>10} {:>8} {:>8}  rule'.format(
+            'attempts', 'firings', 'total ms', 'p50 us', 'p99 us'))
+        for profile in self.top(count):
+            lines.append('{:>10} {:>10} {:>10.3f} {:>8} {:>8}  {} -> {}'.format(
+                profile.attempts, profile.firings, 1000 * profile.seconds,
+                profile.percentile(0.5), profile.percentile(0.99),
+                ' '.join(str(s) for s in profile.rule.lhs), profile.rule.rhs))
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def profiling(kb, count=10, file=sys.stdout):
+    """Profile the forward chaining of a KB in a with block, then print the
+        counters and the most expensive rules
+
+    Args:
+        kb (KnowledgeBase): KB to profile
+        count (int): number of rules to report
+        file (file|None): where to print the report, None to not print it
+
+    Yields:
+        Stats: the counters, filled in as the block runs
+    """
+    stats = Stats()
+    previous = kb.stats
+    kb.stats = stats
+    try:
+        yield stats
+    finally:
+        kb.stats = previous
+        if file is not None:
+            print(stats.report(count), file=file)
@@ -0,0 +1,421 @@
+"""Central, array-backed storage of the justifications of a KB, see
+JustificationGraph
+"""
+from array import array
+
+from logical_classes import Fact
+
+
+class JustificationGraph(object):
+    """The justifications of the facts and rules of a KB, kept in integer
+        arrays instead of on the Facts and Rules themselves. Each Fact or Rule
+        the KB stores is a node, numbered in its `_node` slot. Each
+        justification, a [fact, rule] pair supporting a node, is an edge of 7
+        machine words: its target, fact and rule nodes, and its links in three
+        linked lists, those of the edges supporting the same node (doubly
+        linked), of the edges using the same fact and of the edges using the
+        same rule. An open-addressing hash table of edge numbers, itself an
+        integer array, finds the edge of a (node, fact node, rule node)
+        triple, so adding, finding and removing a justification cost O(1)
+        however many justifications the node has, for 2 to 4 more words per
+        edge (the table is kept at most half full).
+
+        The supported_by, supports_facts and supports_rules attributes of a
+        stored Fact or Rule are views over the arrays (SupportView and
+        DependentView), created when they are accessed. A removed edge is
+        unlinked from the list of its target and tombstoned (its target set
+        to -1), and a removed node is set to None; the fact and rule lists
+        skip tombstones until compact rebuilds the arrays without them, once
+        they make up most of the arrays.
+
+    Attributes:
+        nodes (list): maps nodes to their Fact or Rule, None once removed
+        target (array): target node of each edge, -1 for removed edges
+        fact (array): fact node of each edge
+        rule (array): rule node of each edge
+        next_in (array): next edge with the same target, -1 at the end
+        prev_in (array): previous edge with the same target, -1 at the start
+        next_fact (array): next edge with the same fact
+        next_rule (array): next edge with the same rule
+        head_in (array): first edge supporting each node
+        head_out (array): first edge each node supports, as a fact or rule
+        live_in (array): number of justifications of each node
+        slots (array): hash table of the live edges, -1 for empty slots,
+            see find
+        live (int): live edges
+        dead (int): removed edges still in the arrays
+        owns (callable|None): tells whether a Fact or Rule not attached yet
+            is stored in the KB, see attach
+    """
+    def __init__(self, owns=None):
+        """Constructor for JustificationGraph
+
+        Args:
+            owns (callable|None): called with a Fact or Rule not attached yet,
+                returns whether the KB stores it; None if only attached facts
+                and rules may justify others
+        """
+        super(JustificationGraph, self).__init__()
+        self.owns = owns
+        self.nodes = []
+        self.target = array('q')
+        self.fact = array('q')
+        self.rule = array('q')
+        self.next_in = array('q')
+        self.prev_in = array('q')
+        self.next_fact = array('q')
+        self.next_rule = array('q')
+        self.head_in = array('q')
+        self.head_out = array('q')
+        self.live_in = array('q')
+        self.slots = array('q', [-1]) * 8
+        self.live = 0
+        self.dead = 0
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'JustificationGraph({} nodes, {} edges, {} removed)'.format(
+            len(self.nodes), self.live, self.dead)
+
+    def attach(self, fact_rule):
+        """Make a Fact or Rule a node, moving the justifications it holds
+            itself (see logical_classes.Justified) into the arrays. The facts
+            and rules its justifications use must be attached, or be stored
+            in the KB (see owns), in which case they are attached too; the
+            graph never keeps nodes for facts and rules the KB does not have.
+
+        Args:
+            fact_rule (Fact|Rule): the fact or rule, usually being stored
+
+        Returns:
+            int: its node
+
+        Raises:
+            ValueError: if it is stored in another KB, or one of its
+                justifications uses a fact or rule the KB does not store
+        """
+        if fact_rule._graph is self:
+            return fact_rule._node
+        if fact_rule._graph is not None:
+            raise ValueError('{} is stored in another knowledge base'.format(fact_rule.name))
+        for pair in fact_rule._supported_by or ():
+            for member in pair:
+                self._check_member(fact_rule, member)
+        pending = []
+        node = self._add_node(fact_rule, pending)
+        while pending:
+            item = pending.pop()
+            pairs = item._supported_by
+            item._supported_by = item._supports_facts = item._supports_rules = None
+            for fact, rule in pairs or ():
+                self._check_member(item, fact)
+                self._check_member(item, rule)
+                f, r = self._add_node(fact, pending), self._add_node(rule, pending)
+                if self.find(item._node, f, r) < 0:
+                    self._link(item._node, f, r)
+        return node
+
+    def detach(self, fact_rule):
+        """Remove a Fact or Rule and every justification it takes part in. It
+            goes back to holding (empty) justifications itself.
+
+        Returns:
+            listof Fact|Rule: the facts and rules it justified that are left
+                without any justification, in the order it first justified them
+        """
+        node = fact_rule._node
+        edge = self.head_in[node]
+        while edge >= 0:
+            following = self.next_in[edge]
+            self._remove_edge(edge)
+            edge = following
+        outgoing = self.next_fact if isinstance(fact_rule, Fact) else self.next_rule
+        unsupported = []
+        for edge in reversed(self._edges(self.head_out, outgoing, node)):
+            dependent = self.target[edge]
+            self._remove_edge(edge)
+            if not self.live_in[dependent]:
+                unsupported.append(self.nodes[dependent])
+        self.nodes[node] = None
+        fact_rule._graph, fact_rule._node = None, -1
+        return unsupported
+
+    def add(self, fact_rule, fact, rule):
+        """Add a justification if the fact or rule does not have it yet
+
+        Args:
+            fact_rule (Fact|Rule): attached fact or rule it supports
+            fact (Fact): the supporting fact
+            rule (Rule): the supporting rule
+
+        Returns:
+            bool: True if the justification was added
+        """
+        self._check_member(fact_rule, fact)
+        self._check_member(fact_rule, rule)
+        node, f, r = fact_rule._node, self.attach(fact), self.attach(rule)
+        if self.find(node, f, r) >= 0:
+            return False
+        self._link(node, f, r)
+        return True
+
+    def has(self, fact_rule, fact, rule):
+        """Whether a fact or rule has a justification, in O(1)
+        """
+        return (fact._graph is self and rule._graph is self and
+                self.find(fact_rule._node, fact._node, rule._node) >= 0)
+
+    def remove(self, fact_rule, fact, rule):
+        """Remove a justification, raising ValueError like list.remove when
+            it is missing
+        """
+        edge = -1
+        if fact._graph is self and rule._graph is self:
+            edge = self.find(fact_rule._node, fact._node, rule._node)
+        if edge < 0:
+            raise ValueError('{!r} is not a justification'.format([fact, rule]))
+        self._remove_edge(edge)
+
+    def find(self, node, f, r):
+        """The live edge justifying a node with a fact and a rule node, found
+            by linear probing from the hash of the triple
+
+        Returns:
+            int: the edge, -1 if there is none
+        """
+        slots, target, fact, rule = self.slots, self.target, self.fact, self.rule
+        mask = len(slots) - 1
+        i = hash((node, f, r)) & mask
+        while True:
+            edge = slots[i]
+            if edge < 0:
+                return -1
+            if target[edge] == node and fact[edge] == f and rule[edge] == r:
+                return edge
+            i = (i + 1) & mask
+
+    def discard_member(self, fact_rule, member):
+        """Remove every justification of fact_rule that member takes part in
+
+        Returns:
+            listof list: the removed [fact, rule] pairs
+        """
+        if member._graph is not self:
+            return []
+        node = member._node
+        removed = []
+        for edge in reversed(self._edges(self.head_in, self.next_in, fact_rule._node)):
+            if self.fact[edge] == node or self.rule[edge] == node:
+                removed.append([self.nodes[self.fact[edge]], self.nodes[self.rule[edge]]])
+                self._remove_edge(edge)
+        return removed
+
+    def count(self, fact_rule):
+        """Number of justifications of a fact or rule
+        """
+        return self.live_in[fact_rule._node]
+
+    def supported(self, fact_rule):
+        """Whether a fact or rule has any justification
+        """
+        return self.live_in[fact_rule._node] > 0
+
+    def pairs(self, fact_rule):
+        """The [fact, rule] justifications of a fact or rule, in the order
+            they were added
+        """
+        nodes, fact, rule = self.nodes, self.fact, self.rule
+        pairs = [[nodes[fact[edge]], nodes[rule[edge]]]
+                 for edge in self._edges(self.head_in, self.next_in, fact_rule._node)]
+        pairs.reverse()
+        return pairs
+
+    def dependents(self, fact_rule, kind=None):
+        """The facts and rules a fact or rule takes part in justifying, in the
+            order it first did
+
+        Args:
+            fact_rule (Fact|Rule): attached fact or rule
+            kind (type|None): Fact or Rule to only get facts or rules
+
+        Returns:
+            listof Fact|Rule
+        """
+        outgoing = self.next_fact if isinstance(fact_rule, Fact) else self.next_rule
+        nodes, target = self.nodes, self.target
+        seen, found = set(), []
+        for edge in reversed(self._edges(self.head_out, outgoing, fact_rule._node)):
+            node = target[edge]
+            if node not in seen:
+                seen.add(node)
+                if kind is None or isinstance(nodes[node], kind):
+                    found.append(nodes[node])
+        return found
+
+    def compact(self, force=False):
+        """Rebuild the arrays without removed edges and nodes, renumbering the
+            nodes, if removed edges make up most of the arrays (or if forced)
+
+        Returns:
+            bool: whether the arrays were rebuilt
+        """
+        if not force and self.dead <= max(self.live, 1024):
+            return False
+        renumber = array('q', [-1]) * len(self.nodes)
+        nodes = []
+        for node, fact_rule in enumerate(self.nodes):
+            if fact_rule is not None:
+                renumber[node] = fact_rule._node = len(nodes)
+                nodes.append(fact_rule)
+        edges = [(renumber[t], renumber[f], renumber[r])
+                 for t, f, r in zip(self.target, self.fact, self.rule) if t >= 0]
+        self.nodes = nodes
+        for name in ('target', 'fact', 'rule', 'next_in', 'prev_in', 'next_fact', 'next_rule'):
+            setattr(self, name, array('q'))
+        self.head_in = array('q', [-1]) * len(nodes)
+        self.head_out = array('q', [-1]) * len(nodes)
+        self.live_in = array('q', [0]) * len(nodes)
+        self.slots = array('q', [-1]) * self._capacity(len(edges))
+        self.live = self.dead = 0
+        for node, f, r in edges:
+            self._link(node, f, r)
+        return True
+
+    def _check_member(self, fact_rule, member):
+        """Raise ValueError unless member, used in a justification of
+            fact_rule, is attached or stored in the KB
+        """
+        if member._graph is self:
+            return
+        if member._graph is None and self.owns is not None and self.owns(member):
+            return
+        raise ValueError('{} is justified by a {} that is not in this knowledge base'.format(
+            fact_rule.name, member.name))
+
+    def _add_node(self, fact_rule, pending):
+        """The node of a Fact or Rule, numbering it if it has none yet; its
+            justifications are then left to move by adding it to pending
+        """
+        if fact_rule._graph is self:
+            return fact_rule._node
+        if fact_rule._graph is not None:
+            raise ValueError('{} is stored in another knowledge base'.format(fact_rule.name))
+        node = len(self.nodes)
+        self.nodes.append(fact_rule)
+        self.head_in.append(-1)
+        self.head_out.append(-1)
+        self.live_in.append(0)
+        fact_rule._graph, fact_rule._node = self, node
+        pending.append(fact_rule)
+        return node
+
+    def _edges(self, heads, links, node):
+        """The live edges of one linked list, latest first
+        """
+        found = []
+        target = self.target
+        edge = heads[node]
+        while edge >= 0:
+            if target[edge] >= 0:
+                found.append(edge)
+            edge = links[edge]
+        return found
+
+    def _link(self, node, f, r):
+        """Append an edge and put it first in its three lists
+        """
+        edge = len(self.target)
+        first = self.head_in[node]
+        self.target.append(node)
+        self.fact.append(f)
+        self.rule.append(r)
+        self.next_in.append(first)
+        self.prev_in.append(-1)
+        self.next_fact.append(self.head_out[f])
+        self.next_rule.append(self.head_out[r])
+        if first >= 0:
+            self.prev_in[first] = edge
+        self.head_in[node] = self.head_out[f] = self.head_out[r] = edge
+        self.live_in[node] += 1
+        self.live += 1
+        if 2 * self.live > len(self.slots):
+            self._rehash(self._capacity(self.live))
+        else:
+            self._slot(edge)
+
+    def _remove_edge(self, edge):
+        """Unlink an edge from the list of its target and tombstone it; it
+            stays in its fact and rule lists until compact
+        """
+        node = self.target[edge]
+        self._unslot(edge)
+        before, after = self.prev_in[edge], self.next_in[edge]
+        if before >= 0:
+            self.next_in[before] = after
+        else:
+            self.head_in[node] = after
+        if after >= 0:
+            self.prev_in[after] = before
+        self.live_in[node] -= 1
+        self.target[edge] = -1
+        self.live -= 1
+        self.dead += 1
+
+    @staticmethod
+    def _capacity(edges):
+        """Hash table size for a number of edges: the smallest power of two
+            at least twice as large, so the table is at most half full
+        """
+        capacity = 8
+        while capacity < 2 * edges:
+            capacity *= 2
+        return capacity
+
+    def _home(self, edge):
+        """Slot an edge hashes to
+        """
+        return hash((self.target[edge], self.fact[edge], self.rule[edge])) & (len(self.slots) - 1)
+
+    def _slot(self, edge):
+        """Put a live edge in the first free slot from its home slot
+        """
+        slots = self.slots
+        mask = len(slots) - 1
+        i = self._home(edge)
+        while slots[i] >= 0:
+            i = (i + 1) & mask
+        slots[i] = edge
+
+    def _unslot(self, edge):
+        """Take a live edge out of the hash table, shifting back the edges
+            after it in its run that could sit in the freed slot, so lookups
+            never need tombstones
+        """
+        slots = self.slots
+        mask = len(slots) - 1
+        i = self._home(edge)
+        while slots[i] != edge:
+            i = (i + 1) & mask
+        j = i
+        while True:
+            j = (j + 1) & mask
+            moved = slots[j]
+            if moved < 0:
+                break
+            home = self._home(moved)
+            # moved stays unless slot i lies on its probe path, i.e. unless
+            # its home is cyclically outside (i, j]
+            if (i < home <= j) if i <= j else (home > i or home <= j):
+                continue
+            slots[i] = moved
+            i = j
+        slots[i] = -1
+
+    def _rehash(self, capacity):
+        """Rebuild the hash table with a new size
+        """
+        self.slots = array('q', [-1]) * capacity
+        for edge, node in enumerate(self.target):
+            if node >= 0:
+                self._slot(edge)
@@ -0,0 +1,112 @@
+"""Load generator for server.py. Run e.g.
+`python loadgen.py --port 8348 --clients 16 --requests 500 --writes 0.2`
+against a running server: it asserts the rules of a family tree, then
+each client sends asks and asserts of random motherof facts, one at a time,
+and the request rate and latency percentiles are printed.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+RULES = ["rule: ((motherof ?x ?y)) -> (parentof ?x ?y)",
+         "rule: ((parentof ?x ?y) (parentof ?y ?z)) -> (grandparentof ?x ?z)"]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list, 0 if it is empty
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def _client(connect, number, requests, writes, people, latencies):
+    """One client: send requests one at a time, recording the latency of
+        each in latencies['ask'] or latencies['assert']
+    """
+    rng = random.Random(number)
+    reader, writer = await connect()
+    try:
+        for _ in range(requests):
+            if rng.random() < writes:
+                kind = 'assert'
+                child = rng.randrange(1, people)
+                line = 'assert fact: (motherof p{} p{})'.format(rng.randrange(child), child)
+            else:
+                kind = 'ask'
+                line = 'ask fact: (grandparentof p{} ?y)'.format(rng.randrange(people))
+            start = time.perf_counter()
+            writer.write((line + '\n').encode('utf-8'))
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies[kind].append(time.perf_counter() - start)
+            if not response['ok']:
+                latencies['errors'].append(response['error'])
+    finally:
+        writer.close()
+
+
+async def run_load(host='127.0.0.1', port=8348, path=None, clients=16, requests=500,
+                   writes=0.2, people=2000):
+    """Drive a server with concurrent clients
+
+    Args:
+        host (str): server address
+        port (int): server TCP port
+        path (str|None): server unix socket, instead of host and port
+        clients (int): number of concurrent connections
+        requests (int): requests sent by each client
+        writes (float): fraction of requests that are asserts
+        people (int): size of the family tree the facts are drawn from
+
+    Returns:
+        dict: requests per second and ask/assert latency percentiles in ms
+    """
+    def connect():
+        if path is not None:
+            return asyncio.open_unix_connection(path)
+        return asyncio.open_connection(host, port)
+
+    reader, writer = await connect()
+    for rule in RULES:
+        writer.write(('assert ' + rule + '\n').encode('utf-8'))
+        await writer.drain()
+        await reader.readline()
+    writer.close()
+
+    latencies = {'ask': [], 'assert': [], 'errors': []}
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(connect, number, requests, writes, people, latencies)
+                           for number in range(clients)])
+    elapsed = time.perf_counter() - start
+    result = {'clients': clients, 'requests': clients * requests,
+              'requests_per_second': clients * requests / elapsed,
+              'errors': len(latencies['errors'])}
+    for kind in ('ask', 'assert'):
+        values = sorted(latencies[kind])
+        for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            result['{}_{}_ms'.format(kind, name)] = 1000 * percentile(values, fraction)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8348)
+    parser.add_argument('--unix', metavar='PATH', help='connect to a unix socket')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500, help='requests per client')
+    parser.add_argument('--writes', type=float, default=0.2, help='fraction of asserts')
+    parser.add_argument('--people', type=int, default=2000)
+    args = parser.parse_args()
+    result = asyncio.run(run_load(args.host, args.port, args.unix, args.clients,
+                                  args.requests, args.writes, args.people))
+    print('  '.join('{}={:.6g}'.format(k, v) if isinstance(v, float) else '{}={}'.format(k, v)
+                    for k, v in result.items()))
+
+
+if __name__ == '__main__':
+    main()
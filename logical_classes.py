@@ -1,6 +1,77 @@
+import weakref
+
 from util import is_var
 
-class Fact(object):
+class Justified(object):
+    """Justification bookkeeping shared by Fact and Rule. A Fact or Rule
+        stored in a KB is a node of the KB's JustificationGraph (see
+        justification.py), which holds its justifications in integer arrays;
+        supported_by, supports_facts and supports_rules are then views read
+        off the graph (SupportView, DependentView). A Fact or Rule outside
+        any KB keeps its justifications itself, in a SupportSet and
+        DependentSets created the first time they are used.
+
+    Attributes:
+        supported_by (SupportSet|SupportView): [Fact, Rule] pairs that allow
+            inference of the fact or rule
+        supports_facts (DependentSet|DependentView): Facts it supports
+        supports_rules (DependentSet|DependentView): Rules it supports
+    """
+    __slots__ = ('_graph', '_node', '_supported_by', '_supports_facts', '_supports_rules')
+
+    def __init__(self, supported_by=()):
+        """Constructor for Justified
+
+        Args:
+            supported_by (listof list): initial [fact, rule] pairs
+        """
+        super(Justified, self).__init__()
+        self._graph = None
+        self._node = -1
+        self._supported_by = list(supported_by) or None
+        self._supports_facts = self._supports_rules = None
+
+    @property
+    def supported_by(self):
+        """The [fact, rule] pairs justifying this fact or rule
+        """
+        if self._graph is not None:
+            return SupportView(self)
+        if not isinstance(self._supported_by, SupportSet):
+            self._supported_by = SupportSet(self._supported_by or ())
+        return self._supported_by
+
+    @property
+    def supports_facts(self):
+        """The facts this fact or rule takes part in justifying
+        """
+        if self._graph is not None:
+            return DependentView(self, Fact)
+        if self._supports_facts is None:
+            self._supports_facts = DependentSet()
+        return self._supports_facts
+
+    @property
+    def supports_rules(self):
+        """The rules this fact or rule takes part in justifying
+        """
+        if self._graph is not None:
+            return DependentView(self, Rule)
+        if self._supports_rules is None:
+            self._supports_rules = DependentSet()
+        return self._supports_rules
+
+    def __getstate__(self):
+        """Pickle or copy as a Fact or Rule outside any KB, holding its
+            supported_by pairs itself, rather than with the whole graph
+        """
+        state = {name: getattr(self, name) for cls in type(self).__mro__
+                 for name in getattr(cls, '__slots__', ()) if hasattr(self, name)}
+        state.update(_graph=None, _node=-1, _supported_by=list(self.supported_by) or None,
+                     _supports_facts=None, _supports_rules=None)
+        return (None, state)
+
+class Fact(Justified):
     """Represents a fact in our knowledge base. Has a statement containing the
         content of the fact, e.g. (isa Sorceress Wizard) and fields tracking
         which facts/rules in the KB it supports and is supported by.
@@ -10,11 +81,13 @@ class Fact(object):
         statement (Statement): statement of this fact, basically what the fact actually says
         asserted (bool): boolean flag indicating if fact was asserted instead of
             inferred from other rules/facts in the KB
-        supported_by (listof Fact|Rule): Facts/Rules that allow inference of
-            the statement
-        supports_facts (listof Fact): Facts that this fact supports
-        supports_rules (listof Rule): Rules that this fact supports
+        supported_by (SupportSet|SupportView): [Fact, Rule] pairs that allow
+            inference of the statement, see Justified
+        supports_facts (DependentSet|DependentView): Facts that this fact supports
+        supports_rules (DependentSet|DependentView): Rules that this fact supports
     """
+    __slots__ = ('name', 'statement', 'asserted')
+
     def __init__(self, statement, supported_by=[]):
         """Constructor for Fact setting up useful flags and generating appropriate statement
 
@@ -24,16 +97,10 @@ class Fact(object):
             supported_by (listof Fact|Rule): Facts/Rules that allow inference of
                 the statement
         """
-        super(Fact, self).__init__()
+        super(Fact, self).__init__(supported_by)
         self.name = "fact"
         self.statement = statement if isinstance(statement, Statement) else Statement(statement)
         self.asserted = not supported_by
-        #self.supported_by = supported_by
-        self.supported_by = []
-        self.supports_facts = []
-        self.supports_rules = []
-        for pair in supported_by:
-           self.supported_by.append(pair)
 
     def __repr__(self):
         """Define internal string representation
@@ -49,15 +116,15 @@ class Fact(object):
         string = self.name + ":\n"
         string += "\t" + str(self.statement) + "\n"
         string += "\t Asserted:       " + str(self.asserted) + "\n"
-        if self.supported_by != []:
+        if self.supported_by:
             name_strings = [str(x.name) for y in self.supported_by for x in y]
             supported_by_str = ", ".join(name_strings)
             string += "\t Supported by:   [" + supported_by_str + "]\n"
-        if self.supports_facts != []:
+        if self.supports_facts:
             name_strings = [str(x.name) for x in self.supports_facts]
             supports_f_str = ", ".join(name_strings)
             string += "\t Supports facts: [" + supports_f_str + "]\n"
-        if self.supports_rules != []:
+        if self.supports_rules:
             name_strings = [str(x.name) for x in self.supports_rules]
             supports_r_str = ", ".join(name_strings)
             string += "\t Supports rules: [" + supports_r_str + "]\n"
@@ -73,7 +140,12 @@ class Fact(object):
         """
         return not self == other
 
-class Rule(object):
+    def __hash__(self):
+        """Define hash consistent with ==, so Facts can key dicts and sets
+        """
+        return self.statement._hash
+
+class Rule(Justified):
     """Represents a rule in our knowledge base. Has a list of statements (the LHS)
         containing the statements that need to be in our KB for us to infer the
         RHS statement. Also has fields tracking which facts/rules in the KB it
@@ -85,11 +157,13 @@ class Rule(object):
         rhs (Statement): RHS statment of this rule
         asserted (bool): boolean flag indicating if rule was asserted instead of
             inferred from other rules/facts in the KB
-        supported_by (listof Fact|Rule): Facts/Rules that allow inference of
-            the statement
-        supports_facts (listof Fact): Facts that this rule supports
-        supports_rules (listof Rule): Rules that this rule supports
+        supported_by (SupportSet|SupportView): [Fact, Rule] pairs that allow
+            inference of the statement, see Justified
+        supports_facts (DependentSet|DependentView): Facts that this rule supports
+        supports_rules (DependentSet|DependentView): Rules that this rule supports
     """
+    __slots__ = ('name', 'lhs', 'rhs', 'asserted', '_hash')
+
     def __init__(self, rule, supported_by=[]):
         """Constructor for Rule setting up useful flags and generating appropriate LHS & RHS
 
@@ -99,16 +173,12 @@ class Rule(object):
             supported_by (listof Fact|Rule): Facts/Rules that allow inference of
                 the statement
         """
-        super(Rule, self).__init__()
+        super(Rule, self).__init__(supported_by)
         self.name = "rule"
         self.lhs = [statement if isinstance(statement, Statement) else Statement(statement) for statement in rule[0]]
         self.rhs = rule[1] if isinstance(rule[1], Statement) else Statement(rule[1])
+        self._hash = hash((tuple(self.lhs), self.rhs))
         self.asserted = not supported_by
-        self.supported_by = []
-        self.supports_facts = []
-        self.supports_rules = []
-        for pair in supported_by:
-            self.supported_by.append(pair)
 
     def __repr__(self):
         """Define internal string representation
@@ -127,15 +197,15 @@ class Rule(object):
             string += "\t\t" + str(statement) + "\n"
         string += "\t Right hand:\n\t\t" + str(self.rhs) + "\n"
         string += "\t Asserted:       " + str(self.asserted) + "\n"
-        if self.supported_by != []:
+        if self.supported_by:
             name_strings = [str(x.name) for y in self.supported_by for x in y ]
             supported_by_str = ", ".join(name_strings)
             string += "\t Supported by:   [" + supported_by_str + "]\n"
-        if self.supports_facts != []:
+        if self.supports_facts:
             name_strings = [str(x.name) for x in self.supports_facts]
             supports_f_str = ", ".join(name_strings)
             string += "\t Supports facts: [" + supports_f_str + "]\n"
-        if self.supports_rules != []:
+        if self.supports_rules:
             name_strings = [str(x.name) for x in self.supports_rules]
             supports_r_str = ", ".join(name_strings)
             string += "\t Supports rules: [" + supports_r_str + "]\n"
@@ -152,16 +222,98 @@ class Rule(object):
         """
         return not self == other
 
+    def __hash__(self):
+        """Define hash consistent with ==, so Rules can key dicts and sets.
+            Computed once by the constructor, since the LHS and RHS of a rule
+            never change.
+        """
+        return self._hash
+
+    def __setstate__(self, state):
+        """Restore a pickled or copied rule, recomputing its hash since
+            interned ids (and so Statement hashes) differ between processes
+        """
+        for name, value in state[1].items():
+            setattr(self, name, value)
+        self._hash = hash((tuple(self.lhs), self.rhs))
+
+# Symbol table shared by every Statement: predicate, constant and variable
+# names are interned as small ints, positive for predicates and constants and
+# negative for variables, so a statement's key is a tuple of ints. The ids of
+# constants and variables are freed (and reused) once their Constant or
+# Variable is garbage collected; predicate ids are kept for good.
+symbol_ids = {}
+symbol_names = [None]
+free_symbols = []
+predicate_symbols = set()
+
+def intern_symbol(name):
+    """Get the interned id of a predicate, constant or variable name
+
+    Args:
+        name (str): the name, e.g. 'isa', 'Nosliw' or '?d'
+
+    Returns:
+        int: id of the name, negative for variables
+    """
+    symbol = symbol_ids.get(name)
+    if symbol is None:
+        if free_symbols:
+            index = free_symbols.pop()
+            symbol_names[index] = name
+        else:
+            index = len(symbol_names)
+            symbol_names.append(name)
+        symbol = index if name[:1] != "?" else -index
+        symbol_ids[name] = symbol
+    return symbol
+
+def release_symbol(name):
+    """Free the id of a constant or variable name nothing uses any more, so
+        a long-running KB does not keep every name it has ever seen. Names
+        also used as predicates keep their id.
+
+    Args:
+        name (str): the name of a Constant or Variable being collected
+    """
+    symbol = symbol_ids.get(name)
+    if symbol is not None and symbol not in predicate_symbols:
+        del symbol_ids[name]
+        symbol_names[abs(symbol)] = None
+        free_symbols.append(abs(symbol))
+
+def interned(table, key):
+    """The object a table of weak references interns under a key, None if
+        there is none or it was collected
+    """
+    ref = table.get(key)
+    return ref() if ref is not None else None
+
+def unintern(table, key, obj):
+    """Drop the entry of an object being collected from a table of weak
+        references, unless a newer object took the key
+    """
+    ref = table.get(key)
+    if ref is not None:
+        found = ref()
+        if found is None or found is obj:
+            del table[key]
+
 class Statement(object):
     """Represents a statement in our knowledge base, e.g. (attacked Ai Nosliw),
         (diamonds Loot), (isa Sorceress Wizard), etc. These statements show up
         in Facts or on the LHS and RHS of Rules
 
     Attributes:
-        terms (listof Term): List of terms (Variable or Constant) in the
-            statement, e.g. 'Nosliw' or '?d'
+        terms (tupleof Term): Terms (Variable or Constant) in the statement,
+            e.g. 'Nosliw' or '?d'
         predicate (str): The predicate of the statement, e.g. isa, hero, needs
+        key (tupleof int): interned ids of the predicate and of each term,
+            used for hashing and ==
+        ground (bool): whether the statement is free of variables
     """
+    __slots__ = ('predicate', 'terms', 'key', 'ground', '_hash', '_matcher')
+
     def __init__(self, statement_list=[]):
         """Constructor for Statements with optional list of Statements that are
             converted to appropriate terms (and one predicate)
@@ -173,17 +325,23 @@ class Statement(object):
                 Term constructor
         """
         super(Statement, self).__init__()
-        self.terms = []
+        self.terms = ()
         self.predicate = ""
 
         if statement_list:
             self.predicate = statement_list[0]
-            self.terms = [t if isinstance(t, Term) else Term(t) for t in statement_list[1:]]
+            self.terms = tuple(t if isinstance(t, Term) else Term(t) for t in statement_list[1:])
+        predicate = intern_symbol(self.predicate)
+        predicate_symbols.add(predicate)
+        self.key = (predicate,) + tuple(t.term.id for t in self.terms)
+        self.ground = min(self.key) > 0
+        self._hash = hash(self.key)
+        self._matcher = None
 
     def __repr__(self):
         """Define internal string representation
         """
-        return 'Statement({!r}, {!r})'.format(self.predicate, self.terms)
+        return 'Statement({!r}, {!r})'.format(self.predicate, list(self.terms))
 
     def __str__(self):
         """Define external representation when printed
@@ -193,38 +351,68 @@ class Statement(object):
     def __eq__(self, other):
         """Define behavior of == when applied to this object
         """
-        if self.predicate != other.predicate:
-            return False
-
-        for self_term, other_term in zip(self.terms, other.terms):
-            if self_term != other_term:
-                return False
-
-        return True
+        return self is other or (isinstance(other, Statement)
+                                 and self._hash == other._hash and self.key == other.key)
 
     def __ne__(self, other):
         """Define behavior of != when applied to this object
         """
         return not self == other
 
+    def __hash__(self):
+        """Define hash consistent with ==
+        """
+        return self._hash
+
+    def __reduce__(self):
+        """Pickle by content, since interned ids differ between processes
+        """
+        return (Statement, ([self.predicate] + list(self.terms),))
+
 class Term(object):
     """Represents a term (a Variable or Constant) in our knowledge base. Can
         sorta be thought of as a super class of Variable and Constant, though
-        there is no inheritance implemented in the code.
+        there is no inheritance implemented in the code. Terms are interned:
+        Term('Nosliw') always returns the same object while it is in use, so ==
+        is an identity test. The intern tables hold weak references, so Terms
+        no statement uses any more are collected.
 
     Attributes:
         term (Variable|Constant): The Variable or Constant that this term holds (represents)
+        interned (dictof weakref): maps elements to their Term (class attribute)
+        by_id (dictof weakref): maps symbol ids to their Term (class attribute)
     """
+    __slots__ = ('term', '__weakref__')
+    interned = {}
+    by_id = {}
+
+    def __new__(cls, term):
+        """Return the interned Term for term, creating it on first use
+        """
+        element = term.element if isinstance(term, (Variable, Constant)) else term
+        self = interned(cls.interned, element)
+        if self is None:
+            self = super(Term, cls).__new__(cls)
+            self.term = (term if isinstance(term, (Variable, Constant))
+                         else (Variable(term) if is_var(term) else Constant(term)))
+            cls.interned[element] = cls.by_id[self.term.id] = weakref.ref(self)
+        return self
+
     def __init__(self, term):
-        """Constructor for Term which converts term to appropriate form
+        """Constructor for Term which converts term to appropriate form (done
+            once, by __new__, since Terms are interned)
 
         Args:
             term (Variable|Constant|string): Either an instantiated Variable or
                 Constant, or a string to be passed to the appropriate constructor
         """
-        super(Term, self).__init__()
-        is_var_or_const = isinstance(term, Variable) or isinstance(term, Constant)
-        self.term = term if is_var_or_const else (Variable(term) if is_var(term) else Constant(term))
+        pass
+
+    def __del__(self):
+        """Unintern the Term when it is collected
+        """
+        unintern(Term.interned, self.term.element, self)
+        unintern(Term.by_id, self.term.id, self)
 
     def __repr__(self):
         """Define internal string representation
@@ -239,30 +427,64 @@ class Term(object):
     def __eq__(self, other):
         """Define behavior of == when applied to this object
         """
-        return (self is other
-            or isinstance(other, Term) and self.term.element == other.term.element
-            or ((isinstance(other, Variable) or isinstance(other, Constant))
-                and self.term.element == other.element))
+        if self is other:
+            return True
+        if type(other) is Term:
+            return False
+        return ((isinstance(other, Variable) or isinstance(other, Constant))
+                and self.term.element == other.element)
 
     def __ne__(self, other):
         """Define behavior of != when applied to this object
         """
         return not self == other
 
+    def __hash__(self):
+        """Define hash consistent with ==
+        """
+        return hash(self.term.element)
+
+    def __reduce__(self):
+        """Pickle by element so unpickling re-interns
+        """
+        return (Term, (self.term,))
+
 class Variable(object):
-    """Represents a variable used in statements
+    """Represents a variable used in statements. Variables are interned, so
+        Variable('?x') always returns the same object while it is in use; its
+        symbol id is released once it is collected.
 
     Attributes:
         element (str): The name of the variable, e.g. '?x'
+        id (int): interned symbol id of the name (negative)
     """
+    __slots__ = ('element', 'id', '__weakref__')
+    interned = {}
+
+    def __new__(cls, element):
+        """Return the interned Variable named element, creating it on first use
+        """
+        self = interned(cls.interned, element)
+        if self is None:
+            self = super(Variable, cls).__new__(cls)
+            self.element = element
+            self.id = intern_symbol(element)
+            cls.interned[element] = weakref.ref(self)
+        return self
+
     def __init__(self, element):
-        """Constructor for Variable
+        """Constructor for Variable (done once, by __new__)
 
         Args:
             element (str): The name of the variable, e.g. '?x'
         """
-        super(Variable, self).__init__()
-        self.element = element
+        pass
+
+    def __del__(self):
+        """Unintern the Variable and release its symbol id when it is collected
+        """
+        unintern(Variable.interned, self.element, self)
+        release_symbol(self.element)
 
     def __repr__(self):
         """Define internal string representation
@@ -278,29 +500,60 @@ class Variable(object):
         """Define behavior of == when applied to this object
         """
         return (self is other
-            or isinstance(other, Term) and self.term.element == other.term.element
-            or ((isinstance(other, Variable) or isinstance(other, Constant))
-                and self.term.element == other.element))
+            or isinstance(other, Term) and self.element == other.term.element
+            or (isinstance(other, Constant) and self.element == other.element))
 
     def __ne__(self, other):
         """Define behavior of != when applied to this object
         """
         return not self == other
 
+    def __hash__(self):
+        """Define hash consistent with ==
+        """
+        return hash(self.element)
+
+    def __reduce__(self):
+        """Pickle by element so unpickling re-interns
+        """
+        return (Variable, (self.element,))
+
 class Constant(object):
-    """Represents a constant used in statements
+    """Represents a constant used in statements. Constants are interned, so
+        Constant('Nosliw') always returns the same object while it is in use;
+        its symbol id is released once it is collected.
 
     Attributes:
         element (str): The value of the constant, e.g. 'Nosliw'
+        id (int): interned symbol id of the value
     """
+    __slots__ = ('element', 'id', '__weakref__')
+    interned = {}
+
+    def __new__(cls, element):
+        """Return the interned Constant for element, creating it on first use
+        """
+        self = interned(cls.interned, element)
+        if self is None:
+            self = super(Constant, cls).__new__(cls)
+            self.element = element
+            self.id = intern_symbol(element)
+            cls.interned[element] = weakref.ref(self)
+        return self
+
     def __init__(self, element):
-        """Constructor for Constant
+        """Constructor for Constant (done once, by __new__)
 
         Args:
             element (str): The value of the constant, e.g. 'Nosliw'
         """
-        super(Constant, self).__init__()
-        self.element = element
+        pass
+
+    def __del__(self):
+        """Unintern the Constant and release its symbol id when it is collected
+        """
+        unintern(Constant.interned, self.element, self)
+        release_symbol(self.element)
 
     def __repr__(self):
         """Define internal string representation
@@ -316,15 +569,271 @@ class Constant(object):
         """Define behavior of == when applied to this object
         """
         return (self is other
-            or isinstance(other, Term) and self.term.element == other.term.element
-            or ((isinstance(other, Variable) or isinstance(other, Constant))
-                and self.term.element == other.element))
+            or isinstance(other, Term) and self.element == other.term.element
+            or (isinstance(other, Variable) and self.element == other.element))
 
     def __ne__(self, other):
         """Define behavior of != when applied to this object
         """
         return not self == other
 
+    def __hash__(self):
+        """Define hash consistent with ==
+        """
+        return hash(self.element)
+
+    def __reduce__(self):
+        """Pickle by element so unpickling re-interns
+        """
+        return (Constant, (self.element,))
+
+class SupportSet(object):
+    """Set of justifications ([fact, rule] pairs) for a Fact or Rule, in the
+        order they were added. Iterates like the list of pairs it replaces, but
+        is hashed both by pair and by member, so adding a pair, removing one and
+        removing every pair a given fact or rule takes part in cost O(1) per
+        pair. Adding a pair that is already present does nothing.
+
+    Attributes:
+        pairs (dictof list): maps (fact, rule) tuples to [fact, rule] pairs
+        by_member (dictof dict): maps each fact and rule to the (fact, rule)
+            keys of the pairs it takes part in
+    """
+    __slots__ = ('pairs', 'by_member')
+
+    def __init__(self, pairs=()):
+        """Constructor for SupportSet
+
+        Args:
+            pairs (listof list): optional initial [fact, rule] pairs
+        """
+        super(SupportSet, self).__init__()
+        self.pairs = {}
+        self.by_member = {}
+        for pair in pairs:
+            self.append(pair)
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return repr(list(self.pairs.values()))
+
+    def __len__(self):
+        """Number of justifications
+        """
+        return len(self.pairs)
+
+    def __iter__(self):
+        """Iterate over [fact, rule] pairs in insertion order
+        """
+        return iter(list(self.pairs.values()))
+
+    def __contains__(self, pair):
+        """Define behavior of `in` for [fact, rule] pairs
+        """
+        return tuple(pair) in self.pairs
+
+    def append(self, pair):
+        """Add a [fact, rule] justification if it is not present yet
+
+        Args:
+            pair (list): [fact, rule] pair
+
+        Returns:
+            bool: True if the pair was added
+        """
+        key = tuple(pair)
+        if key in self.pairs:
+            return False
+        self.pairs[key] = list(pair)
+        for member in key:
+            self.by_member.setdefault(member, {})[key] = None
+        return True
+
+    def remove(self, pair):
+        """Remove a [fact, rule] justification, raising ValueError like
+            list.remove when it is missing
+        """
+        key = tuple(pair)
+        if key not in self.pairs:
+            raise ValueError('{!r} is not a justification'.format(pair))
+        del self.pairs[key]
+        for member in key:
+            keys = self.by_member[member]
+            keys.pop(key, None)
+            if not keys:
+                del self.by_member[member]
+
+    def discard_member(self, fact_rule):
+        """Remove every justification the given fact or rule takes part in
+
+        Args:
+            fact_rule (Fact|Rule): supporting fact or rule
+
+        Returns:
+            listof list: the removed [fact, rule] pairs
+        """
+        removed = []
+        for key in list(self.by_member.get(fact_rule, ())):
+            removed.append(self.pairs[key])
+            self.remove(key)
+        return removed
+
+class DependentSet(dict):
+    """Facts or rules a Fact or Rule supports (its supports_facts or
+        supports_rules), in the order they were added. Iterates like the list
+        it replaces, but is hashed, so recording a fact or rule that is
+        already there (a repeated derivation, or one derived again after a
+        retraction) costs O(1) and takes no memory; the entry is updated to
+        the object last recorded. A dict mapping each fact or rule to the
+        object recorded for it, which keeps creating one (twice per Fact or
+        Rule) cheap.
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return repr(list(self.values()))
+
+    def __iter__(self):
+        """Iterate over the facts or rules in insertion order
+        """
+        return iter(list(self.values()))
+
+    def append(self, item):
+        """Record a fact or rule
+
+        Args:
+            item (Fact|Rule): the supported fact or rule
+
+        Returns:
+            bool: True if no equal fact or rule was recorded yet
+        """
+        new = item not in self
+        self[item] = item
+        return new
+
+    def remove(self, item):
+        """Remove a fact or rule, raising ValueError like list.remove when it
+            is missing
+        """
+        if item not in self:
+            raise ValueError('{!r} is not a dependent'.format(item))
+        del self[item]
+
+    def discard(self, item):
+        """Remove a fact or rule if it is recorded
+        """
+        self.pop(item, None)
+
+class SupportView(object):
+    """supported_by of a Fact or Rule stored in a KB: its justifications, read
+        off the KB's JustificationGraph, with the interface of SupportSet
+    """
+    __slots__ = ('item',)
+
+    def __init__(self, item):
+        """Constructor for SupportView
+
+        Args:
+            item (Fact|Rule): the stored fact or rule
+        """
+        super(SupportView, self).__init__()
+        self.item = item
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return repr(list(self))
+
+    def __len__(self):
+        """Number of justifications
+        """
+        return self.item._graph.count(self.item)
+
+    def __bool__(self):
+        """Whether there is any justification, without counting them
+        """
+        return self.item._graph.supported(self.item)
+
+    def __iter__(self):
+        """Iterate over [fact, rule] pairs in insertion order
+        """
+        return iter(self.item._graph.pairs(self.item))
+
+    def __contains__(self, pair):
+        """Define behavior of `in` for [fact, rule] pairs. Pairs of facts and
+            rules stored in the same KB are looked up in the graph's hash
+            table; others are compared with == against every pair.
+        """
+        graph = self.item._graph
+        fact, rule = pair
+        if getattr(fact, '_graph', None) is graph and getattr(rule, '_graph', None) is graph:
+            return graph.has(self.item, fact, rule)
+        return list(pair) in graph.pairs(self.item)
+
+    def append(self, pair):
+        """Add a [fact, rule] justification if it is not present yet
+
+        Returns:
+            bool: True if the pair was added
+        """
+        return self.item._graph.add(self.item, pair[0], pair[1])
+
+    def remove(self, pair):
+        """Remove a [fact, rule] justification, raising ValueError when it is
+            missing
+        """
+        self.item._graph.remove(self.item, pair[0], pair[1])
+
+    def discard_member(self, fact_rule):
+        """Remove every justification the given fact or rule takes part in
+
+        Returns:
+            listof list: the removed [fact, rule] pairs
+        """
+        return self.item._graph.discard_member(self.item, fact_rule)
+
+class DependentView(object):
+    """supports_facts or supports_rules of a Fact or Rule stored in a KB: the
+        facts or rules it takes part in justifying, read off the KB's
+        JustificationGraph. Read-only, since they follow from the
+        justifications.
+    """
+    __slots__ = ('item', 'kind')
+
+    def __init__(self, item, kind):
+        """Constructor for DependentView
+
+        Args:
+            item (Fact|Rule): the stored fact or rule
+            kind (type): Fact for supports_facts, Rule for supports_rules
+        """
+        super(DependentView, self).__init__()
+        self.item = item
+        self.kind = kind
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return repr(list(self))
+
+    def __len__(self):
+        """Number of facts or rules
+        """
+        return len(self.item._graph.dependents(self.item, self.kind))
+
+    def __iter__(self):
+        """Iterate over the facts or rules in the order they were supported
+        """
+        return iter(self.item._graph.dependents(self.item, self.kind))
+
+    def __contains__(self, fact_rule):
+        """Define behavior of `in`
+        """
+        return fact_rule in self.item._graph.dependents(self.item, self.kind)
+
 class Binding(object):
     """Represents a binding of a constant to a variable, e.g. 'Nosliw' might be
         bound to'?d'
@@ -409,10 +918,9 @@ class Bindings(object):
         Returns:
             Variable|Constant|False: returns bound term if variable is bound else False
         """
-        if variable.element in self.bindings_dict.keys():
-            value = self.bindings_dict[variable.element]
-            if value:
-                return Variable(value) if is_var(value) else Constant(value)
+        value = self.bindings_dict.get(variable.element)
+        if value:
+            return Variable(value) if is_var(value) else Constant(value)
 
         return False
 
@@ -429,9 +937,9 @@ class Bindings(object):
             bool: if variable bound returns whether or not bound value matches value_term,
                 else True
         """
-        bound = self.bound_to(variable_term.term)
+        bound = self.bindings_dict.get(variable_term.term.element)
         if bound:
-            return value_term.term == bound
+            return value_term.term.element == bound
             
         self.add_binding(variable_term.term, value_term.term)
         return True
@@ -0,0 +1,193 @@
+"""Magic-sets evaluation of asks, see MagicEvaluator"""
+from functools import partial
+
+from cache import AskCache
+from logical_classes import Fact, Rule, Statement
+from store import FactStore
+from util import compile_pattern, variant_key
+
+
+def adornment(statement, bound):
+    """Which arguments of a statement are bound: 'b' for constants and
+        bound variables, 'f' for the other variables
+
+    Args:
+        statement (Statement): statement, usually with variables
+        bound (set of int): interned ids of the bound variables
+
+    Returns:
+        str: e.g. 'bf' for (grandmotherof ada ?x) with nothing bound
+    """
+    return ''.join('b' if term > 0 or term in bound else 'f' for term in statement.key[1:])
+
+
+def magic_statement(statement, adorned):
+    """The magic statement asking for the answers of a statement under an
+        adornment: its bound arguments under a predicate naming both, e.g.
+        (magic_grandmotherof_bf ada) for (grandmotherof ada ?x) and 'bf'
+    """
+    return Statement(['magic_{}_{}'.format(statement.predicate, adorned)] +
+                     [term for term, a in zip(statement.terms, adorned) if a == 'b'])
+
+
+def order(lhs, bound):
+    """Order LHS statements so that each one, when it can, shares a constant
+        or bound variable with the statement or statements before it, taking
+        the earliest such statement first (the original order otherwise)
+
+    Args:
+        lhs (listof Statement): LHS statements of a rule
+        bound (set of int): interned ids of the variables bound beforehand
+
+    Returns:
+        listof Statement
+    """
+    rest, ordered, bound = list(lhs), [], set(bound)
+    while rest:
+        statement = next((s for s in rest if 'b' in adornment(s, bound)), rest[0])
+        rest.remove(statement)
+        ordered.append(statement)
+        bound.update(term for term in statement.key[1:] if term < 0)
+    return ordered
+
+
+def rewrite(rules_by_head, goal):
+    """Magic-sets rewriting of the rules a goal depends on. Each rule that
+        can conclude an adorned predicate gets the magic statement of its RHS
+        as a first LHS statement, so it only fires for the bound arguments
+        that were asked for; and each LHS statement whose predicate is
+        derived by rules gets a magic rule asking for it, with what the
+        magic statement and the LHS statements before it bind (sideways
+        information passing, with the LHS reordered to go from bound
+        arguments to free ones, see order). The rewritten rules keep the
+        predicates of the original ones, so their conclusions are ordinary
+        facts.
+
+    Args:
+        rules_by_head (dictof list): maps (predicate, arity) to the rules to
+            rewrite for statements of that signature
+        goal (Statement): the asked statement
+
+    Returns:
+        (listof Rule, Fact): the rewritten and magic rules, and the seed
+            magic fact holding the goal's constants
+    """
+    asked = adornment(goal, ())
+    todo = [(goal.predicate, len(goal.terms), asked)]
+    done = set(todo)
+    rules = []
+    while todo:
+        predicate, arity, adorned = todo.pop()
+        for rule in rules_by_head.get((predicate, arity), ()):
+            guard = magic_statement(rule.rhs, adorned)
+            bound = {term for term, a in zip(rule.rhs.key[1:], adorned) if a == 'b'}
+            lhs = order(rule.lhs, bound)
+            for position, statement in enumerate(lhs):
+                signature = (statement.predicate, len(statement.terms))
+                if signature in rules_by_head:
+                    wanted = signature + (adornment(statement, bound),)
+                    rules.append(Rule([[guard] + lhs[:position],
+                                       magic_statement(statement, wanted[2])]))
+                    if wanted not in done:
+                        done.add(wanted)
+                        todo.append(wanted)
+                bound.update(term for term in statement.key[1:] if term < 0)
+            rules.append(Rule([[guard] + lhs, rule.rhs]))
+    return rules, Fact(magic_statement(goal, asked))
+
+
+class DemandStore(FactStore):
+    """FactStore of the KB an ask is evaluated in, which also sees the facts
+        of the asked KB: the first time a statement (up to variable renaming)
+        is looked up, the asked KB's facts matching it are copied in. Forward
+        chaining looks facts up by the first LHS statement of each rule, so
+        only the facts some rewritten rule can use are ever copied.
+
+    Attributes:
+        source (FactStore): facts of the asked KB
+        demanded (set of tuple): variant keys (see util.variant_key) of the
+            statements looked up so far
+    """
+    def __init__(self, source, items=()):
+        """Constructor for DemandStore
+
+        Args:
+            source (FactStore): facts of the asked KB
+            items (listof Fact): optional initial contents
+        """
+        self.source = source
+        self.demanded = set()
+        super(DemandStore, self).__init__(items)
+
+    def bucket(self, statement):
+        """Copy in the asked KB's facts matching the statement, the first time
+            it is looked up, then see FactStore.bucket
+        """
+        key = variant_key(statement)
+        if key not in self.demanded:
+            self.demanded.add(key)
+            matcher = compile_pattern(statement)
+            slots = [None] * len(matcher.names)
+            for fact in list(self.source.bucket(statement)):
+                if matcher.match(fact.statement, slots) and fact not in self:
+                    self.append(Fact(fact.statement))
+        return super(DemandStore, self).bucket(statement)
+
+
+class MagicEvaluator(object):
+    """Goal-directed forward chaining behind kb_ask(fact, mode="magic"). The
+        rules that can conclude the asked fact are rewritten with magic sets
+        (see rewrite) and forward chained by InferenceEngine in a scratch KB
+        that starts from the seed magic fact and copies facts in from the
+        asked KB on demand (see DemandStore). Only the facts relevant to the
+        asked constants are derived, bottom-up, and the asked KB is left
+        untouched.
+
+        The rules used are those BackwardChainer uses: rules concluding a
+        lazy predicate (see KnowledgeBase.set_evaluation), and rules with a
+        lazy predicate in their LHS. Everything else is already materialized
+        in the asked KB and is read from it.
+
+        Derived answers are Facts of the scratch KB, justified by the
+        rewritten rules (magic statement first) and by copies of the asked
+        KB's facts; answers the asked KB has are its own Facts.
+
+    Attributes:
+        kb (KnowledgeBase): the asked KB
+        rules_by_head (dictof list): maps (predicate, arity) to the rules with
+            that RHS to use for goals of that signature
+        scratch (KnowledgeBase|None): the KB of the last solve
+    """
+    def __init__(self, kb):
+        """Constructor for MagicEvaluator
+
+        Args:
+            kb (KnowledgeBase): the KB to answer asks from
+        """
+        super(MagicEvaluator, self).__init__()
+        self.kb = kb
+        self.scratch = None
+        self.rules_by_head = {}
+        for rule in kb.rules:
+            if (rule.rhs.predicate in kb.lazy or
+                    any(s.predicate in kb.lazy for s in rule.lhs)):
+                signature = (rule.rhs.predicate, len(rule.rhs.terms))
+                self.rules_by_head.setdefault(signature, []).append(rule)
+
+    def solve(self, goal):
+        """Derive the answers of a goal
+
+        Args:
+            goal (Statement): the goal, usually with variables
+
+        Returns:
+            listof Fact: a Fact for every provable instance of the goal
+        """
+        rules, seed = rewrite(self.rules_by_head, goal)
+        self.scratch = type(self.kb)([], [], cache=AskCache(0),
+                                     fact_store=partial(DemandStore, self.kb.facts))
+        self.scratch.kb_assert_many(rules + [seed])
+        matcher = compile_pattern(goal)
+        slots = [None] * len(matcher.names)
+        return [self.kb.facts.get(fact) or fact for fact in self.scratch.facts.candidates(goal)
+                if matcher.match(fact.statement, slots)]
@@ -1,17 +1,33 @@
 import unittest
+import os, sys, tempfile, asyncio, json, gc, warnings
 import read, copy
 from logical_classes import *
 from student_code import KnowledgeBase
+from store import FactStore, RuleStore
+from rete import ReteEngine
+from agenda import Agenda
+from cache import AskCache
+from util import match, compile_pattern
+from query import plan_query
+from parallel import ParallelEngine
+from mvcc import SharedKB
+from server import KBServer
+from instrument import profiling
+from columnar import ColumnarEngine
+from magic import MagicEvaluator, DemandStore
 import pdb
 
 class KBTest(unittest.TestCase):
 
+    def make_kb(self):
+        return KnowledgeBase([], [])
+
     def setUp(self):
         # Assert starter facts
         file = 'statements_kb4.txt'
         self.data = read.read_tokenize(file)
         data = read.read_tokenize(file)
-        self.KB = KnowledgeBase([], [])
+        self.KB = self.make_kb()
         for item in data:
             if isinstance(item, Fact) or isinstance(item, Rule):
                 self.KB.kb_assert(item)
@@ -193,6 +209,592 @@ class KBTest(unittest.TestCase):
         answer = self.KB.kb_ask(ask3)
         self.assertEqual(str(answer[0]), "?X : profHammond")
 
+    def test12(self):
+        """ensures the hashed fact/rule stores still behave like the lists they replaced"""
+        f1 = read.parse_input("fact: (motherof ada bing)")
+        self.assertTrue(f1 in self.KB.facts)
+        stored = self.KB.facts[self.KB.facts.index(f1)]
+        self.assertIsNot(stored, f1)
+        self.assertEqual(stored, f1)
+        self.assertTrue(stored.asserted)
+        r1 = read.parse_input("rule: ((motherof ?x ?y)) -> (parentof ?x ?y)")
+        self.assertTrue(r1 in self.KB.rules)
+        self.assertFalse(read.parse_input("fact: (motherof ada)") in self.KB.facts)
+
+    def test13(self):
+        """ensures the discrimination index only hands out facts that can match"""
+        ask1 = read.parse_input("fact: (motherof ?X chen)")
+        candidates = self.KB.facts.candidates(ask1.statement)
+        self.assertEqual([str(f.statement) for f in candidates],
+                         ["(motherof bing chen)", "(motherof dolores chen)"])
+        ask2 = read.parse_input("fact: (motherof nobody ?X)")
+        self.assertEqual(self.KB.facts.candidates(ask2.statement), [])
+        self.assertFalse(self.KB.kb_ask(ask2))
+
+    def test14(self):
+        """ensures inference depth is not bounded by the recursion limit"""
+        kb = self.make_kb()
+        kb.kb_assert(read.parse_input("rule: ((q ?y) (p ?x ?y)) -> (q ?x)"))
+        for i in range(1500):
+            kb.kb_assert(Fact(['p', 'n%d' % i, 'n%d' % (i + 1)]))
+        kb.kb_assert(Fact(['q', 'n1500']))
+        answer = kb.kb_ask(read.parse_input("fact: (q n0)"))
+        self.assertEqual(len(answer), 1)
+        kb.kb_retract(Fact(['q', 'n1500']))
+        self.assertFalse(kb.kb_ask(read.parse_input("fact: (q ?X)")))
+        self.assertEqual(len(kb.facts), 1500)
+
+    def test15(self):
+        """ensures the agenda order does not change what gets inferred"""
+        ask1 = read.parse_input("fact: (grandmotherof ada ?X)")
+        for agenda in (Agenda("lifo"), Agenda(batch_size=4)):
+            kb = self.make_kb()
+            kb.agenda = agenda
+            for item in self.data:
+                kb.kb_assert(item)
+            answer = kb.kb_ask(ask1)
+            self.assertEqual(sorted(str(b) for b in answer), ["?X : chen", "?X : felix"])
+
+    def test16(self):
+        """ensures bulk loading ends with the same facts, rules and justifications as asserting one by one"""
+        kb = self.make_kb()
+        kb.kb_assert_many(read.read_tokenize('statements_kb4.txt') +
+                          read.read_tokenize('statements_kb5.txt'))
+        self.assertEqual(contents(kb), contents(self.KB))
+
+    def test17(self):
+        """ensures terms are interned and statements compare by their interned keys"""
+        self.assertIs(Term('ada'), Term(Constant('ada')))
+        self.assertIs(Variable('?x'), Term('?x').term)
+        s1 = Statement(['motherof', 'ada', '?X'])
+        s2 = read.parse_input("fact: (motherof ada ?X)").statement
+        self.assertEqual(s1, s2)
+        self.assertEqual(hash(s1), hash(s2))
+        self.assertLess(s1.key[2], 0)
+        self.assertNotEqual(s1, Statement(['motherof', 'ada', 'bing']))
+
+    def test18(self):
+        """ensures the compiled matcher agrees with util.match"""
+        pattern = Statement(['rel', '?x', 'b', '?x'])
+        matcher = compile_pattern(pattern)
+        slots = [None] * len(matcher.names)
+        for terms in (['a', 'b', 'a'], ['a', 'b', 'c'], ['a', 'c', 'a'], ['a', 'b']):
+            statement = Statement(['rel'] + terms)
+            expected = match(pattern, statement)
+            self.assertEqual(matcher.match(statement, slots), bool(expected))
+            if expected:
+                self.assertEqual(str(matcher.bindings(slots)), str(expected))
+                self.assertEqual(matcher.substitute(Statement(['out', '?x', '?y']), slots),
+                                 Statement(['out', 'a', '?y']))
+
+    def test19(self):
+        """ensures the streaming parser reads files lazily and reports error positions"""
+        items = read.iter_tokenize('statements_kb5.txt')
+        self.assertEqual(str(next(items)), str(read.read_tokenize('statements_kb5.txt')[0]))
+        lines = ["fact: (isa cube block)  # a comment\n",
+                 "rule: ((isa ?x ?y)\n",
+                 "       (isa ?y ?z)) -> (isa ?x ?z)\n",
+                 "fact: (isa block (shape)\n"]
+        parsed = read.iter_parse(lines, 'test.txt')
+        self.assertEqual(next(parsed), Fact(['isa', 'cube', 'block']))
+        self.assertEqual(next(parsed), Rule([[['isa', '?x', '?y'], ['isa', '?y', '?z']],
+                                             ['isa', '?x', '?z']]))
+        with self.assertRaises(read.ParseError) as error:
+            next(parsed)
+        self.assertEqual((error.exception.line, error.exception.column), (4, 7))
+        self.assertEqual(str(error.exception), "test.txt:4:7: unclosed '('")
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, "w") as f:
+            f.write("# header comment\nstray text\n" + "".join(lines) + "fact: (isa block shape)\n")
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                self.assertEqual(read.read_tokenize(path),
+                                 [Fact(['isa', 'cube', 'block']),
+                                  Rule([[['isa', '?x', '?y'], ['isa', '?y', '?z']], ['isa', '?x', '?z']]),
+                                  Fact(['isa', 'block', 'shape'])])
+            self.assertEqual([str(w.message) for w in caught if w.category is read.ParseWarning],
+                             [path + ":2:1: expected 'fact:' or 'rule:', found 'stray' (line skipped)",
+                              path + ":6:7: unclosed '(' (fact skipped)"])
+            with self.assertRaises(read.ParseError):
+                read.read_tokenize(path, strict=True)
+            with self.assertRaises(read.ParseError):
+                list(read.iter_tokenize(path))
+        finally:
+            os.remove(path)
+
+    def test20(self):
+        """ensures a snapshot brings back the facts, rules and justifications it saved"""
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.KB.save_snapshot(path)
+            kb = KnowledgeBase.load_snapshot(path)
+            cache = AskCache(0)
+            uncached = KnowledgeBase.load_snapshot(path, cache=cache)
+        finally:
+            os.remove(path)
+        self.assertIs(uncached.cache, cache)
+        self.assertTrue(uncached.kb_ask(read.parse_input("fact: (motherof ada ?X)")))
+        self.assertEqual(len(uncached.cache), 0)
+        self.assertEqual(contents(kb), contents(self.KB))
+        fact = read.parse_input("fact: (motherof ada bing)")
+        kb.kb_retract(fact)
+        self.KB.kb_retract(fact)
+        self.assertEqual(contents(kb), contents(self.KB))
+
+    def test21(self):
+        """ensures backward mode proves lazy predicates on demand"""
+        kb = self.make_kb()
+        kb.set_evaluation('parentof', 'lazy')
+        kb.kb_assert_many(read.read_tokenize('statements_kb4.txt'))
+        ask = read.parse_input("fact: (parentof ?X chen)")
+        self.assertFalse(kb.kb_ask(ask))
+        answer = kb.kb_ask(ask, mode="backward")
+        self.assertEqual(sorted(str(answer[i]) for i in range(len(answer))),
+                         ['?X : bing', '?X : dolores'])
+        proof = answer.list_of_bindings[0][1][0]
+        self.assertFalse(proof.asserted)
+        self.assertEqual(len(proof.supported_by), 1)
+        ask = read.parse_input("fact: (grandmotherof ?X ?Y)")
+        self.assertEqual(str(kb.kb_ask(ask, mode="backward")), str(self.KB.kb_ask(ask)))
+        kb.set_evaluation('parentof', 'eager')
+        self.assertEqual(len(kb.kb_ask(read.parse_input("fact: (parentof ?X ?Y)"))), 4)
+
+    def test22(self):
+        """ensures conjunctive queries join patterns in a planned order"""
+        patterns = [read.parse_input("fact: (motherof ?x ?y)"),
+                    read.parse_input("fact: (motherof ?y ?z)")]
+        answer = self.KB.kb_ask_all(patterns)
+        self.assertEqual(len(answer), 1)
+        self.assertEqual(str(answer[0]), "?X : ada, ?Y : bing, ?Z : chen")
+        self.assertEqual([str(f.statement) for f in answer.list_of_bindings[0][1]],
+                         ["(motherof ada bing)", "(motherof bing chen)"])
+        patterns.append(read.parse_input("fact: (sisters ?x ?w)"))
+        steps = plan_query(self.KB.facts, [p.statement for p in patterns])
+        self.assertEqual(str(steps[0].pattern), "(sisters ?x ?w)")
+        self.assertEqual(steps[0].strategy, "scan")
+        self.assertEqual(len(self.KB.kb_ask_all(patterns)), 1)
+        self.assertFalse(self.KB.kb_ask_all(patterns + [read.parse_input("fact: (sisters ?z ?w)")]))
+
+    def test23(self):
+        """ensures streaming asks, kb_exists and kb_count agree with kb_ask"""
+        ask = read.parse_input("fact: (motherof ?X ?Y)")
+        answers = list(self.KB.kb_iter_ask(ask))
+        self.assertEqual([str(b) for b, _ in answers],
+                         [str(self.KB.kb_ask(ask)[i]) for i in range(len(answers))])
+        self.assertEqual(len(list(self.KB.kb_iter_ask(ask, limit=2))), 2)
+        self.assertEqual(self.KB.kb_count(ask), len(answers))
+        self.assertEqual(self.KB.kb_count(read.parse_input("fact: (motherof ?X chen)")), 2)
+        self.assertEqual(self.KB.kb_count(read.parse_input("fact: (motherof ?X ?X)")), 0)
+        self.assertTrue(self.KB.kb_exists(read.parse_input("fact: (grandmotherof ada chen)")))
+        self.assertTrue(self.KB.kb_exists(read.parse_input("fact: (parentof ?X felix)")))
+        self.assertFalse(self.KB.kb_exists(read.parse_input("fact: (parentof felix ?X)")))
+
+    def test24(self):
+        """ensures cached asks are renamed per asker and invalidated by predicate"""
+        kb = KnowledgeBase([], [], cache=AskCache(maxsize=2))
+        kb.kb_assert_many(read.read_tokenize('statements_kb4.txt'))
+        first = kb.kb_ask(read.parse_input("fact: (motherof ?X chen)"))
+        renamed = kb.kb_ask(read.parse_input("fact: (motherof ?who chen)"))
+        self.assertEqual((kb.cache.hits, kb.cache.misses), (1, 1))
+        self.assertEqual(str(renamed[0]), str(first[0]).replace("?X", "?WHO"))
+        kb.kb_ask(read.parse_input("fact: (sisters ?X ?Y)"))
+        kb.kb_assert(read.parse_input("fact: (motherof eva chen)"))
+        self.assertEqual(len(kb.cache), 1)
+        self.assertEqual(len(kb.kb_ask(read.parse_input("fact: (motherof ?X chen)"))), 3)
+        kb.kb_retract(read.parse_input("fact: (motherof eva chen)"))
+        self.assertEqual(len(kb.kb_ask(read.parse_input("fact: (motherof ?X chen)"))), 2)
+        kb.kb_ask(read.parse_input("fact: (parentof ?X ?Y)"))
+        self.assertEqual(len(kb.cache), 2)
+
+    def test25(self):
+        """ensures micro-batch ingestion reports net deltas to subscribers"""
+        deltas = []
+        self.KB.subscribe(deltas.append)
+        delta = self.KB.kb_ingest([read.parse_input("fact: (motherof eva hugo)")],
+                                  retract=[read.parse_input("fact: (motherof dolores chen)")])
+        self.assertEqual(deltas, [delta])
+        self.assertEqual(sorted(str(f.statement) for f in delta.added),
+                         ['(motherof eva hugo)', '(parentof eva hugo)'])
+        self.assertEqual(sorted(str(f.statement) for f in delta.removed),
+                         ['(motherof dolores chen)', '(parentof dolores chen)'])
+        self.KB.kb_assert(read.parse_input("fact: (motherof eva hugo)"))
+        self.assertEqual(len(deltas), 1)
+        self.KB.unsubscribe(deltas.append)
+        kb = self.make_kb()
+        kb.kb_assert_many([read.parse_input("rule: ((parentof ?x ?y) (parentof ?y ?z)) -> (grandparentof ?x ?z)"),
+                           read.parse_input("fact: (parentof ada bing)"),
+                           read.parse_input("fact: (parentof eva finn)")])
+        rules = kb.rules.candidates(Statement(['parentof', 'bing', 'chen']))
+        self.assertEqual(sorted(str(r.lhs[0]) for r in rules),
+                         ['(parentof ?x ?y)', '(parentof bing ?z)'])
+
+    def test26(self):
+        """ensures parallel saturation builds the same KB as sequential saturation"""
+        kbs = [KnowledgeBase([], []),
+               KnowledgeBase([], [], engine=ParallelEngine(workers=2, min_pairs=0))]
+        for kb in kbs:
+            kb.kb_assert_many(read.read_tokenize('statements_kb4.txt') +
+                              read.read_tokenize('statements_kb5.txt'))
+        self.assertEqual(contents(kbs[0], ordered=True), contents(kbs[1], ordered=True))
+        engine = kbs[1].ie
+        pool = engine.pool
+        self.assertIsNotNone(pool)
+        for kb in kbs:
+            kb.kb_assert_many([read.parse_input("fact: (motherof eva dolores)")])
+        self.assertEqual(contents(kbs[0], ordered=True), contents(kbs[1], ordered=True))
+        self.assertIs(engine.pool, pool)
+        engine.close()
+        self.assertIsNone(engine.pool)
+
+    def test27(self):
+        """ensures a shared KB snapshot keeps seeing its epoch while writers go on"""
+        shared = SharedKB(self.KB)
+        ask = read.parse_input("fact: (grandmotherof ?X chen)")
+        snapshot = shared.snapshot()
+        self.assertEqual(str(snapshot.kb_ask(ask)[0]), "?X : ada")
+        shared.kb_retract(read.parse_input("fact: (motherof ada bing)"))
+        shared.kb_assert(read.parse_input("fact: (motherof eva dolores)"))
+        self.assertEqual(str(snapshot.kb_ask(ask)[0]), "?X : ada")
+        self.assertEqual(len(snapshot.kb_ask(ask)), 1)
+        self.assertEqual(str(shared.kb_ask(ask)[0]), "?X : eva")
+        self.assertEqual(shared.kb_count(ask), self.KB.kb_count(ask))
+        self.assertEqual(len(shared.snapshot()), len(self.KB.facts))
+        self.assertEqual(shared.snapshot().epoch, snapshot.epoch + 2)
+
+    def test28(self):
+        """ensures the server batches concurrent asserts and answers asks"""
+        server = KBServer(SharedKB(self.KB))
+        async def session():
+            await server.start()
+            try:
+                async def send(*lines):
+                    reader, writer = await asyncio.open_connection(*server.address())
+                    responses = []
+                    for line in lines:
+                        writer.write((line + "\n").encode())
+                        responses.append(json.loads(await reader.readline()))
+                    writer.close()
+                    return responses
+                writes = await asyncio.gather(*[send("assert fact: (motherof eva p%d)" % i)
+                                                for i in range(10)])
+                asks = await send("ask fact: (parentof eva ?X)", "ask fact: (parentof",
+                                  "retract fact: (motherof eva p0)", "ask fact: (parentof eva ?X)",
+                                  "ask rule: ((a ?x)) -> (b ?x)")
+            finally:
+                await server.close()
+            return writes, asks
+        writes, asks = asyncio.run(session())
+        self.assertTrue(all(response[0]["ok"] for response in writes))
+        self.assertLess(server.batches, 10)
+        self.assertEqual(len(asks[0]["answers"]), 10)
+        self.assertFalse(asks[1]["ok"])
+        self.assertTrue(asks[2]["ok"])
+        self.assertEqual(len(asks[3]["answers"]), 9)
+        self.assertFalse(asks[4]["ok"])
+
+    def test29(self):
+        """ensures profiling counts derivations and only while enabled"""
+        kb = self.make_kb()
+        with profiling(kb, file=None) as stats:
+            kb.kb_assert_many(read.read_tokenize('statements_kb4.txt'))
+        self.assertIsNone(kb.stats)
+        self.assertEqual(stats.facts_derived, len([f for f in kb.facts if not f.asserted]))
+        self.assertEqual(stats.rules_created, len([r for r in kb.rules if not r.asserted]))
+        self.assertEqual(stats.instantiations,
+                         stats.facts_derived + stats.rules_created + stats.duplicates)
+        self.assertLessEqual(stats.match_successes, stats.match_attempts)
+        top = stats.top(1)[0]
+        self.assertTrue(top.rule.asserted)
+        self.assertEqual(sum(top.histogram), top.attempts)
+        kb.kb_assert(read.parse_input("fact: (motherof eva hugo)"))
+        self.assertEqual(stats.facts_derived, len([f for f in kb.facts if not f.asserted]) - 1)
+
+    def test30(self):
+        """ensures columnar saturation builds the same facts, rules and justifications"""
+        kbs = [KnowledgeBase([], []), KnowledgeBase([], [], engine=ColumnarEngine(min_facts=0))]
+        for kb in kbs:
+            kb.kb_assert_many(read.read_tokenize('statements_kb4.txt') +
+                              read.read_tokenize('statements_kb5.txt'))
+        self.assertEqual(contents(kbs[0]), contents(kbs[1]))
+        for kb in kbs:
+            kb.kb_retract(read.parse_input("fact: (motherof ada bing)"))
+        self.assertEqual(contents(kbs[0]), contents(kbs[1]))
+
+    def test31(self):
+        """ensures magic mode derives only what an ask needs, with the forward answers"""
+        kb = self.make_kb()
+        kb.set_evaluation('parentof', 'lazy')
+        kb.set_evaluation('grandmotherof', 'lazy')
+        kb.kb_assert_many(read.read_tokenize('statements_kb4.txt'))
+        for text in ("fact: (grandmotherof ada ?X)", "fact: (grandmotherof ?X felix)",
+                     "fact: (grandmotherof ?X ?Y)", "fact: (motherof ?X chen)"):
+            ask = read.parse_input(text)
+            answers = [kb.kb_ask(ask, mode="magic"), self.KB.kb_ask(ask)]
+            self.assertEqual(*[sorted(str(answer[i]) for i in range(len(answer))) for answer in answers])
+        evaluator = MagicEvaluator(kb)
+        answers = evaluator.solve(read.parse_input("fact: (grandmotherof ?X chen)").statement)
+        self.assertEqual([str(answer.statement) for answer in answers], ["(grandmotherof ada chen)"])
+        self.assertFalse(answers[0].asserted)
+        derived = [f for f in evaluator.scratch.facts if f.statement.predicate == 'parentof']
+        self.assertEqual(sorted(str(f.statement) for f in derived),
+                         ["(parentof bing chen)", "(parentof dolores chen)"])
+        self.assertFalse(kb.kb_ask(read.parse_input("fact: (parentof ?X ?Y)")))
+
+    def test32(self):
+        """ensures the dependency graph strata come in saturation order and follow the rules"""
+        kb = self.make_kb()
+        kb.kb_assert_many(read.read_tokenize('statements_kb2.txt'))
+        strata = kb.graph.strata()
+        order = {p: n for n, stratum in enumerate(strata) for p in stratum.predicates}
+        for predicate, targets in kb.graph.edges.items():
+            for head in targets:
+                if predicate in order:
+                    self.assertLessEqual(order[predicate], order[head])
+        self.assertEqual([sorted(s.predicates) for s in strata if s.recursive], [['isa'], ['inst']])
+        self.assertFalse(kb.graph.stratum('dead').recursive)
+        self.assertIsNone(kb.graph.stratum('hero'))
+        # the asserted rule and the rule curried from it with (wielding Ai Weapon)
+        self.assertEqual(kb.graph.edges['strong'], {'defeatable': 2})
+        kb.kb_retract(read.parse_input("fact: (hero Ai)"))
+        self.assertEqual(kb.graph.edges['strong'], {'defeatable': 1})
+
+    def test33(self):
+        """ensures repeated derivations of a justification are absorbed without growing the KB"""
+        kb = self.make_kb()
+        kb.kb_assert_many(read.read_tokenize('statements_kb4.txt'))
+        fact = kb._get_fact(read.parse_input("fact: (motherof ada bing)"))
+        rule = kb._get_rule(read.parse_input("rule: ((motherof ?x ?y)) -> (parentof ?x ?y)"))
+        derived = kb._get_fact(read.parse_input("fact: (parentof ada bing)"))
+        sizes = (len(derived.supported_by), len(fact.supports_facts), len(rule.supports_facts))
+        with profiling(kb, file=None) as stats:
+            for _ in range(3):
+                kb.kb_assert(Fact(derived.statement, [[fact, rule]]))
+        self.assertEqual((stats.duplicates, stats.absorbed), (3, 3))
+        self.assertEqual((len(derived.supported_by), len(fact.supports_facts), len(rule.supports_facts)), sizes)
+        for _ in range(3):
+            kb.kb_retract(fact)
+            kb.kb_assert(read.parse_input("fact: (motherof ada bing)"))
+        fact = kb._get_fact(fact)
+        self.assertEqual(len(rule.supports_facts), sizes[2])
+        self.assertTrue(any(d is kb._get_fact(derived) for d in rule.supports_facts))
+        self.assertIs(next(iter(kb._get_fact(derived).supported_by))[0], fact)
+
+    def test34(self):
+        """ensures justifications stored in the array-backed graph survive retractions and compaction"""
+        kb = self.make_kb()
+        kb.kb_assert_many(read.read_tokenize('statements_kb4.txt'))
+        fresh = contents(kb)
+        graph = kb.justifications
+        for fr in list(kb.facts) + list(kb.rules):
+            for f, r in fr.supported_by:
+                self.assertIn([f, r], fr.supported_by)
+                self.assertIn([Fact(f.statement), r], fr.supported_by)
+                self.assertNotIn([f, f], fr.supported_by)
+                self.assertIn(fr, f.supports_facts if isinstance(fr, Fact) else f.supports_rules)
+                self.assertIn(fr, r.supports_facts if isinstance(fr, Fact) else r.supports_rules)
+        mothers = [fact for fact in kb.facts if fact.statement.predicate == 'motherof']
+        for cycle in range(10):
+            for fact in mothers:
+                kb.kb_retract(fact)
+            self.assertFalse(any(fact.supported_by or fact._graph for fact in mothers))
+            kb.kb_assert_many(copy.deepcopy(mothers))
+            if cycle == 4:
+                self.assertTrue(graph.compact(force=True))
+        self.assertGreater(graph.dead, 0)
+        self.assertEqual(graph.live, sum(len(fr.supported_by) for fr in graph.nodes if fr))
+        for edge, node in enumerate(graph.target):
+            if node >= 0:
+                self.assertEqual(graph.find(node, graph.fact[edge], graph.rule[edge]), edge)
+        self.assertTrue(graph.compact(force=True))
+        # 7 words per edge in the edge arrays and at most 4 in the hash table
+        self.assertLessEqual(sum(len(getattr(graph, name)) * 8 for name in (
+            'target', 'fact', 'rule', 'next_in', 'prev_in', 'next_fact', 'next_rule', 'slots')),
+            11 * 8 * max(graph.live, 2))
+        self.assertEqual(graph.dead, 0)
+        self.assertEqual(len(graph.nodes), len(kb.facts) + len(kb.rules))
+        self.assertEqual(len(graph.target), sum(len(fr.supported_by) for fr in graph.nodes))
+        self.assertEqual(contents(kb), fresh)
+        derived = kb._get_fact(read.parse_input("fact: (grandmotherof ada chen)"))
+        copied = copy.deepcopy(derived)
+        self.assertIsNone(copied._graph)
+        self.assertEqual(len(copied.supported_by), len(derived.supported_by))
+
+    def test35(self):
+        """ensures facts justified by another KB's facts and rules are translated, or rejected"""
+        kb1, kb2 = self.make_kb(), self.make_kb()
+        kb1.kb_assert_many(read.read_tokenize('statements_kb4.txt'))
+        kb2.kb_assert_many(read.read_tokenize('statements_kb4.txt'))
+        fact = kb1._get_fact(read.parse_input("fact: (motherof ada bing)"))
+        rule = kb1._get_rule(read.parse_input("rule: ((motherof ?x ?y)) -> (parentof ?x ?y)"))
+        derived = kb1._get_fact(read.parse_input("fact: (parentof ada bing)"))
+        kb2.kb_assert(derived)
+        kb2.kb_assert(Fact(read.parse_input("fact: (parentof ada zed)").statement, [[fact, rule]]))
+        for statement in ("fact: (parentof ada bing)", "fact: (parentof ada zed)"):
+            stored = kb2._get_fact(read.parse_input(statement))
+            self.assertFalse(stored.asserted)
+            for f, r in stored.supported_by:
+                self.assertIs(f, kb2._get_fact(f))
+                self.assertIs(r, kb2._get_rule(r))
+        self.assertIsNot(kb2._get_fact(derived), derived)
+        self.assertIs(derived._graph, kb1.justifications)
+        empty = self.make_kb()
+        with self.assertRaises(ValueError):
+            empty.kb_assert(Fact(read.parse_input("fact: (parentof ada zed)").statement, [[fact, rule]]))
+
+    def test36(self):
+        """ensures derived items are not asserted and keep every justification they are derived by"""
+        kb = self.make_kb()
+        kb.kb_assert_many(read.read_tokenize('statements_kb5.txt'))
+        literally = kb._get_fact(read.parse_input("fact: (isliterally profHammond TonyStark)"))
+        genius = kb._get_fact(read.parse_input("fact: (techgenius profHammond)"))
+        self.assertFalse(literally.asserted)
+        self.assertEqual(len(literally.supported_by), 2)
+        self.assertIn(literally, genius.supports_facts)
+        self.assertTrue(all(literally in r.supports_facts for f, r in literally.supported_by))
+        kb.kb_retract(read.parse_input("fact: (dresslike profHammond TonyStark)"))
+        self.assertIsNone(kb._get_fact(read.parse_input("fact: (resembles profHammond TonyStark)")))
+        self.assertIs(kb._get_fact(literally), literally)
+        self.assertEqual([[str(f.statement), str(r.rhs)] for f, r in literally.supported_by],
+                         [["(techgenius profHammond)", "(isliterally profHammond TonyStark)"]])
+
+    def test37(self):
+        """ensures indexed rule candidates come back in insertion order"""
+        rules = [read.parse_input(text) for text in (
+            "rule: ((parentof ?x ?y)) -> (kin ?x ?y)",
+            "rule: ((parentof ada ?y)) -> (child ?y)",
+            "rule: ((parentof ?x bing)) -> (parent ?x)",
+            "rule: ((parentof ?x ?y) (parentof ?y ?z)) -> (grandparentof ?x ?z)",
+            "rule: ((parentof ada bing)) -> (known ada)")]
+        store = RuleStore(rules)
+        statement = read.parse_input("fact: (parentof ada bing)").statement
+        self.assertEqual(store.candidates(statement), rules)
+        other = read.parse_input("fact: (parentof bing chen)").statement
+        self.assertEqual(store.candidates(other), [rules[0], rules[3]])
+
+    def test38(self):
+        """ensures a new predicate does not change the tables older snapshots read"""
+        shared = SharedKB(self.KB)
+        snapshot = shared.snapshot()
+        tables = dict(snapshot.tables)
+        shared.kb_assert(read.parse_input("fact: (auntof eva chen)"))
+        self.assertEqual(snapshot.tables, tables)
+        self.assertFalse(snapshot.kb_ask(read.parse_input("fact: (auntof ?X chen)")))
+        self.assertTrue(shared.kb_ask(read.parse_input("fact: (auntof ?X chen)")))
+        grandmother = self.KB._get_fact(read.parse_input("fact: (grandmotherof ada chen)"))
+        self.assertEqual(shared.supported_by(grandmother), list(grandmother.supported_by))
+        self.assertTrue(shared.supported_by(grandmother))
+        self.assertEqual(shared.supported_by(read.parse_input("fact: (auntof chen eva)")), [])
+
+    def test39(self):
+        """ensures constants no fact uses any more give their symbol ids back"""
+        import logical_classes
+        kb = KnowledgeBase([], [])
+        facts = [read.parse_input("fact: (visited user{} page{})".format(i, i)) for i in range(50)]
+        kb.kb_assert_many(facts)
+        for fact in facts:
+            kb.kb_retract(fact)
+        del facts, fact
+        gc.collect()
+        self.assertIsNone(Constant.interned.get("user0"))
+        self.assertNotIn("user0", logical_classes.symbol_ids)
+        size = len(logical_classes.symbol_names)
+        again = read.parse_input("fact: (visited user0 page0)")
+        self.assertEqual(len(logical_classes.symbol_names), size)
+        self.assertEqual(str(again.statement), "(visited user0 page0)")
+        self.assertIs(Term.by_id[again.statement.key[1]](), again.statement.terms[0])
+
+    def test40(self):
+        """ensures the fact store of a KB can be chosen when it is built"""
+        class TaggedStore(FactStore):
+            pass
+        facts = [read.parse_input("fact: (motherof ada bing)")]
+        kb = KnowledgeBase(facts, [], fact_store=TaggedStore)
+        self.assertIsInstance(kb.facts, TaggedStore)
+        self.assertTrue(kb.kb_ask(facts[0]))
+        self.KB.set_evaluation("grandmotherof", "lazy")
+        evaluator = MagicEvaluator(self.KB)
+        evaluator.solve(read.parse_input("fact: (grandmotherof ada ?X)").statement)
+        self.assertIsInstance(evaluator.scratch.facts, DemandStore)
+        self.assertIs(evaluator.scratch.facts.source, self.KB.facts)
+
+    def test41(self):
+        """ensures justifications only give graph nodes to facts and rules the KB stores"""
+        graph = self.KB.justifications
+        nodes = len(graph.nodes)
+        rule = self.KB.rules[0]
+        unstored = read.parse_input("fact: (motherof zoe yan)")
+        derived = Fact(read.parse_input("fact: (grandmotherof zoe xia)").statement, [[unstored, rule]])
+        with self.assertRaises(ValueError):
+            self.KB.kb_assert(derived)
+        self.assertIsNone(self.KB._get_fact(derived))
+        self.assertIsNone(unstored._graph)
+        stored = self.KB._get_fact(read.parse_input("fact: (grandmotherof ada chen)"))
+        with self.assertRaises(ValueError):
+            stored.supported_by.append([unstored, rule])
+        self.assertEqual(len(graph.nodes), nodes)
+        self.assertTrue(all(fr is None or self.KB._owns(fr) for fr in graph.nodes))
+
+    def test42(self):
+        """ensures the server leaves interpreter-wide settings alone unless asked"""
+        interval, frozen = sys.getswitchinterval(), gc.get_freeze_count()
+        async def session(server):
+            await server.start()
+            during = sys.getswitchinterval(), gc.get_freeze_count()
+            await server.close()
+            return during
+        default = asyncio.run(session(KBServer(SharedKB(self.KB))))
+        self.assertEqual(default, (interval, frozen))
+        self.assertEqual((sys.getswitchinterval(), gc.get_freeze_count()), (interval, frozen))
+        during = asyncio.run(session(KBServer(SharedKB(self.KB), switch_interval=0.0005, freeze_gc=True)))
+        self.assertAlmostEqual(during[0], 0.0005)
+        self.assertEqual((sys.getswitchinterval(), gc.get_freeze_count()), (interval, frozen))
+
+    def test43(self):
+        """ensures profiling counts the same derivations with the parallel and columnar engines"""
+        counted = []
+        for engine in (None, ParallelEngine(workers=2, min_pairs=0), ColumnarEngine(min_facts=0)):
+            kb = KnowledgeBase([], [], engine=engine) if engine else KnowledgeBase([], [])
+            with profiling(kb, file=None) as stats:
+                kb.kb_assert_many(read.read_tokenize('statements_kb4.txt') +
+                                  read.read_tokenize('statements_kb5.txt'))
+            counted.append((stats.counters(),
+                            sorted((str(p.rule.rhs), p.firings) for p in stats.rules.values())))
+            if isinstance(engine, ParallelEngine):
+                engine.close()
+        self.assertGreater(counted[0][0]['instantiations'], 0)
+        self.assertEqual(counted[1], counted[0])
+        self.assertEqual(counted[2], counted[0])
+
+class ReteKBTest(KBTest):
+    """Runs every KBTest against a KB using the Rete engine"""
+
+    def make_kb(self):
+        return KnowledgeBase([], [], engine=ReteEngine())
+
+    def test_rete_matches_currying(self):
+        """ensures the Rete engine derives the same facts, rules and justifications"""
+        kbs = [KnowledgeBase([], []), self.make_kb()]
+        for kb in kbs:
+            for item in read.read_tokenize('statements_kb2.txt'):
+                kb.kb_assert(item)
+        self.assertEqual(contents(kbs[0]), contents(kbs[1]))
+
+
+def contents(kb, ordered=False):
+    """The facts and rules of a KB with their asserted flags, justifications
+        and dependents, named so that KBs built in different ways compare
+        equal; everything is sorted unless ordered is set
+    """
+    def name(fr):
+        return str(fr.statement) if isinstance(fr, Fact) else str(fr.lhs) + str(fr.rhs)
+    arrange = list if ordered else sorted
+    return [arrange((name(fr), fr.asserted, arrange((name(f), name(r)) for f, r in fr.supported_by),
+                     arrange(name(s) for s in fr.supports_facts),
+                     arrange(name(s) for s in fr.supports_rules))
+                    for fr in store)
+            for store in (kb.facts, kb.rules)]
 
 def pprint_justification(answer):
     """Pretty prints (hence pprint) justifications for the answer.
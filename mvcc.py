@@ -0,0 +1,335 @@
+import sys
+import threading
+
+from util import *
+from logical_classes import *
+from student_code import KnowledgeBase
+
+# died epoch of a version that is still live
+LIVE = sys.maxsize
+
+
+class Version(object):
+    """One version of a fact: the fact was in the KB from epoch `born` up to,
+        but not including, epoch `died`
+
+    Attributes:
+        fact (Fact): the fact
+        born (int): first epoch the fact is visible in
+        died (int): first epoch the fact is no longer visible in, LIVE while
+            it is still in the KB
+    """
+    __slots__ = ('fact', 'born', 'died')
+
+    def __init__(self, fact, born):
+        """Constructor for Version
+
+        Args:
+            fact (Fact): the fact
+            born (int): epoch it was added in
+        """
+        self.fact = fact
+        self.born = born
+        self.died = LIVE
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        died = '' if self.died == LIVE else self.died
+        return 'Version({!r}, {}..{})'.format(self.fact.statement, self.born, died)
+
+
+class Snapshot(object):
+    """Read-only view of the facts of a SharedKB as of one epoch. Asking a
+        snapshot takes no lock and always sees the same facts, however many
+        writes happen meanwhile: the mapping of its version tables is never
+        changed once the snapshot has it (SharedKB copies it before adding a
+        table), the tables are only ever appended to, and versions outside
+        the snapshot's epoch are skipped.
+
+        Only fact membership is versioned, not justifications. The Facts
+        handed out are the KB's own, and their supported_by and supports_*
+        attributes are views over the KB's JustificationGraph, which writers
+        change (and renumber) under the write lock: read them through
+        SharedKB.supported_by rather than from the Facts.
+
+    Attributes:
+        epoch (int): the epoch the snapshot sees
+        tables (dictof list): version tables, see SharedKB
+        size (int): number of facts visible in the epoch
+    """
+    def __init__(self, epoch, tables, size):
+        """Constructor for Snapshot
+        """
+        super(Snapshot, self).__init__()
+        self.epoch = epoch
+        self.tables = tables
+        self.size = size
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Snapshot(epoch {}, {} facts)'.format(self.epoch, self.size)
+
+    def __len__(self):
+        """Number of facts in the snapshot
+        """
+        return self.size
+
+    def __iter__(self):
+        """Iterate over the facts in the snapshot
+        """
+        epoch = self.epoch
+        for table in list(self.tables.values()):
+            for version in table[0]:
+                if version.born <= epoch < version.died:
+                    yield version.fact
+
+    def _versions(self, statement):
+        """Versions of the facts that could match a statement (all epochs),
+            picked like FactStore.bucket picks its candidates
+        """
+        args = statement.key[1:]
+        table = self.tables.get((statement.predicate, len(args)))
+        if table is None:
+            return ()
+        best = table[0]
+        if not table[2]:
+            for position, arg in enumerate(args):
+                if arg < 0:
+                    continue
+                bucket = table[1][position].get(arg)
+                if bucket is None:
+                    return ()
+                if len(bucket) < len(best):
+                    best = bucket
+        return best
+
+    def kb_iter_ask(self, fact, limit=None):
+        """Ask the snapshot, yielding answers one at a time, see
+            KnowledgeBase.kb_iter_ask
+
+        Args:
+            fact (Fact|Statement) - pattern to match facts against
+            limit (int|None) - stop after this many answers
+
+        Yields:
+            (Bindings, listof Fact) - bindings of each matching fact, with the fact
+        """
+        statement = fact.statement if factq(fact) else fact
+        if limit is not None and limit <= 0:
+            return
+        matcher = compile_pattern(statement)
+        slots = [None] * len(matcher.names)
+        epoch = self.epoch
+        found = 0
+        for version in self._versions(statement):
+            if version.born <= epoch < version.died and matcher.match(version.fact.statement, slots):
+                yield matcher.bindings(slots), [version.fact]
+                found += 1
+                if found == limit:
+                    return
+
+    def kb_ask(self, fact):
+        """Ask the snapshot, see KnowledgeBase.kb_ask (forward mode)
+
+        Args:
+            fact (Fact) - Statement to be asked
+
+        Returns:
+            listof Bindings|False - list of Bindings if result found, False otherwise
+        """
+        bindings_lst = ListOfBindings()
+        for bindings, facts in self.kb_iter_ask(fact):
+            bindings_lst.add_bindings(bindings, facts)
+        return bindings_lst if bindings_lst.list_of_bindings else []
+
+    def kb_exists(self, fact):
+        """Whether any fact in the snapshot matches the pattern
+        """
+        for _ in self.kb_iter_ask(fact, limit=1):
+            return True
+        return False
+
+    def kb_count(self, fact):
+        """Number of facts in the snapshot matching the pattern
+        """
+        statement = fact.statement if factq(fact) else fact
+        matcher = compile_pattern(statement)
+        slots = [None] * len(matcher.names)
+        epoch = self.epoch
+        return sum(1 for version in self._versions(statement)
+                   if version.born <= epoch < version.died and
+                   matcher.match(version.fact.statement, slots))
+
+
+class SharedKB(object):
+    """A KnowledgeBase that many threads can use at once. Writes (asserts,
+        retracts, ingests) take turns on a lock; reads never wait for them.
+
+        Reads use multiversion concurrency control: every write batch is a
+        new epoch, and the facts it adds and removes (the KB's Delta, see
+        KnowledgeBase.subscribe) are recorded as Versions stamped with the
+        epoch they appear and disappear in. A reader takes the current
+        Snapshot, a single reference read, and sees exactly the facts of its
+        epoch for as long as it keeps it, while writers go on. Dead versions
+        are dropped by rebuilding the version tables once they outnumber the
+        live ones (copy-on-write: snapshots taken before keep the old tables),
+        and a table for a new predicate goes into a copy of the mapping the
+        latest snapshot reads.
+
+        Write only through the SharedKB; changing the wrapped KB directly
+        bypasses the lock.
+
+    Attributes:
+        kb (KnowledgeBase): the wrapped KB, changed under the write lock
+        epoch (int): epoch of the last write
+        tables (dictof list): maps (predicate, arity) to [versions, positions,
+            nonground] like the FactStore tables, but with lists of Versions
+            that writers only append to; nonground is set once a fact with
+            variables shows up
+        live (dictof Version): maps each fact in the KB to its live version
+        dead (int): versions in the tables that are no longer live
+        snapshot_ (Snapshot): the latest snapshot, see snapshot
+    """
+    def __init__(self, kb=None):
+        """Constructor for SharedKB
+
+        Args:
+            kb (KnowledgeBase|None): KB to share, a new empty one by default
+        """
+        super(SharedKB, self).__init__()
+        self.kb = kb if kb is not None else KnowledgeBase([], [])
+        self.epoch = 0
+        self.tables = {}
+        self.live = {}
+        self.dead = 0
+        self.snapshot_ = None
+        self._lock = threading.Lock()
+        for fact in self.kb.facts:
+            self._add_version(fact, 0)
+        self.snapshot_ = Snapshot(0, self.tables, len(self.live))
+        self.kb.subscribe(self._publish)
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'SharedKB(epoch {}, {} facts)'.format(self.epoch, len(self.live))
+
+    def snapshot(self):
+        """The facts as of the latest write, which stay the same for as long
+            as the returned Snapshot is used
+
+        Returns:
+            Snapshot
+        """
+        return self.snapshot_
+
+    def kb_ask(self, fact):
+        """Ask the latest snapshot, see Snapshot.kb_ask
+        """
+        return self.snapshot_.kb_ask(fact)
+
+    def kb_iter_ask(self, fact, limit=None):
+        """Ask the latest snapshot lazily, see Snapshot.kb_iter_ask
+        """
+        return self.snapshot_.kb_iter_ask(fact, limit)
+
+    def kb_exists(self, fact):
+        """See Snapshot.kb_exists
+        """
+        return self.snapshot_.kb_exists(fact)
+
+    def kb_count(self, fact):
+        """See Snapshot.kb_count
+        """
+        return self.snapshot_.kb_count(fact)
+
+    def supported_by(self, fact):
+        """The current justifications of a fact, read under the write lock.
+            Justifications are not versioned: this is the latest write's
+            view, whatever snapshot the fact came from.
+
+        Args:
+            fact (Fact): the fact
+
+        Returns:
+            listof list: its [fact, rule] pairs, empty if it is not in the KB
+        """
+        with self._lock:
+            stored = self.kb._get_fact(fact)
+            return list(stored.supported_by) if stored else []
+
+    def kb_assert(self, fact_rule):
+        """Assert a fact or rule, see KnowledgeBase.kb_assert
+        """
+        with self._lock:
+            self.kb.kb_assert(fact_rule)
+
+    def kb_assert_many(self, facts_rules):
+        """Assert facts and rules in bulk, see KnowledgeBase.kb_assert_many
+        """
+        with self._lock:
+            self.kb.kb_assert_many(facts_rules)
+
+    def kb_retract(self, fact):
+        """Retract a fact, see KnowledgeBase.kb_retract
+        """
+        with self._lock:
+            self.kb.kb_retract(fact)
+
+    def kb_ingest(self, facts=(), retract=()):
+        """Apply a micro-batch as one epoch, see KnowledgeBase.kb_ingest
+        """
+        with self._lock:
+            return self.kb.kb_ingest(facts, retract)
+
+    def _add_version(self, fact, epoch):
+        """Append a live version of a fact, born in an epoch, to its tables
+        """
+        version = self.live[fact] = Version(fact, epoch)
+        args = fact.statement.key[1:]
+        table = self.tables.get((fact.statement.predicate, len(args)))
+        if table is None:
+            if self.snapshot_ is not None and self.tables is self.snapshot_.tables:
+                self.tables = dict(self.tables)
+            table = [[], [{} for _ in args], False]
+            self.tables[(fact.statement.predicate, len(args))] = table
+        table[0].append(version)
+        for position, arg in enumerate(args):
+            table[1][position].setdefault(arg, []).append(version)
+            if arg < 0:
+                table[2] = True
+
+    def _publish(self, delta):
+        """KB subscriber: turn a write's Delta into the next epoch's versions
+            and make the next epoch's snapshot the latest
+        """
+        epoch = self.epoch + 1
+        for fact in delta.removed:
+            self.live.pop(fact).died = epoch
+            self.dead += 1
+        for fact in delta.added:
+            self._add_version(fact, epoch)
+        self.epoch = epoch
+        if self.dead > max(len(self.live), 1000):
+            self._compact()
+        self.snapshot_ = Snapshot(epoch, self.tables, len(self.live))
+
+    def _compact(self):
+        """Rebuild the version tables without the dead versions. The old
+            tables are left untouched for the snapshots still reading them.
+        """
+        tables = {}
+        for signature, table in self.tables.items():
+            versions = [version for version in table[0] if version.died == LIVE]
+            if not versions:
+                continue
+            positions = [{} for _ in table[1]]
+            for version in versions:
+                for position, arg in enumerate(version.fact.statement.key[1:]):
+                    positions[position].setdefault(arg, []).append(version)
+            tables[signature] = [versions, positions,
+                                 any(arg < 0 for position in positions for arg in position)]
+        self.tables = tables
+        self.dead = 0
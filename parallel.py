@@ -0,0 +1,159 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from util import *
+from logical_classes import *
+from student_code import InferenceEngine
+
+def _fire_slice(work):
+    """Fire the pairs of one slice of a round
+
+    Args:
+        work (tuple): (fact statements, (lhs, rhs) of rules, (fact index,
+            rule index) pairs, timed) of the slice, statements given as
+            tuples of names (see _names)
+
+    Returns:
+        (listof tuple, listof float|None): (position, derived) for each pair
+            that derives something, position being the pair's index in the
+            slice (see derive), and if timed the time each pair took
+    """
+    statements, rules, pairs, timed = work
+    statements = [Statement(list(names)) for names in statements]
+    rules = [([Statement(list(names)) for names in lhs], Statement(list(rhs)))
+             for lhs, rhs in rules]
+    derived = []
+    seconds = [] if timed else None
+    for position, (fact, rule) in enumerate(pairs):
+        if timed:
+            start = time.perf_counter()
+        result = derive(statements[fact], *rules[rule])
+        if timed:
+            seconds.append(time.perf_counter() - start)
+        if result is not None:
+            derived.append((position, result))
+    return derived, seconds
+
+
+def _names(statement):
+    """A statement as the tuple of its predicate and term names, which is
+        much cheaper to pickle than the Statement
+    """
+    return (statement.predicate,) + tuple(term.term.element for term in statement.terms)
+
+
+def derive(statement, lhs, rhs):
+    """What InferenceEngine.fc_infer derives from a fact and a rule, without a
+        KB to assert it into
+
+    Args:
+        statement (Statement): the fact's statement
+        lhs (listof Statement): the rule's LHS
+        rhs (Statement): the rule's RHS
+
+    Returns:
+        tuple|None: (rhs,) for a new fact, (lhs, rhs) for a new curried rule,
+            None if the fact does not match the rule's first LHS statement
+    """
+    matcher = compile_pattern(lhs[0])
+    slots = [None] * len(matcher.names)
+    if not matcher.match(statement, slots):
+        return None
+    new_rhs = matcher.substitute(rhs, slots)
+    if len(lhs) == 1:
+        return (new_rhs,)
+    return ([matcher.substitute(s, slots) for s in lhs[1:]], new_rhs)
+
+
+class ParallelEngine(InferenceEngine):
+    """InferenceEngine that fires the (fact, rule) pairs of each semi-naive
+        round of a bulk saturation (see InferenceEngine.saturate) across a
+        concurrent.futures process pool. Workers only match and instantiate;
+        the derived facts and curried rules come back with the position of
+        the pair that derived them and are asserted in pair order, exactly as
+        the sequential engine asserts them, so the KB ends up identical,
+        supported_by pairs included. Single kb_assert calls and small rounds
+        run sequentially. With a Stats attached (see instrument.profiling),
+        workers time each pair and the counters come out as with the
+        sequential engine.
+
+        The pool is started by the first parallel round and reused by the
+        following ones; each slice of a round is sent with the statements
+        and rules it uses. Call close() to stop the workers.
+
+        Pick it when constructing the KB:
+        KnowledgeBase([], [], engine=ParallelEngine(workers=8))
+
+    Attributes:
+        workers (int|None): number of worker processes, None for one per CPU
+        min_pairs (int): rounds with fewer pairs than this run sequentially,
+            since shipping them to the workers would cost more than it saves
+        pool (ProcessPoolExecutor|None): the worker pool, None until a round
+            needs it and after close
+    """
+    def __init__(self, workers=None, min_pairs=20000):
+        """Constructor for ParallelEngine
+
+        Args:
+            workers (int|None): number of worker processes
+            min_pairs (int): smallest round to run in parallel
+        """
+        super(ParallelEngine, self).__init__()
+        self.workers = workers if workers is not None else multiprocessing.cpu_count()
+        self.min_pairs = min_pairs
+        self.pool = None
+
+    def close(self):
+        """Shut the worker pool down; a later parallel round starts a new one
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def fire(self, pairs, kb):
+        """Fire a round's (fact, rule) pairs across the process pool
+        """
+        pairs = list(pairs)
+        if self.workers < 2 or len(pairs) < self.min_pairs:
+            return super(ParallelEngine, self).fire(pairs, kb)
+        pairs = [(fact, rule) for fact, rule in pairs if rule.rhs.predicate not in kb.lazy]
+        if not pairs:
+            return
+
+        # Number the facts and rules of each slice so each is sent to its
+        # worker only once
+        size = -(-len(pairs) // (4 * self.workers))
+        starts = range(0, len(pairs), size)
+        slices = []
+        for start in starts:
+            facts, rules, numbered = {}, {}, []
+            for fact, rule in pairs[start:start + size]:
+                numbered.append((facts.setdefault(fact, len(facts)),
+                                 rules.setdefault(rule, len(rules))))
+            slices.append(([_names(fact.statement) for fact in facts],
+                           [([_names(s) for s in rule.lhs], _names(rule.rhs))
+                            for rule in rules], numbered, kb.stats is not None))
+
+        for start, (derived, seconds) in zip(starts, self._pool().map(_fire_slice, slices)):
+            if seconds is not None and kb.stats is not None:
+                matched = set(position for position, _ in derived)
+                for position, took in enumerate(seconds):
+                    kb.stats.tested(position in matched)
+                    kb.stats.fired(pairs[start + position][1], position in matched, took)
+            for position, result in derived:
+                fact, rule = pairs[start + position]
+                support = [[fact, rule]]
+                if len(result) == 1:
+                    kb.kb_assert(Fact(result[0], support))
+                else:
+                    kb.kb_assert(Rule(list(result), support))
+
+    def _pool(self):
+        """The worker pool, started on first use
+        """
+        if self.pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=context)
+        return self.pool
@@ -0,0 +1,175 @@
+from util import *
+from logical_classes import *
+
+
+class Step(object):
+    """One step of a query plan: join the rows so far with the facts matching
+        one pattern
+
+    Attributes:
+        position (int): position of the pattern in the query
+        pattern (Statement): the pattern
+        strategy (str): 'scan' (first step: the matching facts are the rows),
+            'hash' (hash the matching facts on the join variables and probe
+            with each row), 'index' (look each row's value of a join variable
+            up in the FactStore index) or 'product' (no shared variables)
+        join_vars (listof str): variables of the pattern bound by earlier steps
+        index_position (int|None): argument position looked up by 'index'
+        estimate (float): estimated number of rows after this step
+    """
+    def __init__(self, position, pattern, strategy, join_vars, index_position, estimate):
+        """Constructor for Step
+        """
+        super(Step, self).__init__()
+        self.position = position
+        self.pattern = pattern
+        self.strategy = strategy
+        self.join_vars = join_vars
+        self.index_position = index_position
+        self.estimate = estimate
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Step({}, {}, {!r}, ~{:.0f} rows)'.format(
+            self.pattern, self.strategy, self.join_vars, self.estimate)
+
+
+def pattern_stats(facts, pattern):
+    """Cardinality statistics of a pattern, read off the FactStore tables
+
+    Args:
+        facts (FactStore): the KB's facts
+        pattern (Statement): the pattern
+
+    Returns:
+        (list|None, int): the FactStore table of the pattern's predicate and
+            arity (None if there are no such facts), and the number of facts
+            left after filtering on the pattern's constants (an upper bound)
+    """
+    args = pattern.key[1:]
+    table = facts.tables.get((pattern.predicate, len(args)))
+    if table is None:
+        return None, 0
+    count = len(table[0])
+    if not table[2]:
+        for position, arg in enumerate(args):
+            if arg > 0:
+                count = min(count, len(table[1][position].get(arg, ())))
+    return table, count
+
+
+def plan_query(facts, patterns):
+    """Order the patterns of a conjunctive query and pick a join strategy per
+        step. Greedy, cost based: each step takes the pattern expected to keep
+        the fewest rows, preferring patterns that share a variable with the
+        rows so far over cross products. A join on variables at positions with
+        d distinct values is expected to keep 1/d of the pairs. A join reads
+        either all the pattern's facts once ('hash') or, when there are few
+        rows, only the index bucket of each row's value ('index').
+
+    Args:
+        facts (FactStore): the KB's facts
+        patterns (listof Statement): the query
+
+    Returns:
+        listof Step
+    """
+    stats = [pattern_stats(facts, pattern) for pattern in patterns]
+    variables = [set(t.term.element for t in pattern.terms if is_var(t)) for pattern in patterns]
+    bound = set()
+    rows = 1.0
+    steps = []
+    remaining = list(range(len(patterns)))
+    while remaining:
+        best = None
+        for i in remaining:
+            table, count = stats[i]
+            join_vars = sorted(variables[i] & bound)
+            fanout = float(count)
+            index_position, index_distinct = None, 0
+            for position, term in enumerate(patterns[i].terms):
+                if is_var(term) and term.term.element in join_vars and table is not None:
+                    distinct = len(table[1][position])
+                    fanout /= max(distinct, 1)
+                    if distinct > index_distinct:
+                        index_position, index_distinct = position, distinct
+            estimate = rows * fanout
+            cost = (bool(steps) and not join_vars, estimate, count)
+            if best is None or cost < best[0]:
+                best = (cost, i, join_vars, estimate, index_position, index_distinct)
+        cost, i, join_vars, estimate, index_position, index_distinct = best
+        if not steps:
+            strategy = 'scan'
+        elif not join_vars:
+            strategy = 'product'
+        elif (index_position is not None and not stats[i][0][2] and
+              rows * len(stats[i][0][0]) / index_distinct < stats[i][1] + rows):
+            strategy = 'index'
+        else:
+            strategy = 'hash'
+        if strategy != 'index':
+            index_position = None
+        steps.append(Step(i, patterns[i], strategy, join_vars, index_position, estimate))
+        remaining.remove(i)
+        bound |= variables[i]
+        rows = max(estimate, 1.0)
+    return steps
+
+
+def run_query(facts, patterns):
+    """Evaluate a conjunctive query with the plan from plan_query
+
+    Args:
+        facts (FactStore): the KB's facts
+        patterns (listof Statement): the query
+
+    Returns:
+        listof tuple: one (bindings, matched) pair per answer, where bindings
+            (dictof int) maps variable names to interned ids and matched
+            (listof Fact) holds the fact matching each pattern, in query order
+    """
+    rows = [({}, {})]
+    for step in plan_query(facts, patterns):
+        matcher = compile_pattern(step.pattern)
+        slots = [None] * len(matcher.names)
+        names = matcher.names
+        join_vars = step.join_vars
+
+        def matches(candidates):
+            for fact in candidates:
+                if matcher.match(fact.statement, slots):
+                    yield fact, dict(zip(names, slots))
+
+        def extend(row, fact, values):
+            bindings = dict(row[0])
+            bindings.update(values)
+            matched = dict(row[1])
+            matched[step.position] = fact
+            return bindings, matched
+
+        result = []
+        if step.strategy == 'index':
+            table = facts.tables[(step.pattern.predicate, len(step.pattern.terms))]
+            index = table[1][step.index_position]
+            var = step.pattern.terms[step.index_position].term.element
+            for row in rows:
+                for fact, values in matches(list(index.get(row[0][var], ()))):
+                    if all(values[v] == row[0][v] for v in join_vars):
+                        result.append(extend(row, fact, values))
+        elif step.strategy == 'hash':
+            buckets = {}
+            for fact, values in matches(facts.candidates(step.pattern)):
+                buckets.setdefault(tuple(values[v] for v in join_vars), []).append((fact, values))
+            for row in rows:
+                for fact, values in buckets.get(tuple(row[0][v] for v in join_vars), ()):
+                    result.append(extend(row, fact, values))
+        else:
+            found = list(matches(facts.candidates(step.pattern)))
+            for row in rows:
+                for fact, values in found:
+                    result.append(extend(row, fact, values))
+        rows = result
+        if not rows:
+            break
+    return [(bindings, [matched[i] for i in range(len(patterns))]) for bindings, matched in rows]
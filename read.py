@@ -1,9 +1,36 @@
+import mmap
+import warnings
 from logical_classes import *
 
+class ParseError(ValueError):
+    """Raised for malformed facts and rules in a KB file
+
+    Attributes:
+        source (str): name of the file (or other input) being parsed
+        line (int): 1-based line of the offending token
+        column (int): 1-based column of the offending token
+        message (str): what is wrong
+    """
+    def __init__(self, message, line, column, source="<input>"):
+        super(ParseError, self).__init__(
+            "{}:{}:{}: {}".format(source, line, column, message))
+        self.source = source
+        self.line = line
+        self.column = column
+        self.message = message
+
+class ParseWarning(UserWarning):
+    """Warned, with the text of the ParseError, for each malformed item (or
+        line of text before the first item) the lenient readers skip
+    """
+
 # read_tokenize takes the name of a file, reads it in and tokenizes the
 # statements and rules in that file.
-def read_tokenize(file):
+def read_tokenize(file, strict=False):
     """Reads in a file and processes contents into lists of facts and rules.
+        Malformed facts and rules, and text before the first one, are skipped
+        with a ParseWarning giving their line and column, unless strict is
+        set; iter_tokenize raises ParseError for them.
 
     Args:
         file (file): A txt file with facts of the form (predicate subject
@@ -12,27 +39,200 @@ def read_tokenize(file):
         (fact3) such as "rule: ((inst ?x ?y) (isa ?y ?z)) -> (inst ?x ?z)".
         These facts and rules each go on a new line in the file and are looped
         over to build the two seperate lists of facts and rules.
+        strict (bool): raise ParseError for malformed items instead of
+        skipping them.
 
     Returns:
         A list of Facts and Rules.
     """
-    file = open(file, "r")
-    elements = []
-    current = ""
-    for line in file:
-        if line[0:5] in ("fact:", "rule:"):
-            elements.append(current)
-            current = line.rstrip()
+    return list(iter_tokenize(file, strict))
+
+def iter_tokenize(file, strict=True):
+    """Streams the facts and rules of a file one at a time, e.g. straight into
+        KnowledgeBase.kb_assert_many. The file is memory-mapped and read line
+        by line in a single pass, so files larger than memory can be loaded.
+
+    Args:
+        file (str): name of a file in the format read_tokenize expects
+        strict (bool): raise for malformed items, see iter_parse
+
+    Yields:
+        Fact|Rule: each fact and rule, in file order
+
+    Raises:
+        ParseError: with the line and column of the first malformed item
+    """
+    with open(file, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return
+        with mapped:
+            lines = (line.decode("utf-8") for line in iter(mapped.readline, b""))
+            for item in iter_parse(lines, file, strict):
+                yield item
+
+def iter_parse(lines, source="<input>", strict=True):
+    """Parses facts and rules from an iterable of lines. An item starts with
+        'fact:' or 'rule:' at the start of a line and runs until the next one,
+        so items may span several lines. '#' starts a comment running to the
+        end of the line.
+
+    Args:
+        lines (iterable of str): lines of KB text
+        source (str): name of the input, used in error messages
+        strict (bool): raise for malformed items and for text before the
+            first item; otherwise they are skipped with a ParseWarning, as
+            read_tokenize does
+
+    Yields:
+        Fact|Rule: each fact and rule, in order
+
+    Raises:
+        ParseError: with the line and column of the first malformed item
+    """
+    header = None
+    tokens = []
+    for number, line in enumerate(lines, 1):
+        if line[:5] in ("fact:", "rule:"):
+            if header is not None:
+                item = _parse_or_skip(header, tokens, source, strict)
+                if item is not None:
+                    yield item
+            header = (line[:4], number)
+            tokens = []
+            start = 5
+        else:
+            start = 0
+        for token in _tokenize_line(line, number, start):
+            if header is None:
+                error = ParseError("expected 'fact:' or 'rule:', found {!r}".format(token[0]),
+                                   token[1], token[2], source)
+                if strict:
+                    raise error
+                _warn_skipped(error, "line")
+                break
+            tokens.append(token)
+    if header is not None:
+        item = _parse_or_skip(header, tokens, source, strict)
+        if item is not None:
+            yield item
+
+def _parse_or_skip(header, tokens, source, strict):
+    """_parse_item, returning None, with a ParseWarning, for a malformed
+        item unless strict
+    """
+    try:
+        return _parse_item(header, tokens, source)
+    except ParseError as error:
+        if strict:
+            raise
+        _warn_skipped(error, header[0])
+        return None
+
+def _warn_skipped(error, what):
+    """Warn that the fact, rule or line a ParseError is about was skipped
+    """
+    warnings.warn("{} ({} skipped)".format(error, what), ParseWarning)
+
+def _tokenize_line(line, number, start):
+    """Split one line into (text, line, column) tokens: '(', ')', '->' and
+        symbols, skipping whitespace and comments
+    """
+    i = start
+    end = len(line)
+    while i < end:
+        c = line[i]
+        if c.isspace():
+            i += 1
+        elif c == "#":
+            return
+        elif c in "()":
+            yield (c, number, i + 1)
+            i += 1
+        elif line.startswith("->", i):
+            yield ("->", number, i + 1)
+            i += 2
+        else:
+            j = i
+            while j < end and not line[j].isspace() and line[j] not in "()":
+                j += 1
+            yield (line[i:j], number, i + 1)
+            i = j
+
+def _parse_item(header, tokens, source):
+    """Build the Fact or Rule for the tokens of one item
+
+    Args:
+        header (tuple): ('fact' or 'rule', line number of the header)
+        tokens (listof tuple): (text, line, column) tokens following the header
+        source (str): name of the input, used in error messages
+
+    Returns:
+        Fact|Rule
+    """
+    kind, line = header
+    # Read the tokens into nested lists; atoms stay (text, line, column) tuples
+    stack = [[]]
+    opened = []
+    for token in tokens:
+        if token[0] == "(":
+            stack.append([])
+            opened.append(token)
+        elif token[0] == ")":
+            if len(stack) == 1:
+                raise ParseError("unmatched ')'", token[1], token[2], source)
+            group = stack.pop()
+            opened.pop()
+            stack[-1].append(group)
         else:
-            current = current + " " + line.rstrip().strip()
-    elements.append(current)
-    output = []
-    for e in elements:
-        parsed = parse_input(e)
-        if isinstance(parsed, Fact) or isinstance(parsed, Rule):
-            output.append(parsed)
-    file.close()
-    return output
+            stack[-1].append(token)
+    if opened:
+        raise ParseError("unclosed '('", opened[-1][1], opened[-1][2], source)
+    elements = stack[0]
+    if not elements:
+        raise ParseError("empty " + kind, line, 1, source)
+
+    if kind == "fact":
+        return Fact(_statement(elements, (line, 1), source))
+
+    # Accept both ((lhs...) -> rhs) and (lhs...) -> rhs
+    while len(elements) == 1 and isinstance(elements[0], list):
+        elements = elements[0]
+    arrows = [i for i, e in enumerate(elements) if isinstance(e, tuple) and e[0] == "->"]
+    if len(arrows) != 1:
+        where = elements[arrows[1]] if arrows else (None, line, 1)
+        raise ParseError("a rule needs exactly one '->'", where[1], where[2], source)
+    lhs, rhs = elements[:arrows[0]], elements[arrows[0] + 1:]
+    arrow = elements[arrows[0]]
+    if not lhs:
+        raise ParseError("rule has an empty left hand side", arrow[1], arrow[2], source)
+    if len(lhs) == 1 and isinstance(lhs[0], list) and lhs[0] and all(isinstance(e, list) for e in lhs[0]):
+        lhs = lhs[0]
+    if all(isinstance(e, tuple) for e in lhs):
+        lhs = [lhs]
+    statements = [_statement([e], (arrow[1], arrow[2]), source) for e in lhs]
+    return Rule([statements, _statement(rhs, (arrow[1], arrow[2]), source)])
+
+def _statement(elements, where, source):
+    """Turn parsed elements holding exactly one statement, e.g. a single
+        (pred arg ...) group or bare atoms, into a list of strings
+    """
+    while len(elements) == 1 and isinstance(elements[0], list):
+        elements = elements[0]
+    if not elements:
+        raise ParseError("empty statement", where[0], where[1], source)
+    for element in elements:
+        if isinstance(element, list):
+            first = element
+            while isinstance(first, list) and first:
+                first = first[0]
+            at = first if isinstance(first, tuple) else (None,) + where
+            raise ParseError("expected a single statement", at[1], at[2], source)
+        if element[0] == "->":
+            raise ParseError("unexpected '->'", element[1], element[2], source)
+    return [element[0] for element in elements]
 
 
 def parse_input(e):
@@ -62,7 +262,8 @@ def parse_input(e):
         #return (RULE, [lhs, rhs])
         return Rule([lhs, rhs])
     else:
-        print("PARSE ERROR: input header", e[0:5], "not recognized.")
+        error = ParseError("input header {!r} not recognized".format(e[0:5]), 1, 1)
+        print("PARSE ERROR:", error)
 
 def get_new_fact_or_rule():
     """Creates a new fact or rule. (instead of args, we use command line input
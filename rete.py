@@ -0,0 +1,292 @@
+import time
+
+from util import *
+from logical_classes import *
+from student_code import InferenceEngine
+
+
+class AlphaMemory(object):
+    """Facts matching one LHS statement of one or more productions
+
+    Attributes:
+        pattern (Statement): the LHS statement facts are matched against
+        facts (dictof dict): maps each matching Fact to the bindings (variable
+            name => value) of the pattern against that fact
+        joins (listof JoinNode): join nodes fed by this memory
+    """
+    def __init__(self, pattern):
+        """Constructor for AlphaMemory
+
+        Args:
+            pattern (Statement): LHS statement this memory collects facts for
+        """
+        super(AlphaMemory, self).__init__()
+        self.pattern = pattern
+        self.facts = {}
+        self.joins = []
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'AlphaMemory({!r}, {} facts)'.format(self.pattern, len(self.facts))
+
+
+class JoinNode(object):
+    """Joins the partial matches (tokens) of LHS statements 0..level-1 of a
+        production with the facts matching LHS statement `level`. Tokens and
+        facts are both hashed on the values of the variables they share, so an
+        activation only visits the pairs that actually join.
+
+    Attributes:
+        production (Rule): rule whose LHS this join belongs to
+        level (int): position of the joined statement in production.lhs
+        alpha (AlphaMemory): memory of facts matching production.lhs[level]
+        join_vars (tuple of str): variables of production.lhs[level] bound by
+            earlier statements of the LHS
+        tokens (dictof dict): beta memory, maps join key values to the curried
+            Rules (with their bindings) waiting on production.lhs[level]
+        alpha_index (dictof dict): maps join key values to alpha facts (with
+            their bindings)
+    """
+    def __init__(self, production, level, alpha, join_vars):
+        """Constructor for JoinNode
+        """
+        super(JoinNode, self).__init__()
+        self.production = production
+        self.level = level
+        self.alpha = alpha
+        self.join_vars = join_vars
+        self.tokens = {}
+        self.alpha_index = {}
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'JoinNode({!r}, {})'.format(self.production.lhs[self.level], self.level)
+
+    def key(self, bindings):
+        """Values of the join variables in the given bindings
+        """
+        return tuple(bindings[v] for v in self.join_vars)
+
+
+class ReteEngine(InferenceEngine):
+    """Rete network alternative to the currying InferenceEngine. Asserted and
+        otherwise non-derived rules become productions with one alpha memory per
+        LHS statement (shared between productions using the same statement) and
+        one join node per LHS statement. A partial match of the first k LHS
+        statements is a token; each token is materialized as the same curried
+        Rule InferenceEngine would create, so the KB ends up with the same facts,
+        rules and supported_by justifications. Adding a fact only costs the
+        alpha tests for its predicate plus the joins it actually takes part in.
+
+        Pick it when constructing the KB: KnowledgeBase([], [], engine=ReteEngine())
+
+    Attributes:
+        alphas (dictof AlphaMemory): maps LHS statements to their memories
+        alphas_by_signature (dictof list): maps (predicate, arity) to the
+            alpha memories with that signature
+        productions (dictof list): maps production Rules to their join nodes
+        token_of (dictof tuple): maps curried Rules to the (JoinNode, bindings)
+            they are waiting in
+    """
+    def __init__(self):
+        """Constructor for ReteEngine
+        """
+        super(ReteEngine, self).__init__()
+        self.alphas = {}
+        self.alphas_by_signature = {}
+        self.productions = {}
+        self.token_of = {}
+
+    def attach(self, kb):
+        """Register the rules the KB was constructed with as productions. As
+            with InferenceEngine, they are not fired against the initial facts.
+        """
+        for rule in kb.rules:
+            self._add_production(rule, kb, False)
+
+    def fact_added(self, fact, kb):
+        """Feed a new fact to every alpha memory it matches
+        """
+        signature = (fact.statement.predicate, len(fact.statement.terms))
+        for alpha in list(self.alphas_by_signature.get(signature, ())):
+            matcher = compile_pattern(alpha.pattern)
+            slots = [None] * len(matcher.names)
+            matched = matcher.match(fact.statement, slots)
+            if kb.stats is not None:
+                kb.stats.tested(matched)
+            if matched:
+                self._alpha_activate(alpha, fact, matcher.as_dict(slots), kb)
+
+    def rule_added(self, rule, kb):
+        """Store a new curried rule as a token, or build a new production
+        """
+        if rule in self.token_of:
+            join, bindings = self.token_of[rule]
+            self._left_activate(join, rule, bindings, kb)
+        else:
+            self._add_production(rule, kb, True)
+
+    def saturate(self, kb, facts, rules):
+        """Bulk load: feed the new facts to the existing productions, then add
+            the new rules. Rete is already incremental, so there are no rounds.
+        """
+        for fact in facts:
+            self.fact_added(fact, kb)
+        for rule in rules:
+            self.rule_added(rule, kb)
+
+    def fact_removed(self, fact, kb):
+        """Drop a removed fact from the alpha memories and join indexes
+        """
+        signature = (fact.statement.predicate, len(fact.statement.terms))
+        for alpha in self.alphas_by_signature.get(signature, ()):
+            bindings = alpha.facts.pop(fact, None)
+            if bindings is None:
+                continue
+            for join in alpha.joins:
+                if join.level:
+                    self._unindex(join.alpha_index, join.key(bindings), fact)
+
+    def rule_removed(self, rule, kb):
+        """Drop a removed curried rule from its beta memory, or tear down a
+            removed production
+        """
+        if rule in self.token_of:
+            join, bindings = self.token_of.pop(rule)
+            self._unindex(join.tokens, join.key(bindings), rule)
+        elif rule in self.productions:
+            for join in self.productions.pop(rule):
+                join.alpha.joins.remove(join)
+                for tokens in join.tokens.values():
+                    for token in tokens:
+                        self.token_of.pop(token, None)
+                if not join.alpha.joins:
+                    self._drop_alpha(join.alpha)
+
+    def _unindex(self, index, key, item):
+        """Remove item from the bucket at index[key], dropping empty buckets
+        """
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.pop(item, None)
+            if not bucket:
+                del index[key]
+
+    def _get_alpha(self, pattern, kb):
+        """Get the alpha memory for pattern, building and filling it from the
+            KB's fact index if it does not exist yet
+        """
+        alpha = self.alphas.get(pattern)
+        if alpha is None:
+            alpha = AlphaMemory(pattern)
+            matcher = compile_pattern(pattern)
+            slots = [None] * len(matcher.names)
+            for fact in kb.facts.candidates(pattern):
+                if matcher.match(fact.statement, slots):
+                    alpha.facts[fact] = matcher.as_dict(slots)
+            self.alphas[pattern] = alpha
+            signature = (pattern.predicate, len(pattern.terms))
+            self.alphas_by_signature.setdefault(signature, []).append(alpha)
+        return alpha
+
+    def _drop_alpha(self, alpha):
+        """Forget an alpha memory no join uses anymore
+        """
+        del self.alphas[alpha.pattern]
+        signature = (alpha.pattern.predicate, len(alpha.pattern.terms))
+        self.alphas_by_signature[signature].remove(alpha)
+        if not self.alphas_by_signature[signature]:
+            del self.alphas_by_signature[signature]
+
+    def _add_production(self, rule, kb, fire):
+        """Build the alpha memories and join nodes for a production
+
+        Args:
+            rule (Rule): rule, as stored in the KB
+            kb (KnowledgeBase): the KB
+            fire (bool): whether to fire the rule against the facts already
+                in its first alpha memory. An existing production is only
+                fired again, e.g. when its predicate stops being lazy.
+        """
+        if rule in self.productions:
+            if fire:
+                join = self.productions[rule][0]
+                for fact, bindings in list(join.alpha.facts.items()):
+                    self._fire(join, fact, bindings, rule, {}, kb)
+            return
+        joins = []
+        bound = set()
+        for level, pattern in enumerate(rule.lhs):
+            alpha = self._get_alpha(pattern, kb)
+            names = [t.term.element for t in pattern.terms if is_var(t)]
+            join_vars = tuple(sorted(set(n for n in names if n in bound)))
+            bound.update(names)
+            join = JoinNode(rule, level, alpha, join_vars)
+            if level:
+                for fact, bindings in alpha.facts.items():
+                    join.alpha_index.setdefault(join.key(bindings), {})[fact] = bindings
+            alpha.joins.append(join)
+            joins.append(join)
+        self.productions[rule] = joins
+        if fire:
+            for fact, bindings in list(joins[0].alpha.facts.items()):
+                self._fire(joins[0], fact, bindings, rule, {}, kb)
+
+    def _alpha_activate(self, alpha, fact, bindings, kb):
+        """A fact entered an alpha memory: index it for every join on the
+            memory and join it with the waiting tokens
+        """
+        if fact in alpha.facts:
+            return
+        alpha.facts[fact] = bindings
+        for join in list(alpha.joins):
+            if not join.level:
+                self._fire(join, fact, bindings, join.production, {}, kb)
+                continue
+            key = join.key(bindings)
+            join.alpha_index.setdefault(key, {})[fact] = bindings
+            for token, token_bindings in list(join.tokens.get(key, {}).items()):
+                self._fire(join, fact, bindings, token, token_bindings, kb)
+
+    def _left_activate(self, join, token, bindings, kb):
+        """A token (curried rule) entered the beta memory of a join: join it
+            with the matching facts of the join's alpha memory
+        """
+        key = join.key(bindings)
+        join.tokens.setdefault(key, {})[token] = bindings
+        for fact, fact_bindings in list(join.alpha_index.get(key, {}).items()):
+            self._fire(join, fact, fact_bindings, token, bindings, kb)
+
+    def _fire(self, join, fact, fact_bindings, parent, token_bindings, kb):
+        """Extend a partial match with a fact, asserting the resulting fact or
+            curried rule with [fact, parent] as its support
+
+        Args:
+            join (JoinNode): join the fact and partial match meet at
+            fact (Fact): fact matching production.lhs[join.level]
+            fact_bindings (dict): bindings of that match
+            parent (Rule): the production, or the curried rule of the token
+            token_bindings (dict): bindings of the partial match
+            kb (KnowledgeBase): the KB
+        """
+        production = join.production
+        if production.rhs.predicate in kb.lazy:
+            return
+        stats = kb.stats
+        if stats is not None:
+            start = time.perf_counter()
+        bindings = dict(token_bindings)
+        bindings.update(fact_bindings)
+        support = [[fact, parent]]
+        if join.level == len(production.lhs) - 1:
+            kb.kb_assert(Fact(substitute(production.rhs, bindings), support))
+        else:
+            rest = [substitute(s, bindings) for s in production.lhs[join.level + 1:]]
+            new_rule = Rule([rest, substitute(production.rhs, bindings)], support)
+            if new_rule not in self.token_of and new_rule not in kb.rules:
+                self.token_of[new_rule] = (self.productions[production][join.level + 1], bindings)
+            kb.kb_assert(new_rule)
+        if stats is not None:
+            stats.fired(parent, True, time.perf_counter() - start)
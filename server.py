@@ -0,0 +1,259 @@
+"""asyncio server for a knowledge base. Run e.g.
+`python server.py --port 8348 statements_kb4.txt`, then send one request
+per line:
+
+    assert fact: (motherof ada bing)
+    assert rule: ((motherof ?x ?y)) -> (parentof ?x ?y)
+    retract fact: (motherof ada bing)
+    ask fact: (parentof ?x bing)
+
+using the syntax of read.parse_input. Each request gets one line of JSON
+back: {"ok": true, "epoch": 3} for writes, {"ok": true, "answers":
+["?X : ada"]} for asks and {"ok": false, "error": "..."} for bad requests.
+"""
+import argparse
+import asyncio
+import collections
+import gc
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from logical_classes import Fact
+from mvcc import SharedKB
+import read
+
+
+class KBServer(object):
+    """Serves a SharedKB over a local socket.
+
+        Asks are answered on the event loop from the latest snapshot, which
+        never waits for writes. Writes are queued, and whatever is queued
+        when the writer gets to it goes to the KB as one kb_ingest batch (one
+        saturation pass), run on a writer thread so that forward chaining
+        stays off the event loop. A write is acknowledged once it is visible
+        to asks, with the epoch it became visible in.
+
+        The writer thread still shares the GIL with the event loop: while a
+        batch saturates, asks only run when the writer is made to hand the
+        GIL over, every switch interval (the interpreter default is 5ms),
+        and a full garbage collection triggered by the writer stalls them
+        for its whole duration. Both are interpreter-wide settings, so a
+        KBServer leaves them alone unless asked: pass switch_interval to
+        shorten the switch interval while it runs, and freeze_gc to move
+        what is loaded before it starts out of the garbage collector's reach
+        (gc.freeze). serve() does both, since it owns its process. Large
+        batches still add latency to asks; `python bench.py server_writes`
+        measures it.
+
+    Attributes:
+        shared (SharedKB): the served KB
+        batch_size (int): most writes applied in one batch
+        switch_interval (float|None): thread switch interval to run with
+            (see sys.setswitchinterval), None to keep the interpreter's
+        freeze_gc (bool): whether start freezes the objects loaded so far
+            (see gc.freeze) and close unfreezes them
+        pending (deque): queued (command, fact or rule, future) writes
+        batches (int): write batches applied so far
+        writes (int): writes applied so far
+    """
+    def __init__(self, shared=None, batch_size=1000, switch_interval=None, freeze_gc=False):
+        """Constructor for KBServer
+
+        Args:
+            shared (SharedKB|None): KB to serve, a new empty one by default
+            batch_size (int): most writes applied in one batch
+            switch_interval (float|None): thread switch interval while
+                serving, None to leave it as it is
+            freeze_gc (bool): freeze the objects loaded before start
+        """
+        super(KBServer, self).__init__()
+        self.shared = shared if shared is not None else SharedKB()
+        self.batch_size = batch_size
+        self.switch_interval = switch_interval
+        self.freeze_gc = freeze_gc
+        self._previous_interval = None
+        self._froze = False
+        self.pending = collections.deque()
+        self.batches = 0
+        self.writes = 0
+        self.server = None
+        self._wakeup = None
+        self._writer = None
+        self._executor = ThreadPoolExecutor(1)
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        """Start listening
+
+        Args:
+            host (str): address to listen on
+            port (int): TCP port, 0 picks a free one (see address)
+            path (str|None): listen on this unix socket instead
+
+        Returns:
+            asyncio.base_events.Server
+        """
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.ensure_future(self._write_loop())
+        if self.switch_interval is not None:
+            self._previous_interval = sys.getswitchinterval()
+            sys.setswitchinterval(self.switch_interval)
+        if self.freeze_gc and not gc.get_freeze_count():
+            # what is loaded by now lives as long as the server: keep full
+            # collections, run under the GIL, from scanning it. If something
+            # else froze objects already, leave its freeze alone, since
+            # gc.unfreeze could not undo only ours
+            gc.collect()
+            gc.freeze()
+            self._froze = True
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server
+
+    def address(self):
+        """(host, port) the server listens on
+        """
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        """Stop listening and stop the writer
+        """
+        self.server.close()
+        await self.server.wait_closed()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown()
+        if self._previous_interval is not None:
+            sys.setswitchinterval(self._previous_interval)
+            self._previous_interval = None
+        if self._froze:
+            gc.unfreeze()
+            self._froze = False
+
+    async def request(self, line):
+        """Handle one request line
+
+        Args:
+            line (str): e.g. 'ask fact: (parentof ?x bing)'
+
+        Returns:
+            dict: the response
+        """
+        command, _, text = line.strip().partition(" ")
+        if command not in ("assert", "retract", "ask"):
+            return {"ok": False, "error": "unknown command {!r}".format(command)}
+        # read.parse_input syntax, checked by the stricter read.iter_parse
+        try:
+            items = list(read.iter_parse([text.strip()], "<request>"))
+        except read.ParseError as error:
+            return {"ok": False, "error": str(error)}
+        item = items[0] if len(items) == 1 else None
+        if item is None or (command != "assert" and not isinstance(item, Fact)):
+            return {"ok": False, "error": "cannot {} {!r}".format(command, text.strip())}
+        if command == "ask":
+            answers = self.shared.kb_ask(item)
+            return {"ok": True, "answers": [str(answers[i]) for i in range(len(answers))]}
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((command, item, future))
+        self._wakeup.set()
+        try:
+            return {"ok": True, "epoch": await future}
+        except Exception as error:
+            return {"ok": False, "error": "{}: {}".format(type(error).__name__, error)}
+
+    async def _handle(self, reader, writer):
+        """Serve one connection, one request line at a time
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.request(line.decode("utf-8"))
+                writer.write((json.dumps(response) + "\n").encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _next_batch(self):
+        """Take the next writes to apply together: retracts followed by
+            asserts, in the order they were queued
+        """
+        batch = []
+        while self.pending and len(batch) < self.batch_size:
+            if self.pending[0][0] == "retract" and batch and batch[-1][0] == "assert":
+                break
+            batch.append(self.pending.popleft())
+        return batch
+
+    async def _write_loop(self):
+        """Apply queued writes in batches, off the event loop
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.pending:
+                batch = self._next_batch()
+                facts = [item for command, item, _ in batch if command == "assert"]
+                retract = [item for command, item, _ in batch if command == "retract"]
+                try:
+                    await loop.run_in_executor(self._executor, self.shared.kb_ingest, facts, retract)
+                except Exception as error:
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(error)
+                    continue
+                self.batches += 1
+                self.writes += len(batch)
+                epoch = self.shared.snapshot().epoch
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_result(epoch)
+
+
+async def serve(files=(), host="127.0.0.1", port=8348, path=None):
+    """Load files into a new KB and serve it until cancelled, with a 0.5ms
+        thread switch interval and the loaded KB frozen (see KBServer)
+
+    Args:
+        files (listof str): files in the read.read_tokenize format to assert
+        host (str): address to listen on
+        port (int): TCP port
+        path (str|None): listen on this unix socket instead
+    """
+    shared = SharedKB()
+    for file in files:
+        shared.kb_assert_many(read.read_tokenize(file))
+    server = KBServer(shared, switch_interval=0.0005, freeze_gc=True)
+    await server.start(host, port, path)
+    print("Serving {} facts on {}".format(len(shared.snapshot()), path or "{}:{}".format(*server.address())))
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='files of facts and rules to load')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8348)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a unix socket')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.files, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
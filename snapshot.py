@@ -0,0 +1,194 @@
+"""Binary snapshots of knowledge bases, see KnowledgeBase.save_snapshot and
+KnowledgeBase.load_snapshot.
+
+A snapshot is a header followed by six sections. Every number is a
+little-endian 32 bit integer and every section starts on a 4 byte boundary:
+
+    header      MAGIC, then the symbol count, symbol bytes, statement ints,
+                fact count, rule ints and support edge count
+    symbols     symbol count + 1 offsets into the symbol bytes, followed by
+                the utf-8 names (predicates, constants and '?variables')
+    statements  for each distinct statement: its length, the symbol of its
+                predicate and the symbols of its terms
+    facts       for each fact: its statement and its asserted flag
+    rules       for each rule: its asserted flag, the number of LHS
+                statements, the LHS statements and the RHS statement
+    supports    for each [fact, rule] pair in a supported_by: the supported
+                item, the fact and the rule. Items are numbered facts first
+                (0..facts-1), then rules (facts..facts+rules-1)
+
+Statements, facts and rules refer to each other by position in their
+section. The sections are read straight out of a memory map as integer
+arrays, so loading skips parsing and inference altogether. Decoding is
+eager, not lazy: read_snapshot builds every Statement, Fact, Rule and
+support pair before it returns, since the KB's stores hold real objects.
+"""
+import mmap
+import struct
+import sys
+from array import array
+
+from logical_classes import Fact, Rule, Statement, Term
+
+MAGIC = b"KBSNAP01"
+HEADER = struct.Struct("<8s6I")
+
+
+def _ints(values):
+    """Little-endian bytes of a list of ints
+    """
+    ints = array("i", values)
+    if sys.byteorder == "big":
+        ints.byteswap()
+    return ints.tobytes()
+
+
+def write_snapshot(kb, path):
+    """Write the facts, rules and justifications of a KB to a snapshot file
+
+    Args:
+        kb (KnowledgeBase): KB to save
+        path (str): file to write
+    """
+    symbols = {}
+    names = []
+    statements = {}
+    statement_ints = []
+
+    def symbol(name):
+        index = symbols.get(name)
+        if index is None:
+            index = symbols[name] = len(names)
+            names.append(name)
+        return index
+
+    def statement(s):
+        index = statements.get(s)
+        if index is None:
+            index = statements[s] = len(statements)
+            statement_ints.append(len(s.terms) + 1)
+            statement_ints.append(symbol(s.predicate))
+            statement_ints.extend(symbol(t.term.element) for t in s.terms)
+        return index
+
+    facts = list(kb.facts)
+    rules = list(kb.rules)
+    position = {}
+    fact_ints = []
+    for fact in facts:
+        position[fact] = len(position)
+        fact_ints.append(statement(fact.statement))
+        fact_ints.append(int(fact.asserted))
+    rule_position = {}
+    rule_ints = []
+    for rule in rules:
+        rule_position[rule] = len(facts) + len(rule_position)
+        rule_ints.append(int(rule.asserted))
+        rule_ints.append(len(rule.lhs))
+        rule_ints.extend(statement(s) for s in rule.lhs)
+        rule_ints.append(statement(rule.rhs))
+    support_ints = []
+    for items, numbering in ((facts, position), (rules, rule_position)):
+        for item in items:
+            for f, r in item.supported_by:
+                support_ints.extend((numbering[item], position[f], rule_position[r]))
+
+    encoded = [name.encode("utf-8") for name in names]
+    offsets = [0]
+    for name in encoded:
+        offsets.append(offsets[-1] + len(name))
+    blob = b"".join(encoded)
+    blob += b"\0" * (-len(blob) % 4)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(names), len(blob), len(statement_ints),
+                            len(facts), len(rule_ints), len(support_ints) // 3))
+        for section in (_ints(offsets), blob, _ints(statement_ints), _ints(fact_ints),
+                        _ints(rule_ints), _ints(support_ints)):
+            f.write(section)
+
+
+def read_snapshot(path):
+    """Read the facts and rules of a snapshot file, with their asserted flags
+        and supported_by pairs restored (the supports_facts/supports_rules
+        lists follow from the pairs once the KB stores them)
+
+    Args:
+        path (str): file written by write_snapshot
+
+    Returns:
+        (listof Fact, listof Rule): facts and rules in the order they were saved
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            return _decode(view)
+        finally:
+            view.release()
+
+
+def _decode(view):
+    """Build every fact and rule, with its supported_by pairs, from the mapped
+        bytes of a snapshot
+    """
+    magic, nsymbols, nblob, nstatement, nfacts, nrule, nsupports = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("Not a knowledge base snapshot")
+    offset = HEADER.size
+    sections = []
+    for count in (nsymbols + 1, None, nstatement, 2 * nfacts, nrule, 3 * nsupports):
+        if count is None:
+            sections.append(view[offset:offset + nblob])
+            offset += nblob
+            continue
+        section = view[offset:offset + 4 * count]
+        if sys.byteorder == "big":
+            ints = array("i", section)
+            ints.byteswap()
+        else:
+            ints = section.cast("i")
+        sections.append(ints)
+        offset += 4 * count
+    offsets, blob, statement_ints, fact_ints, rule_ints, support_ints = sections
+    try:
+        blob = bytes(blob)
+        names = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(nsymbols)]
+        terms = {}
+        statements = []
+        i = 0
+        while i < nstatement:
+            length = statement_ints[i]
+            predicate = names[statement_ints[i + 1]]
+            args = []
+            for s in statement_ints[i + 2:i + 1 + length]:
+                term = terms.get(s)
+                if term is None:
+                    term = terms[s] = Term(names[s])
+                args.append(term)
+            statements.append(Statement([predicate] + args))
+            i += 1 + length
+
+        facts = []
+        for i in range(0, 2 * nfacts, 2):
+            fact = Fact(statements[fact_ints[i]])
+            fact.asserted = bool(fact_ints[i + 1])
+            facts.append(fact)
+        rules = []
+        i = 0
+        while i < nrule:
+            nlhs = rule_ints[i + 1]
+            lhs = [statements[s] for s in rule_ints[i + 2:i + 2 + nlhs]]
+            rule = Rule([lhs, statements[rule_ints[i + 2 + nlhs]]])
+            rule.asserted = bool(rule_ints[i])
+            rules.append(rule)
+            i += 3 + nlhs
+
+        items = facts + rules
+        for i in range(0, 3 * nsupports, 3):
+            item, f, r = items[support_ints[i]], facts[support_ints[i + 1]], items[support_ints[i + 2]]
+            item.supported_by.append([f, r])
+        return facts, rules
+    finally:
+        for section in sections:
+            if isinstance(section, memoryview):
+                section.release()
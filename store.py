@@ -0,0 +1,351 @@
+import heapq
+from operator import itemgetter
+
+
+class IndexedStore(object):
+    """Insertion-ordered container of Facts or Rules backed by a dict keyed on
+        the items themselves (see Fact.__hash__ and Rule.__hash__). Behaves like
+        the plain list the KnowledgeBase used to keep in `facts` and `rules`,
+        but membership, lookup and removal are O(1) instead of linear scans.
+
+    Attributes:
+        items (dictof Fact|Rule): maps each stored item to itself, so an equal
+            (but not identical) item can be used to find the stored one
+    """
+    def __init__(self, items=()):
+        """Constructor for IndexedStore
+
+        Args:
+            items (listof Fact|Rule): optional initial contents
+        """
+        super(IndexedStore, self).__init__()
+        self.items = {}
+        for item in items:
+            self.append(item)
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return '{}({!r})'.format(type(self).__name__, list(self.items))
+
+    def __len__(self):
+        """Define behavior of len, e.g. len(kb.facts)
+        """
+        return len(self.items)
+
+    def __iter__(self):
+        """Iterate over stored items in insertion order
+        """
+        return iter(list(self.items))
+
+    def __contains__(self, item):
+        """Define behavior of `in`, e.g. fact in kb.facts
+        """
+        return item in self.items
+
+    def __getitem__(self, position):
+        """Positional indexing kept for compatibility with code written against
+            the old list, e.g. kb.facts[kb.facts.index(fact)]. This is O(n);
+            use `get` to find the stored copy of an item.
+        """
+        return list(self.items)[position]
+
+    def get(self, item):
+        """Get the stored item equal to the item argument
+
+        Args:
+            item (Fact|Rule): item we're searching for
+
+        Returns:
+            Fact|Rule|None: matching stored item, None if there is none
+        """
+        return self.items.get(item)
+
+    def index(self, item):
+        """Position of the stored item equal to the item argument, raising
+            ValueError like list.index when it is missing. This is O(n).
+        """
+        if item in self.items:
+            for position, stored in enumerate(self.items):
+                if stored == item:
+                    return position
+        raise ValueError('{!r} is not in store'.format(item))
+
+    def append(self, item):
+        """Add an item, leaving an already stored equal item in place
+
+        Args:
+            item (Fact|Rule): item to add
+
+        Returns:
+            bool: True if the item was added, False if an equal one was stored
+        """
+        if item in self.items:
+            return False
+        self.items[item] = item
+        return True
+
+    def remove(self, item):
+        """Remove the stored item equal to the item argument, raising
+            ValueError like list.remove when it is missing
+
+        Args:
+            item (Fact|Rule): item to remove
+        """
+        try:
+            del self.items[item]
+        except KeyError:
+            raise ValueError('{!r} is not in store'.format(item))
+
+    def discard(self, item):
+        """Remove the stored item equal to the item argument if there is one
+        """
+        self.items.pop(item, None)
+
+
+class FactStore(IndexedStore):
+    """IndexedStore for Facts that also keeps a discrimination index keyed by
+        predicate, arity and the constant found at each argument position (a
+        first-argument index extended to every position). Lets kb_ask and the
+        inference engine visit only the facts that can match a statement.
+
+    Attributes:
+        tables (dictof list): maps (predicate, arity) to a list of
+            [all, positions, nonground], where `all` holds every fact with that
+            predicate and arity, `positions[i]` maps the interned id (see
+            Statement.key) of argument i to the facts holding it there, and
+            `nonground` counts facts with variables among their arguments
+    """
+    def __init__(self, items=()):
+        """Constructor for FactStore
+
+        Args:
+            items (listof Fact): optional initial contents
+        """
+        self.tables = {}
+        super(FactStore, self).__init__(items)
+
+    def append(self, fact):
+        """Add a fact and index it, see IndexedStore.append
+        """
+        if not super(FactStore, self).append(fact):
+            return False
+        args = fact.statement.key[1:]
+        table = self.tables.get((fact.statement.predicate, len(args)))
+        if table is None:
+            table = [{}, [{} for _ in args], 0]
+            self.tables[(fact.statement.predicate, len(args))] = table
+        table[0][fact] = fact
+        for position, arg in enumerate(args):
+            table[1][position].setdefault(arg, {})[fact] = fact
+            if arg < 0:
+                table[2] += 1
+        return True
+
+    def remove(self, fact):
+        """Remove a fact and unindex it, see IndexedStore.remove
+        """
+        fact = self.get(fact)
+        super(FactStore, self).remove(fact)
+        args = fact.statement.key[1:]
+        table = self.tables[(fact.statement.predicate, len(args))]
+        del table[0][fact]
+        for position, arg in enumerate(args):
+            bucket = table[1][position][arg]
+            del bucket[fact]
+            if not bucket:
+                del table[1][position][arg]
+            if arg < 0:
+                table[2] -= 1
+        if not table[0]:
+            del self.tables[(fact.statement.predicate, len(args))]
+
+    def discard(self, fact):
+        """Remove and unindex a fact if it is stored
+        """
+        if fact in self:
+            self.remove(fact)
+
+    def bucket(self, statement):
+        """Like candidates, but returns the index bucket itself (a dict keyed
+            by fact) instead of a copy, so iterating over a few of the
+            candidates does not cost a pass over all of them. The bucket must
+            not be modified, nor iterated over while facts are being added or
+            removed.
+
+        Args:
+            statement (Statement): statement (usually with variables) to look up
+
+        Returns:
+            dictof Fact: facts that may match the statement
+        """
+        args = statement.key[1:]
+        table = self.tables.get((statement.predicate, len(args)))
+        if table is None:
+            return {}
+        best = table[0]
+        if not table[2]:
+            for position, arg in enumerate(args):
+                if arg < 0:
+                    continue
+                bucket = table[1][position].get(arg)
+                if bucket is None:
+                    return {}
+                if len(bucket) < len(best):
+                    best = bucket
+        return best
+
+    def candidates(self, statement):
+        """Facts that could match the statement argument, in insertion order.
+            Only facts with the same predicate and arity are considered, and
+            when the statement has constant arguments only the smallest bucket
+            of facts sharing one of those constants at the same position is
+            returned. Candidates still need to be checked with util.match.
+
+        Args:
+            statement (Statement): statement (usually with variables) to look up
+
+        Returns:
+            listof Fact: facts that may match the statement
+        """
+        return list(self.bucket(statement))
+
+    def count(self, statement):
+        """Number of facts matching the statement, when the index alone tells:
+            the statement has at most one constant argument and no repeated
+            variable, and no stored fact of its predicate has variables
+
+        Args:
+            statement (Statement): statement to count matches of
+
+        Returns:
+            int|None: the number of matching facts, None if they need matching
+        """
+        args = statement.key[1:]
+        table = self.tables.get((statement.predicate, len(args)))
+        if table is None:
+            return 0
+        if table[2]:
+            return None
+        constants = [(position, arg) for position, arg in enumerate(args) if arg > 0]
+        variables = [arg for arg in args if arg < 0]
+        if len(constants) > 1 or len(set(variables)) != len(variables):
+            return None
+        if constants:
+            position, arg = constants[0]
+            return len(table[1][position].get(arg, ()))
+        return len(table[0])
+
+
+class RuleStore(IndexedStore):
+    """IndexedStore for Rules that also indexes them by their first LHS
+        statement, the one forward chaining matches facts against, so a new
+        fact only visits the rules it can trigger instead of every rule and
+        curried rule in the KB. Rules are filed under the predicate and arity
+        of that statement and, when it has one, under its first constant
+        argument; curried rules nearly always have one, so e.g. a new
+        (parentof bing chen) fact skips the (parentof ada ?y) rules.
+        Candidates come back in insertion order, like a scan of every rule.
+
+    Attributes:
+        tables (dictof list): maps (predicate, arity) to a list of [open,
+            positions], where `open` holds the rules whose first LHS statement
+            has no constant argument, and `positions` maps an argument position
+            to a dict mapping interned ids (see Statement.key) to the rules
+            whose first constant argument is that id at that position. Each
+            of these buckets maps its rules to their insertion sequence number.
+        sequence (int): sequence number of the next rule appended
+    """
+    def __init__(self, items=()):
+        """Constructor for RuleStore
+
+        Args:
+            items (listof Rule): optional initial contents
+        """
+        self.tables = {}
+        self.sequence = 0
+        super(RuleStore, self).__init__(items)
+
+    def _constant(self, rule):
+        """(position, id) of the first constant argument of a rule's first LHS
+            statement, None if it has none
+        """
+        for position, arg in enumerate(rule.lhs[0].key[1:]):
+            if arg > 0:
+                return position, arg
+        return None
+
+    def append(self, rule):
+        """Add a rule and index it, see IndexedStore.append
+        """
+        if not super(RuleStore, self).append(rule):
+            return False
+        first = rule.lhs[0]
+        table = self.tables.setdefault((first.predicate, len(first.terms)), [{}, {}])
+        constant = self._constant(rule)
+        if constant is None:
+            table[0][rule] = self.sequence
+        else:
+            position, arg = constant
+            table[1].setdefault(position, {}).setdefault(arg, {})[rule] = self.sequence
+        self.sequence += 1
+        return True
+
+    def remove(self, rule):
+        """Remove a rule and unindex it, see IndexedStore.remove
+        """
+        rule = self.get(rule)
+        super(RuleStore, self).remove(rule)
+        first = rule.lhs[0]
+        signature = (first.predicate, len(first.terms))
+        table = self.tables[signature]
+        constant = self._constant(rule)
+        if constant is None:
+            del table[0][rule]
+        else:
+            position, arg = constant
+            index = table[1][position]
+            del index[arg][rule]
+            if not index[arg]:
+                del index[arg]
+                if not index:
+                    del table[1][position]
+        if not table[0] and not table[1]:
+            del self.tables[signature]
+
+    def discard(self, rule):
+        """Remove and unindex a rule if it is stored
+        """
+        if rule in self:
+            self.remove(rule)
+
+    def candidates(self, statement):
+        """Rules whose first LHS statement could match the statement argument
+            (a fact's statement). Candidates still need to be checked with
+            util.match.
+
+        Args:
+            statement (Statement): statement of a fact
+
+        Returns:
+            listof Rule: rules that may be triggered by the fact, in the order
+                they were added
+        """
+        table = self.tables.get((statement.predicate, len(statement.terms)))
+        if table is None:
+            return []
+        buckets = [table[0]] if table[0] else []
+        if table[1]:
+            args = statement.key[1:]
+            for position, index in table[1].items():
+                arg = args[position]
+                if arg < 0:
+                    # a fact with variables: any constant there may match
+                    buckets.extend(index.values())
+                elif arg in index:
+                    buckets.append(index[arg])
+        if len(buckets) < 2:
+            return list(buckets[0]) if buckets else []
+        # each bucket is already in insertion order
+        return [rule for rule, _ in heapq.merge(*(bucket.items() for bucket in buckets),
+                                                 key=itemgetter(1))]
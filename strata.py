@@ -0,0 +1,163 @@
+"""Predicate dependency graph of the rules of a KB and its strata, see
+DependencyGraph. InferenceEngine.saturate runs one stratum at a time.
+"""
+
+
+class Stratum(object):
+    """A strongly connected component of the dependency graph: predicates
+        concluded by rules that only depend on each other and on the
+        predicates of earlier strata
+
+    Attributes:
+        predicates (frozenset of str): predicates of the component
+        inputs (frozenset of str): predicates appearing in the LHS of rules
+            concluding one of the predicates
+        recursive (bool): whether those rules can use their own conclusions,
+            e.g. ((isa ?x ?y) (isa ?y ?z)) -> (isa ?x ?z)
+    """
+    def __init__(self, predicates, inputs):
+        """Constructor for Stratum
+        """
+        super(Stratum, self).__init__()
+        self.predicates = frozenset(predicates)
+        self.inputs = frozenset(inputs)
+        self.recursive = not self.predicates.isdisjoint(self.inputs)
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Stratum({}{})'.format(' '.join(sorted(self.predicates)),
+                                      ', recursive' if self.recursive else '')
+
+
+class DependencyGraph(object):
+    """Which predicates feed which through the rules of a KB: an edge p -> q
+        for every rule with p in its LHS and q as its RHS predicate. Curried
+        rules add no new edges, but are counted so that edges go away with
+        the last rule holding them.
+
+    Attributes:
+        edges (dictof dict): maps p to {q: number of rules with p in the LHS
+            and q in the RHS}
+    """
+    def __init__(self, rules=()):
+        """Constructor for DependencyGraph
+
+        Args:
+            rules (iterable of Rule): initial rules
+        """
+        super(DependencyGraph, self).__init__()
+        self.edges = {}
+        self._strata = None
+        for rule in rules:
+            self.add_rule(rule)
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'DependencyGraph({!r})'.format(self.strata())
+
+    def __str__(self):
+        """Define external representation when printed: one stratum per line,
+            in the order they are saturated
+        """
+        return '\n'.join('{}: {}{}'.format(number, ' '.join(sorted(stratum.predicates)),
+                                           ' (recursive)' if stratum.recursive else '')
+                         for number, stratum in enumerate(self.strata(), 1))
+
+    def add_rule(self, rule):
+        """Add the edges of a rule
+        """
+        head = rule.rhs.predicate
+        for predicate in {statement.predicate for statement in rule.lhs}:
+            targets = self.edges.setdefault(predicate, {})
+            if head not in targets:
+                targets[head] = 0
+                self._strata = None
+            targets[head] += 1
+
+    def remove_rule(self, rule):
+        """Remove the edges of a rule
+        """
+        head = rule.rhs.predicate
+        for predicate in {statement.predicate for statement in rule.lhs}:
+            targets = self.edges[predicate]
+            targets[head] -= 1
+            if not targets[head]:
+                del targets[head]
+                if not targets:
+                    del self.edges[predicate]
+                self._strata = None
+
+    def components(self):
+        """Strongly connected components of the graph, by Tarjan's algorithm
+            run with an explicit stack
+
+        Returns:
+            listof listof str: the components, each before the components
+                depending on it
+        """
+        index, low, stack, on_stack, found = {}, {}, [], set(), []
+        for root in list(self.edges):
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.edges.get(root, ())))]
+            while work:
+                node, successors = work[-1]
+                for successor in successors:
+                    if successor not in index:
+                        index[successor] = low[successor] = len(index)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(self.edges.get(successor, ()))))
+                        break
+                    if successor in on_stack:
+                        low[node] = min(low[node], index[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        found.append(component)
+        # Tarjan finds a component after every component it leads to
+        found.reverse()
+        return found
+
+    def strata(self):
+        """The components holding predicates some rule concludes, as Strata,
+            each before the strata depending on it. Cached until the edges
+            change.
+
+        Returns:
+            listof Stratum
+        """
+        if self._strata is None:
+            inputs = {}
+            for predicate, targets in self.edges.items():
+                for head in targets:
+                    inputs.setdefault(head, set()).add(predicate)
+            self._strata = []
+            for component in self.components():
+                concluded = [predicate for predicate in component if predicate in inputs]
+                if concluded:
+                    self._strata.append(Stratum(component, set().union(*(inputs[p] for p in concluded))))
+        return self._strata
+
+    def stratum(self, predicate):
+        """The stratum of a predicate, None if no rule concludes it
+        """
+        for stratum in self.strata():
+            if predicate in stratum.predicates:
+                return stratum
+        return None
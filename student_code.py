@@ -1,14 +1,66 @@
 import read, copy
+import contextlib, functools, time
 from util import *
 from logical_classes import *
+from store import FactStore, RuleStore
+from agenda import Agenda
+import snapshot
+from backward import BackwardChainer
+from magic import MagicEvaluator
+from query import run_query
+from cache import AskCache
+from delta import Delta
+from strata import DependencyGraph
+from justification import JustificationGraph
 
 verbose = 0
 
+def _batch(method):
+    """Run a KnowledgeBase method as one batch of changes, whose Delta goes
+    to the subscribers when it returns (see KnowledgeBase._changes)
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._changes():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class KnowledgeBase(object):
-    def __init__(self, facts=[], rules=[]):
-        self.facts = facts
-        self.rules = rules
-        self.ie = InferenceEngine()
+    def __init__(self, facts=[], rules=[], engine=None, agenda=None, cache=None,
+                 fact_store=None):
+        """Constructor for KnowledgeBase
+
+        Args:
+            facts (listof Fact): initial facts, stored without inference
+            rules (listof Rule): initial rules, stored without inference
+            engine (InferenceEngine|None): inference engine to forward chain
+                with, e.g. rete.ReteEngine(); defaults to InferenceEngine()
+            agenda (Agenda|None): work queue ordering derived facts and rules,
+                e.g. Agenda("lifo") or Agenda(batch_size=1000) for the
+                bounded-memory mode; defaults to a FIFO Agenda()
+            cache (AskCache|None): cache of kb_ask answers, e.g.
+                AskCache(maxsize=10000), or AskCache(0) to disable it;
+                defaults to AskCache()
+            fact_store (callable|None): FactStore subclass, or factory called
+                with the initial facts, to keep the facts in, e.g. a
+                magic.DemandStore; defaults to FactStore
+        """
+        self.justifications = JustificationGraph(self._owns)
+        self.facts = (fact_store or FactStore)(self._own(fact) for fact in facts)
+        self.rules = RuleStore(self._own(rule) for rule in rules)
+        self.graph = DependencyGraph(self.rules)
+        for store in (self.facts, self.rules):
+            for fact_rule in store:
+                self.justifications.attach(fact_rule)
+        self.ie = engine if engine is not None else InferenceEngine()
+        self.agenda = agenda if agenda is not None else Agenda()
+        self.cache = cache if cache is not None else AskCache()
+        self.lazy = set()
+        self.subscribers = []
+        self._saturating = False
+        self._delta = None
+        self.stats = None
+        self.ie.attach(self)
 
     def __repr__(self):
         return 'KnowledgeBase({!r}, {!r})'.format(self.facts, self.rules)
@@ -29,9 +81,7 @@ class KnowledgeBase(object):
         Returns:
             Fact: matching fact
         """
-        for kbfact in self.facts:
-            if fact == kbfact:
-                return kbfact
+        return self.facts.get(fact)
 
     def _get_rule(self, rule):
         """INTERNAL USE ONLY
@@ -43,9 +93,101 @@ class KnowledgeBase(object):
         Returns:
             Rule: matching rule
         """
-        for kbrule in self.rules:
-            if rule == kbrule:
-                return kbrule
+        return self.rules.get(rule)
+
+    def _own(self, fact_rule):
+        """INTERNAL USE ONLY
+        A Fact or Rule can only be stored in one KB, being a node of its
+        JustificationGraph, and can only be justified by facts and rules of
+        that KB. Asserting one stored in another KB asserts a copy of it, and
+        the facts and rules of another KB in its supported_by pairs are
+        replaced by the equal ones of this KB.
+
+        Args:
+            fact_rule (Fact|Rule): fact or rule being asserted
+
+        Returns:
+            Fact|Rule: fact_rule, or the copy to assert
+
+        Raises:
+            ValueError: if a fact or rule of another KB justifying it is not
+                in this KB
+        """
+        if not isinstance(fact_rule, Justified) or fact_rule._graph is self.justifications:
+            return fact_rule
+        graph = fact_rule._graph
+        pairs = fact_rule._supported_by or () if graph is None else list(fact_rule.supported_by)
+        if graph is None and all(member._graph is None or member._graph is self.justifications
+                                 for pair in pairs for member in pair):
+            return fact_rule
+        pairs = [[self._translate(f, fact_rule), self._translate(r, fact_rule)] for f, r in pairs]
+        if graph is None:
+            fact_rule._supported_by = pairs
+            return fact_rule
+        if isinstance(fact_rule, Fact):
+            copied = Fact(fact_rule.statement, pairs)
+        else:
+            copied = Rule([fact_rule.lhs, fact_rule.rhs], pairs)
+        copied.asserted = fact_rule.asserted
+        return copied
+
+    def _owns(self, fact_rule):
+        """INTERNAL USE ONLY
+        Whether this very Fact or Rule is stored in the KB, see
+        JustificationGraph.owns
+        """
+        store = self.facts if isinstance(fact_rule, Fact) else self.rules
+        return store.get(fact_rule) is fact_rule
+
+    def _translate(self, member, fact_rule):
+        """INTERNAL USE ONLY
+        The fact or rule of this KB equal to member, a fact or rule in a
+        supported_by pair of fact_rule, see _own
+        """
+        if member._graph is None or member._graph is self.justifications:
+            return member
+        store = self.facts if isinstance(member, Fact) else self.rules
+        own = store.get(member)
+        if own is None:
+            raise ValueError('{} {} is supported by a {} that is not in this knowledge base'.format(
+                fact_rule.name, fact_rule.statement if isinstance(fact_rule, Fact) else fact_rule.rhs,
+                member.name))
+        return own
+
+    def _insert(self, fact_rule):
+        """INTERNAL USE ONLY
+        Store a fact or rule without running inference. If an equal one is
+        already stored, merge the new support into it (or mark it asserted).
+
+        Args:
+            fact_rule (Fact|Rule): the fact or rule to store
+
+        Returns:
+            bool: True if fact_rule was new to the KB and is now stored
+        """
+        store = self.facts if isinstance(fact_rule, Fact) else self.rules
+        if fact_rule not in store:
+            if self.stats is not None and fact_rule.supported_by:
+                self.stats.stored(fact_rule, True)
+            self.justifications.attach(fact_rule)
+            store.append(fact_rule)
+            if store is self.facts:
+                self.cache.invalidate(fact_rule.statement.key[0])
+                if self._delta is not None:
+                    self._delta.fact_added(fact_rule)
+            else:
+                self.graph.add_rule(fact_rule)
+            return True
+        kbfact_rule = store.get(fact_rule)
+        if fact_rule.supported_by:
+            # a justification the KB already has is absorbed: the graph is
+            # left as it is
+            added = [pair for pair in fact_rule.supported_by if kbfact_rule.supported_by.append(pair)]
+            if self.stats is not None:
+                self.stats.stored(fact_rule, False, len(fact_rule.supported_by) - len(added))
+        else:
+            kbfact_rule.asserted = True
+        return False
 
     def kb_add(self, fact_rule):
         """Add a fact or rule to the KB
@@ -54,33 +196,14 @@ class KnowledgeBase(object):
         Returns:
             None
         """
-        printv("Adding {!r}", 1, verbose, [fact_rule])
+        if verbose > 1:
+            printv("Adding {!r}", 1, verbose, [fact_rule])
         if isinstance(fact_rule, Fact):
-            if fact_rule not in self.facts:
-                self.facts.append(fact_rule)
-                for rule in self.rules:
-                    self.ie.fc_infer(fact_rule, rule, self)
-            else:
-                if fact_rule.supported_by:
-                    ind = self.facts.index(fact_rule)
-                    for f in fact_rule.supported_by:
-                        self.facts[ind].supported_by.append(f)
-                else:
-                    ind = self.facts.index(fact_rule)
-                    self.facts[ind].asserted = True
+            if self._insert(fact_rule):
+                self.ie.fact_added(fact_rule, self)
         elif isinstance(fact_rule, Rule):
-            if fact_rule not in self.rules:
-                self.rules.append(fact_rule)
-                for fact in self.facts:
-                    self.ie.fc_infer(fact, fact_rule, self)
-            else:
-                if fact_rule.supported_by:
-                    ind = self.rules.index(fact_rule)
-                    for f in fact_rule.supported_by:
-                        self.rules[ind].supported_by.append(f)
-                else:
-                    ind = self.rules.index(fact_rule)
-                    self.rules[ind].asserted = True
+            if self._insert(fact_rule):
+                self.ie.rule_added(fact_rule, self)
 
     def kb_assert(self, fact_rule):
         """Assert a fact or rule into the KB
@@ -89,26 +212,220 @@ class KnowledgeBase(object):
             fact_rule (Fact or Rule): Fact or Rule we're asserting
         """
         printv("Asserting {!r}", 0, verbose, [fact_rule])
-        self.kb_add(fact_rule)
+        self.agenda.push(self._own(fact_rule))
+        if not self._saturating:
+            self._saturate()
+
+    def kb_assert_many(self, facts_rules):
+        """Assert many facts and rules at once, e.g. the output of
+        read.read_tokenize. Everything is stored first and the KB is then
+        saturated in one go (semi-naively for InferenceEngine, see
+        InferenceEngine.saturate) instead of rescanning the KB per item. The
+        resulting facts, rules and justifications are the same as asserting
+        the items one at a time.
+
+        Args:
+            facts_rules (iterable of Fact|Rule): facts and rules to assert
+        """
+        if self._saturating:
+            for fact_rule in facts_rules:
+                self.kb_assert(fact_rule)
+            return
+        self._saturate(facts_rules)
+
+    @_batch
+    def _saturate(self, facts_rules=(), rules=()):
+        """INTERNAL USE ONLY
+        Add queued facts and rules to the KB until the agenda is empty. The
+        engine asserts what it derives while we are in here, which only queues
+        it, so inference runs iteratively instead of recursing through kb_assert.
+
+        Args:
+            facts_rules (iterable of Fact|Rule): items to store first and hand
+                to the engine's bulk saturate, see kb_assert_many
+            rules (listof Rule): rules already in the KB to fire again, see
+                set_evaluation
+        """
+        self._saturating = True
+        try:
+            new_facts, new_rules = [], list(rules)
+            for fact_rule in facts_rules:
+                if verbose:
+                    printv("Asserting {!r}", 0, verbose, [fact_rule])
+                fact_rule = self._own(fact_rule)
+                if isinstance(fact_rule, Fact) and self._insert(fact_rule):
+                    new_facts.append(fact_rule)
+                elif isinstance(fact_rule, Rule) and self._insert(fact_rule):
+                    new_rules.append(fact_rule)
+            if new_facts or new_rules:
+                self.ie.saturate(self, new_facts, new_rules)
+            while self.agenda:
+                for fact_rule in self.agenda.pop_batch():
+                    self.kb_add(fact_rule)
+        except BaseException:
+            self.agenda.clear()
+            raise
+        finally:
+            self._saturating = False
+
+    def kb_ingest(self, facts=(), retract=()):
+        """Apply one micro-batch of a stream of changes: retract some facts,
+            then assert new facts (and rules) in bulk, see kb_assert_many.
+            Subscribers are told about the batch's net change once, at the end.
+
+        Args:
+            facts (iterable of Fact|Rule): facts and rules to assert
+            retract (iterable of Fact): facts to retract first
+
+        Returns:
+            Delta: the facts added and removed by the batch, derived ones included
+        """
+        with self._changes(True) as delta:
+            for fact in retract:
+                self.kb_retract(fact)
+            self.kb_assert_many(facts)
+        return delta
+
+    def subscribe(self, callback):
+        """Call callback(delta) with the Delta of every assert, retract or
+            ingest batch that adds or removes facts
+
+        Args:
+            callback (function): called with a Delta after each such batch
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Stop calling a callback passed to subscribe
+        """
+        self.subscribers.remove(callback)
 
-    def kb_ask(self, fact):
+    @contextlib.contextmanager
+    def _changes(self, record=False):
+        """INTERNAL USE ONLY
+        Collect the facts added and removed in a with block into a Delta and
+        hand it to the subscribers when the outermost block ends. Nothing is
+        collected if nobody subscribed, unless record is True.
+
+        Args:
+            record (bool): collect the Delta even without subscribers
+
+        Yields:
+            Delta|None: the Delta being collected
+        """
+        if self._delta is not None or not (record or self.subscribers):
+            yield self._delta
+            return
+        delta = self._delta = Delta()
+        try:
+            yield delta
+        finally:
+            self._delta = None
+            if delta:
+                for callback in list(self.subscribers):
+                    callback(delta)
+
+    def set_evaluation(self, predicate, mode):
+        """Choose how facts with a predicate are derived. 'eager' (the
+            default) materializes them by forward chaining as rules and facts
+            are asserted. 'lazy' leaves them out of forward chaining: rules
+            concluding the predicate are stored but not fired, and its facts
+            are only proved on demand by kb_ask(fact, mode="backward"). Making
+            a lazy predicate eager again forward chains its rules over the
+            current facts.
+
+            Rules concluding an eager predicate from a lazy one only fire on
+            asserted facts of the lazy predicate, so their conclusions are
+            complete in backward mode only.
+
+        Args:
+            predicate (str): predicate, e.g. 'isa'
+            mode (str): 'eager' or 'lazy'
+        """
+        if mode not in ("eager", "lazy"):
+            raise ValueError("Unknown evaluation mode: {!r}".format(mode))
+        if mode == "lazy":
+            self.lazy.add(predicate)
+        elif predicate in self.lazy:
+            self.lazy.discard(predicate)
+            rules = [rule for rule in self.rules if rule.rhs.predicate == predicate]
+            if rules:
+                self._saturate(rules=rules)
+
+    def save_snapshot(self, path):
+        """Save the facts, rules and justifications of the KB to a binary
+            snapshot file (see snapshot.py), e.g. once it has been saturated
+
+        Args:
+            path (str): file to write
+        """
+        snapshot.write_snapshot(self, path)
+
+    @classmethod
+    def load_snapshot(cls, path, engine=None, agenda=None, cache=None):
+        """Build a KB from a snapshot written by save_snapshot. The file is
+            memory-mapped and its integer tables are decoded eagerly, in one
+            linear pass: every Fact, Rule and support edge is built before
+            this returns, so loading still takes time linear in the size of
+            the KB, but no text is parsed and nothing is re-derived. Facts,
+            rules, asserted flags and the supported_by/supports_facts/
+            supports_rules links come back as saved.
+
+        Args:
+            path (str): file written by save_snapshot
+            engine (InferenceEngine|None): inference engine, see __init__
+            agenda (Agenda|None): work queue, see __init__
+            cache (AskCache|None): cache of kb_ask answers, see __init__
+
+        Returns:
+            KnowledgeBase
+        """
+        facts, rules = snapshot.read_snapshot(path)
+        return cls(facts, rules, engine, agenda, cache)
+
+    def kb_ask(self, fact, mode="forward"):
         """Ask if a fact is in the KB
 
         Args:
             fact (Fact) - Statement to be asked (will be converted into a Fact)
+            mode (str) - 'forward' looks the fact up among the facts forward
+                chaining has derived; 'backward' also proves it on demand from
+                the rules, see BackwardChainer and set_evaluation. Each binding
+                comes with the fact it matched; in backward mode that may be a
+                proved Fact (not stored in the KB) with its justification.
+                'magic' derives the same answers as 'backward', but bottom-up
+                with the rules rewritten for the asked constants, see
+                MagicEvaluator.
 
         Returns:
             listof Bindings|False - list of Bindings if result found, False otherwise
         """
-        print("Asking {!r}".format(fact))
+        printv("Asking {!r}", 0, verbose, [fact])
+        if mode not in ("forward", "backward", "magic"):
+            raise ValueError("Unknown ask mode: {!r}".format(mode))
         if factq(fact):
-            f = Fact(fact.statement)
             bindings_lst = ListOfBindings()
-            # ask matched facts
-            for fact in self.facts:
-                binding = match(f.statement, fact.statement)
-                if binding:
-                    bindings_lst.add_bindings(binding, [fact])
+            if mode != "forward":
+                matcher = compile_pattern(fact.statement)
+                slots = [None] * len(matcher.names)
+                prover = BackwardChainer(self) if mode == "backward" else MagicEvaluator(self)
+                for proved in prover.solve(fact.statement):
+                    if matcher.match(proved.statement, slots):
+                        bindings_lst.add_bindings(matcher.bindings(slots), [proved])
+            else:
+                # answers are cached per pattern up to variable renaming, as
+                # the matched fact and slot values, see AskCache
+                statement = fact.statement
+                matcher = compile_pattern(statement)
+                key = variant_key(statement)
+                answers = self.cache.get(key)
+                if answers is None:
+                    slots = [None] * len(matcher.names)
+                    answers = [(tuple(slots), fact) for fact in self.facts.bucket(statement)
+                               if matcher.match(fact.statement, slots)]
+                    self.cache.put(key, answers)
+                for slots, fact in answers:
+                    bindings_lst.add_bindings(matcher.bindings(slots), [fact])
 
             return bindings_lst if bindings_lst.list_of_bindings else []
 
@@ -116,70 +433,144 @@ class KnowledgeBase(object):
             print("Invalid ask:", fact.statement)
             return []
 
-    def kb_remove(self, fr):
-        # Helper function for kb_retract, called recursively
-
-        # For rules
-        if isinstance(fr, Rule):
-            # Get actual rule from knowledge base (dunno if this is necessary)
-            rule = self._get_rule(fr)
-            # If NOT supported (list is empty)
-            if not rule.supported_by:
-                # For each fact that the rule supports, check its supported_by list
-                factlist = rule.supports_facts
-                for f in factlist:
-                    for i in f.supported_by:
-                        if rule in i: # If a [fact, rule] pair in the sb list contains the rule, then remove
-                            f.supported_by.remove(i)
-                    # Now recursively call kb_remove on each fact that the rule supports
-                    self.kb_remove(f)
-                rulelist = rule.supports_rules
-                for r in rulelist:
-                    for j in r.supported_by:
-                        if rule in j:
-                            r.supported_by.remove(j)
-                    self.kb_remove(r)
-
-                # Then remove the rule passed in
-                self.rules.remove(rule)
-            # This means the rule is supported
-            else: return None
-
-        # For facts
-        elif isinstance(fr, Fact):
-
-            fact = self._get_fact(fr)
-            if fact == None: return
-
-            if len(fact.supported_by) == 0:
-                # Fact is not supported, remove
-
-                # Dealing with facts that removed fact supports
-                flist = fact.supports_facts
-                for f in flist:
-                    for i in f.supported_by:
-                        if fact in i:
-                            f.supported_by.remove(i)
-                    self.kb_remove(f)
-
-                rlist = fact.supports_rules
-                for r in rlist:
-                    for j in r.supported_by:
-                        if fact in j:
-                            r.supported_by.remove(j)
-                    self.kb_remove(r)
-
-                # Remove fact from KB
-                self.facts.remove(fact)
+    def kb_iter_ask(self, fact, limit=None):
+        """Ask if a fact is in the KB, yielding the answers one at a time, so
+            a caller that only needs the first few stops the search early and
+            no list of every answer is ever built. The KB must not be changed
+            while the iteration is running.
 
-            else:
-                # Fact is supported and asserted: toggle asserted flag
-                if fact.asserted: fact.asserted = False # set equal to false
+        Args:
+            fact (Fact|Statement) - pattern to match facts against
+            limit (int|None) - stop after this many answers
 
-                # If fact is ONLY supported => stays supported, do nothing
-                else: return None
+        Yields:
+            (Bindings, listof Fact) - bindings of each matching fact, with the
+                fact, like the entries of ListOfBindings.list_of_bindings
+        """
+        statement = fact.statement if factq(fact) else fact
+        if limit is not None and limit <= 0:
+            return
+        matcher = compile_pattern(statement)
+        slots = [None] * len(matcher.names)
+        found = 0
+        # ask matched facts, visiting only the indexed candidates
+        for fact in self.facts.bucket(statement):
+            if matcher.match(fact.statement, slots):
+                yield matcher.bindings(slots), [fact]
+                found += 1
+                if found == limit:
+                    return
+
+    def kb_exists(self, fact):
+        """Whether any fact in the KB matches the pattern, without building
+            Bindings
+
+        Args:
+            fact (Fact|Statement) - pattern to match facts against
 
+        Returns:
+            bool
+        """
+        statement = fact.statement if factq(fact) else fact
+        if statement.ground and Fact(statement) in self.facts:
+            return True
+        matcher = compile_pattern(statement)
+        slots = [None] * len(matcher.names)
+        for fact in self.facts.bucket(statement):
+            if matcher.match(fact.statement, slots):
+                return True
+        return False
+
+    def kb_count(self, fact):
+        """Number of facts in the KB matching the pattern, without building
+            Bindings. Read off the fact index when it can be (see
+            FactStore.count), otherwise counted by matching the candidates.
+
+        Args:
+            fact (Fact|Statement) - pattern to match facts against
+
+        Returns:
+            int
+        """
+        statement = fact.statement if factq(fact) else fact
+        count = self.facts.count(statement)
+        if count is not None:
+            return count
+        matcher = compile_pattern(statement)
+        slots = [None] * len(matcher.names)
+        return sum(1 for fact in self.facts.bucket(statement)
+                   if matcher.match(fact.statement, slots))
+
+    def kb_ask_all(self, patterns):
+        """Ask a conjunctive query, e.g. (motherof ?x ?y) and (motherof ?y ?z).
+            The patterns are joined in the order query.plan_query picks from
+            the KB's per-predicate statistics, with hash or index joins, rather
+            than asking each pattern and joining the results.
+
+        Args:
+            patterns (listof Fact|Statement) - the patterns that must all hold
 
+        Returns:
+            listof Bindings|False - list of Bindings (with the fact matching
+                each pattern, in query order) if result found, False otherwise
+        """
+        printv("Asking {!r}", 0, verbose, [patterns])
+        statements = [p.statement if factq(p) else p for p in patterns]
+        if not statements or not all(isinstance(s, Statement) for s in statements):
+            print("Invalid ask:", patterns)
+            return []
+        bindings_lst = ListOfBindings()
+        for values, matched in run_query(self.facts, statements):
+            bindings = Bindings()
+            for name, value in values.items():
+                bindings.add_binding(Variable(name), Term.by_id[value]().term)
+            bindings_lst.add_bindings(bindings, matched)
+        return bindings_lst if bindings_lst.list_of_bindings else []
+
+    @_batch
+    def kb_remove(self, fr):
+        """Helper function for kb_retract: remove a fact or rule that has no
+        support left, then everything that loses its last justification as a
+        result. Runs off an explicit worklist rather than recursing, and each
+        justification dropped is an O(1) removal from the JustificationGraph,
+        so the cost is proportional to the part of the graph being removed;
+        the graph is compacted once tombstones make up most of it. A fact or rule
+        passed in that is still supported is only marked as not asserted.
+
+        Args:
+            fr (Fact|Rule) - fact or rule to remove
+        """
+        store = self.facts if isinstance(fr, Fact) else self.rules
+        fact_rule = store.get(fr)
+        if fact_rule is None:
+            return
+        if fact_rule.supported_by:
+            # Supported and asserted: toggle asserted flag
+            fact_rule.asserted = False
+            return
+
+        worklist = [fact_rule]
+        while worklist:
+            fact_rule = worklist.pop()
+            if isinstance(fact_rule, Fact):
+                self.facts.remove(fact_rule)
+                self.cache.invalidate(fact_rule.statement.key[0])
+                if self._delta is not None:
+                    self._delta.fact_removed(fact_rule)
+                self.ie.fact_removed(fact_rule, self)
+            else:
+                self.rules.remove(fact_rule)
+                self.graph.remove_rule(fact_rule)
+                self.ie.rule_removed(fact_rule, self)
+
+            # Drop the justifications fact_rule takes part in; whatever is left
+            # without support (and was not asserted itself) goes too
+            for dependent in self.justifications.detach(fact_rule):
+                if not dependent.asserted:
+                    worklist.append(dependent)
+        self.justifications.compact()
+
+    @_batch
     def kb_retract(self, fact_or_rule):
         """Retract a fact from the KB
 
@@ -228,6 +619,127 @@ class KnowledgeBase(object):
 
 
 class InferenceEngine(object):
+    """Forward-chaining engine that curries multi-premise rules: matching the
+        first LHS statement of a rule against a fact yields either a new fact or
+        a new rule holding the rest of the LHS. The KnowledgeBase notifies its
+        engine through the *_added/*_removed hooks; other engines (see
+        rete.ReteEngine) implement the same hooks.
+    """
+    def attach(self, kb):
+        """Called once by the KnowledgeBase constructor
+
+        Args:
+            kb (KnowledgeBase) - the KnowledgeBase using this engine
+        """
+        pass
+
+    def fact_added(self, fact, kb):
+        """Forward chain from a fact that was just added to the KB
+
+        Args:
+            fact (Fact) - the new Fact, as stored in the KB
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        for rule in kb.rules.candidates(fact.statement):
+            self.fc_infer(fact, rule, kb)
+
+    def rule_added(self, rule, kb):
+        """Forward chain from a rule that was just added to the KB
+
+        Args:
+            rule (Rule) - the new Rule, as stored in the KB
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        for fact in kb.facts.candidates(rule.lhs[0]):
+            self.fc_infer(fact, rule, kb)
+
+    def saturate(self, kb, facts, rules):
+        """Forward chain from facts and rules that were stored in the KB
+        without inference (see KnowledgeBase.kb_assert_many) using semi-naive
+        evaluation: each round only fires the pairs involving something new
+        (new facts against the older rules, and every fact against the new
+        rules), so each (fact, rule) pair fires exactly once, as it would have
+        with one kb_assert per item. What a round derives becomes the next
+        round's delta.
+
+        Rounds run one stratum of kb.graph at a time (see
+        strata.DependencyGraph), in an order where the facts a stratum's rules
+        use are complete before it starts. Only the stratum's rules fire, and
+        only the new facts of their LHS predicates; a stratum that is not
+        recursive takes one round per LHS statement of its longest rule,
+        since what it derives cannot feed it again.
+
+        Args:
+            kb (KnowledgeBase) - A KnowledgeBase, with facts and rules stored
+            facts (listof Fact) - facts stored since the KB was last saturated
+            rules (listof Rule) - rules stored since the KB was last saturated
+        """
+        new_facts, new_rules = {}, {}
+        for fact in facts:
+            new_facts.setdefault(fact.statement.predicate, []).append(fact)
+        for rule in rules:
+            new_rules.setdefault(rule.rhs.predicate, []).append(rule)
+        for stratum in kb.graph.strata():
+            facts = [fact for predicate in stratum.inputs for fact in new_facts.get(predicate, ())]
+            rules = [rule for predicate in stratum.predicates for rule in new_rules.pop(predicate, ())]
+            while facts or rules:
+                self.fire(self.round_pairs(kb, facts, rules, stratum.predicates), kb)
+                facts, rules = [], []
+                while kb.agenda:
+                    fact_rule = kb.agenda.pop()
+                    if not kb._insert(fact_rule):
+                        continue
+                    if isinstance(fact_rule, Rule):
+                        rules.append(fact_rule)
+                        continue
+                    new_facts.setdefault(fact_rule.statement.predicate, []).append(fact_rule)
+                    if fact_rule.statement.predicate in stratum.inputs:
+                        facts.append(fact_rule)
+
+    def round_pairs(self, kb, facts, rules, heads=None):
+        """The (fact, rule) pairs one semi-naive round fires, in order: each
+            new fact with the older rules it can trigger, then each new rule
+            with the facts it can match
+
+        Args:
+            kb (KnowledgeBase) - A KnowledgeBase
+            facts (listof Fact) - the round's new facts
+            rules (listof Rule) - the round's new rules
+            heads (set of str|None) - only fire older rules concluding one of
+                these predicates, all rules when None
+
+        Returns:
+            iterator of tuple: (fact, rule) pairs
+        """
+        delta_rules = set(rules)
+        for fact in facts:
+            for rule in kb.rules.candidates(fact.statement):
+                if rule not in delta_rules and (heads is None or rule.rhs.predicate in heads):
+                    yield fact, rule
+        for rule in rules:
+            for fact in kb.facts.candidates(rule.lhs[0]):
+                yield fact, rule
+
+    def fire(self, pairs, kb):
+        """Forward chain from (fact, rule) pairs, see fc_infer
+
+        Args:
+            pairs (iterable of tuple) - (fact, rule) pairs
+            kb (KnowledgeBase) - A KnowledgeBase
+        """
+        for fact, rule in pairs:
+            self.fc_infer(fact, rule, kb)
+
+    def fact_removed(self, fact, kb):
+        """Called after a fact has been removed from the KB
+        """
+        pass
+
+    def rule_removed(self, rule, kb):
+        """Called after a rule has been removed from the KB
+        """
+        pass
+
     def fc_infer(self, fact, rule, kb):
         """Forward-chaining to infer new facts and rules
 
@@ -239,45 +751,46 @@ class InferenceEngine(object):
         Returns:
             Nothing            
         """
-        printv('Attempting to infer from {!r} and {!r} => {!r}', 1, verbose,
-            [fact.statement, rule.lhs, rule.rhs])
+        # fc_infer runs once per (fact, rule) pair, so skip building the
+        # printv arguments unless they will be printed
+        if verbose > 1:
+            printv('Attempting to infer from {!r} and {!r} => {!r}', 1, verbose,
+                [fact.statement, rule.lhs, rule.rhs])
+        if rule.rhs.predicate in kb.lazy:
+            return
+        stats = kb.stats
+        if stats is not None:
+            start = time.perf_counter()
         ####################################################
         # Student code goes here
 
-        possible_bindings = match(rule.lhs[0], fact.statement)
+        # Same as match(rule.lhs[0], fact.statement) followed by instantiate,
+        # but through the compiled matcher of rule.lhs[0]
+        matcher = compile_pattern(rule.lhs[0])
+        possible_bindings = [None] * len(matcher.names)
         sb = [fact, rule]
-        if not possible_bindings: return
+        if not matcher.match(fact.statement, possible_bindings):
+            if stats is not None:
+                stats.tested(False)
+                stats.fired(rule, False, time.perf_counter() - start)
+            return
         else:
-            # lhs_first = instantiate(rule.lhs[0], possible_bindings)
+            # The KB records the new fact/rule in the supports lists of the
+            # supporting pair when it adds (or merges) it
             if len(rule.lhs) == 1:
-                new_rhs = instantiate(rule.rhs, possible_bindings)
-                new_fact = Fact(new_rhs)
-                new_fact.supported_by.append(sb) # Modify supported_by field of new fact
-                if new_fact not in kb.facts: # Add in this fact if it is not already in knowledge base
-                    kb.kb_assert(new_fact)
-
-                fact.supports_facts.append(new_fact)
-                rule.supports_facts.append(new_fact)
+                new_rhs = matcher.substitute(rule.rhs, possible_bindings)
+                kb.kb_assert(Fact(new_rhs, [sb]))
 
             elif len(rule.lhs) > 1:
                 rest_rule = rule.lhs[1:]
                 new_lhs = []
                 for r in rest_rule:
-                    s_lhs = instantiate(r, possible_bindings)
+                    s_lhs = matcher.substitute(r, possible_bindings)
                     new_lhs.append(s_lhs)
-                new_rhs = instantiate(rule.rhs, possible_bindings)
+                new_rhs = matcher.substitute(rule.rhs, possible_bindings)
                 new_statement = [new_lhs, new_rhs]
 
-                new_rule = Rule(new_statement)
-                kb.kb_assert(new_rule)
-                new_rule.supported_by.append(sb)
-
-                fact.supports_rules.append(new_rule)
-                rule.supports_rules.append(new_rule)
-
-
-
-
-
-
-
+                kb.kb_assert(Rule(new_statement, [sb]))
+            if stats is not None:
+                stats.tested(True)
+                stats.fired(rule, True, time.perf_counter() - start)
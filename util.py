@@ -37,7 +37,8 @@ def match(state1, state2, bindings=None):
     return match_recursive(state1.terms, state2.terms, bindings)
 
 def match_recursive(terms1, terms2, bindings):  # recursive...
-    """Recursive helper for match
+    """Helper for match, walking both term lists in step (iteratively, without
+        slicing them, despite the name)
 
     Args:
         terms1 (listof Term): terms to match with terms2
@@ -47,17 +48,155 @@ def match_recursive(terms1, terms2, bindings):  # recursive...
     Returns:
         Bindings|False: either associated bindings or no match found
     """
-    if len(terms1) == 0:
-        return bindings
-    if is_var(terms1[0]):
-        if not bindings.test_and_bind(terms1[0], terms2[0]):
+    for term1, term2 in zip(terms1, terms2):
+        if term1 is term2:
+            if is_var(term1) and not bindings.test_and_bind(term1, term2):
+                return False
+        elif is_var(term1):
+            if not bindings.test_and_bind(term1, term2):
+                return False
+        elif is_var(term2):
+            if not bindings.test_and_bind(term2, term1):
+                return False
+        else:
             return False
-    elif is_var(terms2[0]):
-        if not bindings.test_and_bind(terms2[0], terms1[0]):
+    return bindings
+
+class Matcher(object):
+    """Compiled form of a pattern statement (e.g. a rule's LHS statement or an
+        ask query) for matching against ground statements. Compiling works out
+        once which positions must hold which constant, which positions bind
+        which variable slot and which positions must repeat an earlier slot;
+        matching then just compares interned ids (see Statement.key) and
+        writes them into a flat slot list, without allocating per term.
+
+        Get one with compile_pattern(statement), which caches it on the statement.
+
+    Attributes:
+        pattern (Statement): the compiled statement
+        checks (tupleof tuple): (position, id) pairs of constant positions
+        binds (tupleof tuple): (position, slot) pairs of first variable occurrences
+        repeats (tupleof tuple): (position, slot) pairs of repeated variables
+        names (listof str): variable name of each slot
+        slot_of (dictof int): maps variable ids to their slot
+    """
+    __slots__ = ('pattern', 'length', 'head', 'checks', 'binds', 'repeats', 'names', 'slot_of')
+
+    def __init__(self, pattern):
+        """Constructor for Matcher
+
+        Args:
+            pattern (Statement): statement to compile
+        """
+        super(Matcher, self).__init__()
+        key = pattern.key
+        self.pattern = pattern
+        self.length = len(key)
+        self.head = key[0]
+        checks, binds, repeats = [], [], []
+        self.slot_of = {}
+        for position in range(1, len(key)):
+            symbol = key[position]
+            if symbol > 0:
+                checks.append((position, symbol))
+            elif symbol in self.slot_of:
+                repeats.append((position, self.slot_of[symbol]))
+            else:
+                self.slot_of[symbol] = len(self.slot_of)
+                binds.append((position, self.slot_of[symbol]))
+        self.checks = tuple(checks)
+        self.binds = tuple(binds)
+        self.repeats = tuple(repeats)
+        self.names = [lc.symbol_names[-symbol] for symbol in self.slot_of]
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Matcher({!r})'.format(self.pattern)
+
+    def match(self, statement, slots):
+        """Match the pattern against a statement, filling slots with the ids
+            bound to each variable. A statement with variables of its own falls
+            back to the general match (bindings of its variables are dropped).
+
+        Args:
+            statement (Statement): statement to match, normally ground
+            slots (list): list with at least len(self.names) entries to fill
+
+        Returns:
+            bool: whether the statement matches
+        """
+        key = statement.key
+        if len(key) != self.length or key[0] != self.head:
             return False
-    elif terms1[0] != terms2[0]:
-        return False
-    return match_recursive(terms1[1:], terms2[1:], bindings)
+        if not statement.ground:
+            bindings = match(self.pattern, statement)
+            if not bindings:
+                return False
+            for slot, name in enumerate(self.names):
+                slots[slot] = lc.intern_symbol(bindings.bindings_dict[name])
+            return True
+        for position, symbol in self.checks:
+            if key[position] != symbol:
+                return False
+        for position, slot in self.binds:
+            slots[slot] = key[position]
+        for position, slot in self.repeats:
+            if key[position] != slots[slot]:
+                return False
+        return True
+
+    def bindings(self, slots):
+        """Build the Bindings for filled slots
+
+        Args:
+            slots (list): slots filled by a successful match
+
+        Returns:
+            Bindings
+        """
+        bindings = lc.Bindings()
+        for slot, name in enumerate(self.names):
+            bindings.add_binding(lc.Variable(name), lc.Term.by_id[slots[slot]]().term)
+        return bindings
+
+    def as_dict(self, slots):
+        """Map each variable name to the name bound to it in filled slots
+        """
+        return {name: lc.symbol_names[abs(slots[slot])] for slot, name in enumerate(self.names)}
+
+    def substitute(self, statement, slots):
+        """Generate Statement from given statement with this pattern's
+            variables replaced by the values in filled slots, like instantiate
+
+        Args:
+            statement (Statement): statement to generate new statement from
+            slots (list): slots filled by a successful match
+
+        Returns:
+            Statement
+        """
+        slot_of = self.slot_of
+        by_id = lc.Term.by_id
+        terms = [statement.predicate]
+        for term in statement.terms:
+            slot = slot_of.get(term.term.id)
+            terms.append(term if slot is None else by_id[slots[slot]]())
+        return lc.Statement(terms)
+
+def compile_pattern(statement):
+    """Get the compiled Matcher for a statement, compiling it on first use
+
+    Args:
+        statement (Statement): pattern statement
+
+    Returns:
+        Matcher
+    """
+    matcher = statement._matcher
+    if matcher is None:
+        matcher = statement._matcher = Matcher(statement)
+    return matcher
 
 def instantiate(statement, bindings):
     """Generate Statement from given statement and bindings. Constructed statement
@@ -77,6 +216,35 @@ def instantiate(statement, bindings):
     new_terms = [handle_term(t) for t in statement.terms]
     return lc.Statement([statement.predicate] + new_terms)
 
+def substitute(statement, bindings):
+    """Generate Statement from given statement with every variable bound in
+        bindings replaced by its value
+
+    Args:
+        statement (Statement): statement to generate new statement from
+        bindings (dictof str): maps variable names to the values bound to them
+
+    Returns:
+        Statement
+    """
+    return lc.Statement([statement.predicate] +
+                        [bindings.get(t.term.element, t) if is_var(t) else t
+                         for t in statement.terms])
+
+def variant_key(statement):
+    """Key identifying a statement up to renaming of its variables, e.g.
+        (isa ?x ?y) and (isa ?a ?b) share a key but (isa ?x ?x) does not
+
+    Args:
+        statement (Statement): statement, usually with variables
+
+    Returns:
+        tupleof int: statement.key with the n-th distinct variable as -n
+    """
+    renamed = {}
+    return tuple(symbol if symbol > 0 else renamed.setdefault(symbol, -1 - len(renamed))
+                 for symbol in statement.key)
+
 def factq(element):
     """Check if element is a fact
 
@@ -0,0 +1,197 @@
+"""Synthetic knowledge bases for benchmarking, see bench.py. Each generator
+returns a Workload: the facts and rules to assert, a few asks typical of
+the scenario and some asserted facts to retract.
+"""
+import random
+
+from logical_classes import Fact
+import read
+
+
+class Workload(object):
+    """A synthetic knowledge base
+
+    Attributes:
+        name (str): short name, used as the key of bench.py results
+        items (listof Fact|Rule): facts and rules to assert, in order
+        asks (listof Fact): patterns to ask once the KB is saturated
+        retracts (listof Fact): asserted facts to retract, in order
+        writes (listof Fact): facts to assert while the KB answers asks
+    """
+    def __init__(self, name, items, asks, retracts, writes=()):
+        """Constructor for Workload
+        """
+        super(Workload, self).__init__()
+        self.name = name
+        self.items = items
+        self.asks = asks
+        self.retracts = retracts
+        self.writes = list(writes)
+
+    def __repr__(self):
+        """Define internal string representation
+        """
+        return 'Workload({!r}, {} items, {} asks, {} retracts)'.format(
+            self.name, len(self.items), len(self.asks), len(self.retracts))
+
+
+def genealogy_items(people, seed=1):
+    """Facts and rules of a random family tree: each person has a random
+        earlier person as mother, and the rules derive parents, grandparents
+        and great-grandparents.
+
+    Args:
+        people (int): number of people
+        seed (int): random seed
+
+    Returns:
+        listof Fact|Rule
+    """
+    rng = random.Random(seed)
+    items = [read.parse_input("rule: ((motherof ?x ?y)) -> (parentof ?x ?y)"),
+             read.parse_input("rule: ((parentof ?x ?y) (parentof ?y ?z)) -> (grandparentof ?x ?z)"),
+             read.parse_input("rule: ((grandparentof ?x ?y) (parentof ?y ?z)) -> (ggp ?x ?z)")]
+    for i in range(1, people):
+        items.append(Fact(['motherof', 'p%d' % rng.randrange(i), 'p%d' % i]))
+    return items
+
+
+def genealogy(people=2000, asks=200, retracts=20, seed=1):
+    """A wide family tree like statements_kb4.txt, see genealogy_items
+
+    Args:
+        people (int): number of people
+        asks (int): number of asks, half for grandchildren and half for parents
+        retracts (int): number of motherof facts to retract
+        seed (int): random seed
+
+    Returns:
+        Workload
+    """
+    rng = random.Random(seed)
+    items = genealogy_items(people, seed)
+    patterns = [Fact(['grandparentof', 'p%d' % rng.randrange(people), '?y']) if i % 2 else
+                Fact(['parentof', '?x', 'p%d' % rng.randrange(1, people)]) for i in range(asks)]
+    facts = [item for item in items if isinstance(item, Fact)]
+    return Workload('genealogy', items, patterns,
+                    [Fact(fact.statement) for fact in rng.sample(facts, min(retracts, len(facts)))])
+
+
+def taxonomy(depth=6, branching=3, instances=2, asks=200, retracts=20, seed=1):
+    """A deep isa taxonomy: a tree of classes (isa child parent) with
+        instances (inst x class) of its leaf classes, and the rules of
+        statements_kb2.txt making isa transitive and inst inherited upwards
+
+    Args:
+        depth (int): levels of classes below the root
+        branching (int): subclasses per class
+        instances (int): instances per leaf class
+        asks (int): number of asks, half for the classes of an instance and
+            half for the superclasses of a class
+        retracts (int): number of isa facts to retract
+        seed (int): random seed
+
+    Returns:
+        Workload
+    """
+    rng = random.Random(seed)
+    items = [read.parse_input("rule: ((inst ?x ?y) (isa ?y ?z)) -> (inst ?x ?z)"),
+             read.parse_input("rule: ((isa ?x ?y) (isa ?y ?z)) -> (isa ?x ?z)")]
+    level, classes, edges = ['c'], ['c'], []
+    for _ in range(depth):
+        children = []
+        for parent in level:
+            for b in range(branching):
+                child = '%s_%d' % (parent, b)
+                edges.append(Fact(['isa', child, parent]))
+                children.append(child)
+        level = children
+        classes.extend(children)
+    items.extend(edges)
+    objects = []
+    for leaf in level:
+        for i in range(instances):
+            objects.append('o%d' % len(objects))
+            items.append(Fact(['inst', objects[-1], leaf]))
+    patterns = [Fact(['inst', rng.choice(objects), '?c']) if i % 2 else
+                Fact(['isa', rng.choice(classes), '?y']) for i in range(asks)]
+    return Workload('taxonomy', items, patterns,
+                    [Fact(fact.statement) for fact in rng.sample(edges, min(retracts, len(edges)))])
+
+
+def dragons(copies=40, asks=200, retracts=20, seed=1):
+    """Copies of the dragon scenario of statements_kb2.txt, where long
+        chains of rules (hero -> wielding, possesses + needs -> gives -> magic
+        -> strong -> defeatable -> dead -> safe) meet. Every hero can defeat
+        every dragon, so the derived facts grow with copies squared.
+
+    Args:
+        copies (int): number of heroes, dragons, sorceresses and villages
+        asks (int): number of asks spread over the derived predicates
+        retracts (int): number of hero facts to retract
+        seed (int): random seed
+
+    Returns:
+        Workload
+    """
+    rng = random.Random(seed)
+    items = [read.parse_input(text) for text in (
+        "fact: (isa Sorceress Wizard)",
+        "rule: ((inst ?x ?y) (isa ?y ?z)) -> (inst ?x ?z)",
+        "rule: ((isa ?x ?y) (isa ?y ?z)) -> (isa ?x ?z)",
+        "rule: ((attacked ?a ?d) (defeatable ?d)) -> (dead ?d)",
+        "rule: ((wielding ?a ?s) (strong ?a) (inst ?d Dragon)) -> (defeatable ?d)",
+        "rule: ((magicCastUpon ?a)) -> (strong ?a)",
+        "rule: ((inst ?w Wizard) (gives ?a ?w ?d) (diamonds ?d)) -> (magicCastUpon ?a)",
+        "rule: ((hero ?a)) -> (wielding ?a Weapon)",
+        "rule: ((possesses ?a ?it) (needs ?p ?it)) -> (gives ?a ?p ?it)")]
+    heroes = []
+    for i in range(copies):
+        hero, dragon, sorceress, loot = 'Ai%d' % i, 'Nosliw%d' % i, 'Sarorah%d' % i, 'Loot%d' % i
+        heroes.append(Fact(['hero', hero]))
+        items.extend([Fact(['attacked', hero, dragon]), Fact(['diamonds', loot]),
+                      Fact(['possesses', hero, loot]), Fact(['needs', sorceress, loot]),
+                      heroes[-1], Fact(['inst', sorceress, 'Sorceress']),
+                      Fact(['inst', dragon, 'Dragon']),
+                      read.parse_input("rule: ((dead %s)) -> (safe HappyDale%d)" % (dragon, i))])
+    predicates = [['safe', '?x'], ['dead', '?d'], ['defeatable', '?d'], ['strong', '?a'],
+                  ['gives', '?a', '?p', '?it'], ['inst', '?x', 'Wizard']]
+    patterns = []
+    for i in range(asks):
+        pattern = list(predicates[i % len(predicates)])
+        pattern[1] = '%s%d' % ({'safe': 'HappyDale', 'dead': 'Nosliw', 'defeatable': 'Nosliw',
+                                'strong': 'Ai', 'gives': 'Ai', 'inst': 'Sarorah'}[pattern[0]],
+                               rng.randrange(copies))
+        patterns.append(Fact(pattern))
+    return Workload('dragons', items, patterns,
+                    [Fact(fact.statement) for fact in rng.sample(heroes, min(retracts, len(heroes)))])
+
+
+def write_burst(people=20000, writes=5000, asks=200, seed=1):
+    """A family tree (see genealogy_items) whose first people are loaded
+        up front, and the mothers of the next ones asserted as a burst of
+        writes while asks about the loaded part are answered, as in a server
+        (see bench.py server_writes)
+
+    Args:
+        people (int): number of people, loaded and written
+        writes (int): number of motherof facts in the burst
+        asks (int): number of grandchildren asks
+        seed (int): random seed
+
+    Returns:
+        Workload: with the burst in writes
+    """
+    rng = random.Random(seed)
+    items = genealogy_items(people, seed)
+    loaded = len(items) - writes
+    patterns = [Fact(['grandparentof', 'p%d' % rng.randrange(people - writes), '?y'])
+                for _ in range(asks)]
+    return Workload('write_burst', items[:loaded], patterns, [], items[loaded:])
+
+
+WORKLOADS = {
+    'dragons': dragons,
+    'genealogy': genealogy,
+    'taxonomy': taxonomy,
+}